@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Под ASGI отчеты работают асинхронно (см. inventory.async_views)
+os.environ.setdefault('ASYNC_REPORT_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,149 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+logger = logging.getLogger(__name__)
+
+# Реплика, с которой читает текущий HTTP запрос (None - основная БД). Выставляет
+# config.middleware.ReplicaRoutingMiddleware, контекст переходит и в потоки sync_to_async
+_read_replica = ContextVar('read_replica', default=None)
+
+# Задержка реплики: на PostgreSQL - время с последней примененной транзакции, если реплика
+# не догнала полученный WAL; на основной БД и без репликации функции возвращают NULL
+POSTGRES_LAG_SQL = (
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+def replica_lag(alias):
+    """ Задержка реплики в секундах. Для БД без репликации (SQLite) - только проверка соединения """
+
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0] or 0)
+        cursor.execute('SELECT 1')
+        return 0.0
+
+
+class ReplicaHealth:
+    """
+    Состояние реплик в процессе: задержка проверяется не чаще DATABASE_REPLICA_CHECK_INTERVAL,
+    реплика с ошибкой или задержкой больше DATABASE_REPLICA_MAX_LAG не используется до следующей проверки.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+
+    def is_available(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            available, checked_at = self.states.get(alias, (False, None))
+            if checked_at is not None and now - checked_at < settings.DATABASE_REPLICA_CHECK_INTERVAL:
+                return available
+            # Проверяет один поток, остальные до ее конца пользуются прежним состоянием
+            self.states[alias] = (available, now)
+
+        try:
+            lag = replica_lag(alias)
+        except Exception as e:
+            logger.warning('Read replica %s is unavailable: %s', alias, e)
+            available = False
+        else:
+            available = lag <= settings.DATABASE_REPLICA_MAX_LAG
+            if not available:
+                logger.warning('Read replica %s lags behind by %.1f s', alias, lag)
+        with self.lock:
+            self.states[alias] = (available, time.monotonic())
+        return available
+
+    def mark_failed(self, alias):
+        with self.lock:
+            self.states[alias] = (False, time.monotonic())
+
+    def snapshot(self):
+        with self.lock:
+            return {alias: available for alias, (available, _) in self.states.items()}
+
+
+health = ReplicaHealth()
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """ После записи чтения пользователя идут в основную БД, пока реплики не догонят ее """
+
+    if user_id is not None and settings.DATABASE_REPLICA_PIN_SECONDS > 0:
+        cache.set(_pin_key(user_id), 1, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+
+def choose_replica(user_id):
+    """ Случайная доступная реплика для чтения или None, если читать нужно из основной БД """
+
+    if is_pinned(user_id):
+        return None
+    aliases = replica_aliases()
+    random.shuffle(aliases)
+    for alias in aliases:
+        if health.is_available(alias):
+            return alias
+    return None
+
+
+def current_replica():
+    return _read_replica.get()
+
+
+def use_replica(alias):
+    """ Выставляет реплику для чтения в текущем контексте, возвращает токен для reset_replica """
+
+    return _read_replica.set(alias)
+
+
+def reset_replica(token):
+    _read_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтение из реплики, выбранной для текущего запроса, запись - всегда в основную БД.
+    Внутри транзакции основной БД чтение тоже идет в нее: транзакция должна видеть свои изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с основной БД через репликацию
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,294 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.views import APIView
+
+from inventory.caching import response_cache_stats
+from my_user.cache import auth_cache_stats
+from my_user.permissions import IsAdminCustom
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency', LATENCY_BUCKETS),
+    'http_request_db_duration_seconds': ('Database time per request', LATENCY_BUCKETS),
+    'http_response_size_bytes': ('Response body size (streaming responses are not counted)', SIZE_BUCKETS),
+}
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+SNAPSHOT_PATTERN = 'metrics-*.json'
+# Сумма счетчиков завершившихся процессов
+RETIRED_SNAPSHOT = 'retired.json'
+
+
+def process_start_time(pid):
+    """
+    Время запуска процесса в тиках с загрузки системы (Linux, /proc). Вместе с pid однозначно
+    определяет процесс: pid может достаться новому процессу. None - процесса нет или нет /proc.
+    """
+
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            stat = file.read()
+    except OSError:
+        return None
+    # Имя процесса в скобках может содержать пробелы, starttime - 22-е поле
+    return int(stat.rsplit(')', 1)[1].split()[19])
+
+
+def is_alive(pid, started):
+    if os.path.exists('/proc/self/stat'):
+        return process_start_time(pid) == started
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """
+    Метрики текущего процесса: количество запросов по представлению, методу и статусу
+    и гистограммы (количество в каждом интервале, сумма, общее количество).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.flushed_at = time.monotonic()
+        self.pid = None
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self.histograms[name].get(labels)
+        if series is None:
+            series = self.histograms[name][labels] = [[0] * (len(buckets) + 1), 0.0, 0]
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def observe_request(self, view, method, status, duration, db_duration, size=None):
+        labels = (view, method if method in METHODS else 'other')
+        with self.lock:
+            self.requests[(*labels, str(status))] += 1
+            self.observe('http_request_duration_seconds', labels, duration)
+            self.observe('http_request_db_duration_seconds', labels, db_duration)
+            if size is not None:
+                self.observe('http_response_size_bytes', labels, size)
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': [[*labels, count] for labels, count in self.requests.items()],
+                'histograms': {
+                    name: [[*labels, list(counts), total, count] for labels, (counts, total, count) in series.items()]
+                    for name, series in self.histograms.items()
+                },
+                'auth_cache': auth_cache_stats(),
+                'response_cache': response_cache_stats(),
+            }
+
+    def snapshot_path(self):
+        # После fork у дочернего процесса свой pid и время запуска
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.started = process_start_time(self.pid) or int(time.time() * 1000)
+        return os.path.join(settings.METRICS_DIR, f'metrics-{self.pid}-{self.started}.json')
+
+    def flush(self):
+        """ Снимок метрик процесса в METRICS_DIR (атомарно, через временный файл) """
+
+        if not settings.METRICS_DIR:
+            return
+        with self.flush_lock:
+            self.flushed_at = time.monotonic()
+            path = self.snapshot_path()
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(f'{path}.tmp', path)
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, snapshot):
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(f'{path}.tmp', path)
+
+
+def collect():
+    """
+    Снимки живых процессов из METRICS_DIR (снимок текущего процесса берется из памяти)
+    и сумма счетчиков завершившихся процессов. Снимки завершившихся процессов переносятся
+    в эту сумму и удаляются, чтобы счетчики не уменьшались, а показатели (размер кэша,
+    количество процессов) учитывали только живые процессы.
+    """
+
+    snapshots = [registry.snapshot()]
+    if not settings.METRICS_DIR:
+        return snapshots
+
+    own = registry.snapshot_path()
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    # Перенос в сумму выполняет один процесс за раз, иначе счетчики учлись бы дважды
+    with open(os.path.join(settings.METRICS_DIR, 'metrics.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = os.path.join(settings.METRICS_DIR, RETIRED_SNAPSHOT)
+        retired = _read_snapshot(retired_path)
+        dead = []
+        for path in sorted(glob.glob(os.path.join(settings.METRICS_DIR, SNAPSHOT_PATTERN))):
+            if path == own:
+                continue
+            snapshot = _read_snapshot(path)
+            match = re.fullmatch(r'metrics-(\d+)-(\d+)\.json', os.path.basename(path))
+            if match is not None and is_alive(int(match.group(1)), int(match.group(2))):
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+                continue
+            dead.append(path)
+            if snapshot is not None:
+                retired = retire([retired, snapshot] if retired else [snapshot])
+
+        if dead:
+            _write_snapshot(retired_path, retired)
+            for path in dead:
+                os.remove(path)
+    if retired:
+        snapshots.append(retired)
+    return snapshots
+
+
+def retire(snapshots):
+    """ Сумма счетчиков снимков в формате снимка, без показателей (размер кэша) """
+
+    requests, histograms, counters = merge(snapshots)
+    auth_cache = defaultdict(dict)
+    for key, value in counters.items():
+        if key[0] == 'auth_cache':
+            _, cache, name = key
+            auth_cache[cache][name] = 0 if name == 'size' else value
+    return {
+        'retired': True,
+        'requests': [[*labels, count] for labels, count in requests.items()],
+        'histograms': {
+            name: [[*labels, counts, total, count] for labels, (counts, total, count) in series.items()]
+            for name, series in histograms.items()
+        },
+        'auth_cache': auth_cache,
+        'response_cache': {key: counters[('response_cache', key)] for key in ('hit', 'miss', 'not_modified')},
+    }
+
+
+def merge(snapshots):
+    requests = defaultdict(int)
+    histograms = {name: {} for name in HISTOGRAMS}
+    counters = defaultdict(int)
+    for snapshot in snapshots:
+        for *labels, count in snapshot['requests']:
+            requests[tuple(labels)] += count
+        for name, series in snapshot['histograms'].items():
+            for view, method, counts, total, count in series:
+                merged = histograms[name].setdefault((view, method), [[0] * len(counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        for cache, stats in snapshot['auth_cache'].items():
+            for key, value in stats.items():
+                counters[('auth_cache', cache, key)] += value
+        for key in ('hit', 'miss', 'not_modified'):
+            counters[('response_cache', key)] += snapshot['response_cache'][key]
+    return requests, histograms, counters
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def render(snapshots):
+    """ Метрики в текстовом формате Prometheus (0.0.4) """
+
+    requests, histograms, counters = merge(snapshots)
+    lines = [
+        '# HELP http_requests_total Requests by view, method and status',
+        '# TYPE http_requests_total counter',
+    ]
+    for (view, method, status), count in sorted(requests.items()):
+        lines.append(f'http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (view, method), (counts, total, count) in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(view=view, method=method, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(view=view, method=method)} {total}')
+            lines.append(f'{name}_count{_labels(view=view, method=method)} {count}')
+
+    lines += [
+        '# HELP auth_cache_requests_total JWT authentication cache lookups',
+        '# TYPE auth_cache_requests_total counter',
+    ]
+    for cache in ('tokens', 'users'):
+        for result, key in (('hit', 'hits'), ('miss', 'misses')):
+            value = counters[('auth_cache', cache, key)]
+            lines.append(f'auth_cache_requests_total{_labels(cache=cache, result=result)} {value}')
+    lines += ['# HELP auth_cache_entries JWT authentication cache size', '# TYPE auth_cache_entries gauge']
+    for cache in ('tokens', 'users'):
+        lines.append(f'auth_cache_entries{_labels(cache=cache)} {counters[("auth_cache", cache, "size")]}')
+
+    lines += [
+        '# HELP response_cache_requests_total Cached list and report responses by result',
+        '# TYPE response_cache_requests_total counter',
+    ]
+    for result in ('hit', 'miss', 'not_modified'):
+        lines.append(f'response_cache_requests_total{_labels(result=result)} {counters[("response_cache", result)]}')
+
+    lines += [
+        '# HELP metrics_processes Running processes with a metrics snapshot',
+        '# TYPE metrics_processes gauge',
+        f'metrics_processes {sum(1 for snapshot in snapshots if not snapshot.get("retired"))}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsView(APIView):
+    """ Метрики всех процессов в формате Prometheus, только для администраторов """
+
+    permission_classes = (IsAdminCustom,)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
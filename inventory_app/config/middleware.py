@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import InterfaceError, OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+
+from my_user.cache import is_process_local_cache
+from my_user.utils import token_user_id
+from . import db_router, metrics
+
+
+logger = logging.getLogger(__name__)
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_placeholder_lists = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_spaces = re.compile(r'\s+')
+
+
+def sql_fingerprint(sql):
+    """ Шаблон запроса: литералы и списки параметров IN (...) заменены, пробелы схлопнуты """
+
+    sql = _literals.sub('?', sql)
+    sql = _placeholder_lists.sub('(...)', sql)
+    return _spaces.sub(' ', sql).strip()
+
+
+# Счетчики запросов к БД текущего HTTP запроса. Контекст переходит и в потоки sync_to_async,
+# поэтому запросы асинхронных представлений учитываются так же, как синхронных
+_query_timers = ContextVar('query_timers', default=())
+
+
+def _execute_hook(execute, sql, params, many, context):
+    timers = _query_timers.get()
+    if not timers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for timer in timers:
+            timer.add(sql, duration)
+
+
+def _install_hook(connection, **kwargs):
+    if _execute_hook not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_hook)
+
+
+def install_query_hook():
+    """ Подключает _execute_hook ко всем соединениям, в том числе будущим и из других потоков """
+
+    connection_created.connect(_install_hook, dispatch_uid='config.middleware.query_hook')
+    for connection in connections.all():
+        _install_hook(connection)
+
+
+@contextmanager
+def collect_queries(timer):
+    token = _query_timers.set((*_query_timers.get(), timer))
+    try:
+        yield timer
+    finally:
+        _query_timers.reset(token)
+
+
+class DBTimer:
+    """ Количество и суммарное время запросов к БД (у одновременных подзапросов время суммируется) """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+
+    def add(self, sql, duration):
+        with self.lock:
+            self.count += 1
+            self.duration += duration
+            self.record(sql, duration)
+
+    def record(self, sql, duration):
+        pass
+
+
+class RequestQueries(DBTimer):
+    """ Запросы одного HTTP запроса с разбивкой по шаблонам """
+
+    def __init__(self):
+        super().__init__()
+        self.fingerprints = defaultdict(lambda: [0, 0.0])
+
+    def record(self, sql, duration):
+        stats = self.fingerprints[sql_fingerprint(sql)]
+        stats[0] += 1
+        stats[1] += duration
+
+    def repeated(self, threshold=2):
+        """ Шаблоны, выполненные не меньше threshold раз, от самых частых """
+
+        return sorted(
+            (
+                {'sql': sql, 'count': count, 'time_ms': round(duration * 1000, 3)}
+                for sql, (count, duration) in self.fingerprints.items() if count >= threshold
+            ),
+            key=lambda item: (-item['count'], item['sql'])
+        )
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+class TimedMiddleware:
+    """
+    Основа middleware, которым нужны запросы к БД текущего HTTP запроса.
+    Работает и в синхронной, и в асинхронной цепочке (ASGI) без переключения потоков.
+    Без настройки enabled_setting удаляется из цепочки (MiddlewareNotUsed).
+    """
+
+    sync_capable = True
+    async_capable = True
+    enabled_setting = None
+
+    def __init__(self, get_response):
+        if not getattr(settings, self.enabled_setting):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Так Django определяет, что middleware нужно вызывать через await
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        install_query_hook()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with collect_queries(self.get_timer()) as timer:
+            response = self.get_response(request)
+        return self.process(request, response, timer, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with collect_queries(self.get_timer()) as timer:
+            response = await self.get_response(request)
+        return self.process(request, response, timer, time.perf_counter() - started)
+
+    def get_timer(self):
+        return DBTimer()
+
+    def process(self, request, response, timer, elapsed):
+        return response
+
+
+class MetricsMiddleware(TimedMiddleware):
+    """
+    Метрики запросов (см. config.metrics): количество по статусам, гистограммы времени ответа,
+    времени БД и размера ответа по представлению и методу. Отключается METRICS_ENABLED=0.
+    """
+
+    enabled_setting = 'METRICS_ENABLED'
+
+    def process(self, request, response, timer, elapsed):
+        metrics.registry.observe_request(
+            get_view_name(request) or 'unmatched',
+            request.method,
+            response.status_code,
+            elapsed,
+            timer.duration,
+            None if response.streaming else len(response.content),
+        )
+        return response
+
+
+class SQLInstrumentationMiddleware(TimedMiddleware):
+    """
+    Количество запросов к БД, их суммарное время и повторяющиеся шаблоны для каждого запроса.
+
+    Включается настройкой SQL_INSTRUMENTATION, без нее middleware удаляется из цепочки
+    (MiddlewareNotUsed) и ничего не стоит. Итоги пишутся в заголовки X-SQL-* и Server-Timing
+    и в лог одной JSON строкой. SELECT, повторенный SQL_N_PLUS_ONE_THRESHOLD и более раз,
+    считается N+1 и пишется в лог предупреждением с именем представления и шаблоном запроса.
+    Запросы потоковых ответов, выполняемые после возврата из view, не учитываются.
+    """
+
+    enabled_setting = 'SQL_INSTRUMENTATION'
+
+    def get_timer(self):
+        return RequestQueries()
+
+    def process(self, request, response, queries, elapsed):
+        view = get_view_name(request)
+        duplicates = queries.repeated()
+        n_plus_one = [
+            item for item in duplicates
+            if item['count'] >= settings.SQL_N_PLUS_ONE_THRESHOLD and item['sql'].upper().startswith('SELECT')
+        ]
+
+        response['X-SQL-Queries'] = str(queries.count)
+        response['X-SQL-Time-ms'] = f'{queries.duration * 1000:.3f}'
+        response['X-SQL-Duplicates'] = str(sum(item['count'] - 1 for item in duplicates))
+        if n_plus_one:
+            response['X-SQL-N-Plus-One'] = str(len(n_plus_one))
+        timing = f'db;dur={queries.duration * 1000:.3f};desc="{queries.count} queries"'
+        response['Server-Timing'] = ', '.join(filter(None, (response.get('Server-Timing'), timing)))
+
+        logger.info(json.dumps({
+            'event': 'sql',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': queries.count,
+            'db_ms': round(queries.duration * 1000, 3),
+            'total_ms': round(elapsed * 1000, 3),
+            'duplicates': duplicates[:5],
+        }, ensure_ascii=False))
+        for item in n_plus_one:
+            logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'path': request.path,
+                'view': view,
+                **item,
+            }, ensure_ascii=False))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Чтение из реплик (DATABASE_REPLICAS, см. config.db_router) для безопасных запросов
+    к представлениям с атрибутом read_replica = True: спискам и отчетам.
+
+    Реплика не выбирается, если она недоступна или отстает больше DATABASE_REPLICA_MAX_LAG,
+    и в течение DATABASE_REPLICA_PIN_SECONDS после успешной записи того же пользователя,
+    чтобы он сразу видел свои изменения. Если запрос к реплике падает с ошибкой соединения,
+    реплика исключается до следующей проверки, а представление повторяется на основной БД.
+    Без реплик middleware удаляется из цепочки. С кэшем в памяти процесса (locmem) тоже:
+    закрепление за основной БД хранится в кэше и должно быть видно всем процессам.
+    """
+
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        if not db_router.replica_aliases():
+            raise MiddlewareNotUsed
+        if is_process_local_cache():
+            logger.warning(
+                'Read replicas are disabled: DATABASE_REPLICAS needs a shared cache for read-your-writes '
+                'pinning, but CACHE_BACKEND is %s', settings.CACHES['default']['BACKEND']
+            )
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = db_router.use_replica(self.route(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.reset_replica(token)
+        self.after_response(request, response)
+        return response
+
+    async def __acall__(self, request):
+        # Проверка реплики и кэш закрепления синхронные
+        token = db_router.use_replica(await sync_to_async(self.route)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_router.reset_replica(token)
+        await sync_to_async(self.after_response)(request, response)
+        return response
+
+    def route(self, request):
+        if request.method not in self.safe_methods:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        view = getattr(match.func, 'cls', match.func)
+        if not getattr(view, 'read_replica', False):
+            return None
+        return db_router.choose_replica(token_user_id(request.META.get('HTTP_AUTHORIZATION')))
+
+    def after_response(self, request, response):
+        if request.method not in self.safe_methods and response.status_code < 400:
+            db_router.pin_to_primary(token_user_id(request.META.get('HTTP_AUTHORIZATION')))
+
+    def process_exception(self, request, exception):
+        alias = db_router.current_replica()
+        if alias is None or not isinstance(exception, (OperationalError, InterfaceError)):
+            return None
+        logger.warning('Read replica %s failed on %s, retrying on primary: %s', alias, request.path, exception)
+        db_router.health.mark_failed(alias)
+
+        match = request.resolver_match
+        view = match.func
+        if asyncio.iscoroutinefunction(view):
+            view = async_to_sync(view)
+        token = db_router.use_replica(None)
+        try:
+            return view(request, *match.args, **match.kwargs)
+        finally:
+            db_router.reset_replica(token)
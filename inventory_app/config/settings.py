@@ -50,9 +50,12 @@ INSTALLED_APPS = [
 
     'my_user',
     'inventory',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'config.middleware.MetricsMiddleware',
+    'config.middleware.SQLInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -61,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.middleware.ReplicaRoutingMiddleware',
 ]
 
 
@@ -120,6 +124,36 @@ DATABASES = {
     }
 }
 
+# Read replicas
+# Реплики только для чтения: реплики через запятую, у каждой - настройки, отличающиеся от default,
+# через точку с запятой. Например HOST=10.0.0.2;PORT=5433,HOST=10.0.0.3
+# или NAME=/tmp/replica.sqlite3 для проверки на копии локальной БД
+for index, replica in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(','))):
+    DATABASES[f'replica_{index + 1}'] = {
+        **DATABASES['default'],
+        **dict(option.split('=', 1) for option in replica.split(';')),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['config.db_router.ReplicaRouter']
+# Реплика с задержкой больше стольких секунд не используется
+DATABASE_REPLICA_MAX_LAG = float(os.getenv('DATABASE_REPLICA_MAX_LAG', 5))
+# Как часто (в секундах) каждый процесс проверяет задержку и доступность реплик
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.getenv('DATABASE_REPLICA_CHECK_INTERVAL', 5))
+# Сколько секунд после записи чтения пользователя идут в основную БД
+DATABASE_REPLICA_PIN_SECONDS = float(os.getenv('DATABASE_REPLICA_PIN_SECONDS', 10))
+
+
+# Cache
+# Версии ресурсов, кэш ответов и закрепление за основной БД после записи должны быть общими
+# для всех процессов, поэтому в продакшене вместо locmem нужен file-based или внешний кэш
+# (manage.py check --deploy предупреждает, с locmem реплики для чтения не используются)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -164,3 +198,120 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Inventory CSV import
+INVENTORY_IMPORT_CHUNK_SIZE = int(os.getenv('INVENTORY_IMPORT_CHUNK_SIZE', 1000))
+# Количество процессов для валидации больших файлов, 0 - валидация в процессе запроса
+INVENTORY_IMPORT_WORKERS = int(os.getenv('INVENTORY_IMPORT_WORKERS', 0))
+# Файлы меньше этого размера (в байтах) всегда обрабатываются без пула процессов
+INVENTORY_IMPORT_POOL_MIN_SIZE = int(os.getenv('INVENTORY_IMPORT_POOL_MIN_SIZE', 10 * 1024 * 1024))
+
+
+# Inventory images
+# Загружаемые файлы всегда пишутся во временный файл на диске, а не в память
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+# Потоки для построения копий изображений после запроса, 0 - сразу после фиксации транзакции
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
+
+
+# Invoice batches
+# Максимальное количество счетов в одном запросе на создание пачки
+INVOICE_BATCH_MAX_SIZE = int(os.getenv('INVOICE_BATCH_MAX_SIZE', 1000))
+
+
+# User activities
+# sync - запись сразу, в текущей транзакции, buffered - пачками из фонового потока после
+# фиксации транзакции, transactional - сразу после фиксации транзакции, либо путь к своему классу
+USER_ACTIVITIES_SINK = os.getenv('USER_ACTIVITIES_SINK', 'buffered')
+USER_ACTIVITIES_BATCH_SIZE = int(os.getenv('USER_ACTIVITIES_BATCH_SIZE', 500))
+USER_ACTIVITIES_FLUSH_INTERVAL = float(os.getenv('USER_ACTIVITIES_FLUSH_INTERVAL', 2))
+# На PostgreSQL активность хранится в месячных партициях: сколько месяцев создавать заранее
+USER_ACTIVITIES_PARTITIONS_AHEAD = int(os.getenv('USER_ACTIVITIES_PARTITIONS_AHEAD', 3))
+# Сколько месяцев (включая текущий) хранится в БД, более старые уходят в архив (rotate_user_activities)
+USER_ACTIVITIES_RETENTION_MONTHS = int(os.getenv('USER_ACTIVITIES_RETENTION_MONTHS', 6))
+# Каталог сжатых архивов активности, по месяцу на файл
+USER_ACTIVITIES_ARCHIVE_DIR = os.getenv('USER_ACTIVITIES_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive', 'user_activities'))
+
+
+# Background jobs
+# Процессы пула runworker и пауза между опросами очереди (секунды)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+# Время на одну попытку задачи, если у типа задачи нет своего (секунды). Через JOB_TIMEOUT_GRACE
+# после таймаута процесс, в котором задача так и не прервалась, завершается принудительно
+JOB_DEFAULT_TIMEOUT = int(os.getenv('JOB_DEFAULT_TIMEOUT', 3600))
+JOB_TIMEOUT_GRACE = int(os.getenv('JOB_TIMEOUT_GRACE', 30))
+# Задержка перед повтором упавшей задачи, удваивается с каждой попыткой (секунды)
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 30))
+# Задача, воркер которой не обновлял heartbeat столько секунд, считается брошенной
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', 120))
+# Одновременных задач одного типа на всех воркерах: тип=число через запятую, перекрывает значения из кода
+JOB_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (item.split('=', 1) for item in filter(None, os.getenv('JOB_CONCURRENCY', '').split(',')))
+}
+# Каталог файлов задач (не должен быть доступен веб-серверу напрямую) и сколько дней
+# хранить завершенные задачи с их файлами (см. manage.py purge_jobs)
+JOB_FILES_DIR = os.getenv('JOB_FILES_DIR', os.path.join(BASE_DIR, 'job_files'))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+
+# JWT authentication cache (в памяти каждого процесса)
+JWT_CACHE_TTL = int(os.getenv('JWT_CACHE_TTL', 60))
+JWT_CACHE_MAXSIZE = int(os.getenv('JWT_CACHE_MAXSIZE', 10000))
+
+
+# Summary
+SUMMARY_CACHE_TIMEOUT = int(os.getenv('SUMMARY_CACHE_TIMEOUT', 300))
+
+# Sales forecast
+# Глубина истории продаж по умолчанию и максимальная, в днях
+FORECAST_HISTORY_DAYS = int(os.getenv('FORECAST_HISTORY_DAYS', 90))
+FORECAST_MAX_HISTORY_DAYS = int(os.getenv('FORECAST_MAX_HISTORY_DAYS', 730))
+# Срок поставки в днях и коэффициент страхового запаса (1.65 - уровень сервиса около 95%)
+FORECAST_LEAD_TIME_DAYS = float(os.getenv('FORECAST_LEAD_TIME_DAYS', 7))
+FORECAST_SAFETY_FACTOR = float(os.getenv('FORECAST_SAFETY_FACTOR', 1.65))
+
+# Response cache
+# Время хранения ответов списков и отчетов, 0 - только ETag/Last-Modified без кэша ответов
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+
+# List filters
+# Писать в лог и заголовок X-Query-Plan план запроса для каждого отфильтрованного списка
+FILTER_EXPLAIN = bool(int(os.getenv('FILTER_EXPLAIN', default=0)))
+
+
+# Exports
+# Размер пачки строк, которую выгрузка читает из БД за раз
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+
+# Fast list path
+# Читать списки через values() без создания моделей и ModelSerializer (см. inventory.fast)
+FAST_LIST_VIEWS = bool(int(os.getenv('FAST_LIST_VIEWS', default=1)))
+
+
+# SQL instrumentation
+# Количество и время запросов к БД в заголовках X-SQL-* и в логе, поиск N+1 (см. config.middleware)
+SQL_INSTRUMENTATION = bool(int(os.getenv('SQL_INSTRUMENTATION', default=0)))
+# Сколько одинаковых SELECT за запрос считается N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+
+
+# Metrics
+# Метрики запросов в формате Prometheus по адресу /api/v1/metrics (см. config.metrics)
+METRICS_ENABLED = bool(int(os.getenv('METRICS_ENABLED', default=1)))
+# Каталог снимков метрик процессов, общий для всех воркеров одного сервера (живые процессы
+# определяются по pid). Пусто - только текущий процесс
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+# Как часто (в секундах) процесс обновляет свой снимок
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+
+# Async reports
+# Асинхронные отчеты с одновременными подзапросами (см. inventory.async_views), включается в config.asgi
+ASYNC_REPORT_VIEWS = bool(int(os.getenv('ASYNC_REPORT_VIEWS', default=0)))
+# Потоки для одновременных подзапросов отчетов
+ASYNC_REPORT_WORKERS = int(os.getenv('ASYNC_REPORT_WORKERS', 8))
@@ -7,6 +7,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from .metrics import MetricsView
+
 schema_view = get_schema_view(
    openapi.Info(
       title="Inventory_app_DRF API",
@@ -23,8 +25,10 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/v1/metrics', MetricsView.as_view(), name='metrics'),
     path('api/v1/user/', include('my_user.urls')),
     path('api/v1/', include('inventory.urls')),
+    path('api/v1/', include('jobs.urls')),
     path('api/v1/swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('api/v1/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 
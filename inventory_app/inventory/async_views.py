@@ -0,0 +1,89 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# Отдельный пул для подзапросов: потоки обработчиков ждут подзапросы, и если бы те
+# выполнялись в том же пуле, при его исчерпании запросы ждали бы друг друга вечно
+_query_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_REPORT_WORKERS, thread_name_prefix='report-query'
+)
+
+
+def _in_own_connection(call):
+    """ Вызов в потоке пула: у потока свое соединение с БД, закрываем его как после запроса """
+
+    try:
+        return call()
+    finally:
+        close_old_connections()
+
+
+async def _gather(calls):
+    results = await asyncio.gather(*(
+        sync_to_async(_in_own_connection, thread_sensitive=False, executor=_query_executor)(call)
+        for call in calls.values()
+    ))
+    return dict(zip(calls, results))
+
+
+def run_sequentially(**calls):
+    """ {имя: функция} -> {имя: результат}, функции вызываются по очереди """
+
+    return {name: call() for name, call in calls.items()}
+
+
+def run_concurrently(**calls):
+    """
+    {имя: функция} -> {имя: результат}, функции выполняются одновременно в пуле потоков,
+    каждая со своим соединением с БД. Вызывается из синхронного кода асинхронного представления.
+    """
+
+    return async_to_sync(_gather)(calls)
+
+
+class AsyncReportMixin:
+    """
+    Асинхронный вариант отчета для ASGI (настройка ASYNC_REPORT_VIEWS, ее включает config.asgi).
+
+    as_view возвращает корутину: представление DRF выполняется в пуле потоков
+    (sync_to_async без thread_sensitive) и не блокирует цикл событий, а независимые
+    запросы отчета, переданные в self.gather, выполняются одновременно. Без настройки
+    представление остается синхронным, а self.gather выполняет запросы по очереди.
+    Адреса и ответы в обоих случаях одинаковые.
+    """
+
+    concurrent = False
+
+    def gather(self, **calls):
+        if self.concurrent:
+            return run_concurrently(**calls)
+        return run_sequentially(**calls)
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_REPORT_VIEWS:
+            return view
+        concurrent_view = super().as_view(actions, concurrent=True, **initkwargs)
+
+        def dispatch(request, *args, **kwargs):
+            try:
+                response = concurrent_view(request, *args, **kwargs)
+                # Рендерим ответ здесь же, чтобы не занимать поток цикла событий
+                if hasattr(response, 'render'):
+                    response.render()
+                return response
+            finally:
+                close_old_connections()
+
+        async def async_view(request, *args, **kwargs):
+            return await sync_to_async(dispatch, thread_sensitive=False)(request, *args, **kwargs)
+
+        # cls, initkwargs, actions и csrf_exempt нужны роутеру и генератору схемы
+        functools.update_wrapper(async_view, view)
+        return async_view
@@ -0,0 +1,183 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .importers import _plain_errors
+from .models import Invoice, InvoiceItem, Shop, DailySales, SearchDocument
+from .serializers import InvoiceSerializer
+from my_user.cache import bump_versions
+from my_user.utils import add_user_activities_batch
+
+
+ATOMIC = 'atomic'
+PARTIAL = 'partial'
+BATCH_MODES = (ATOMIC, PARTIAL)
+
+
+class InvoiceBatch:
+    """
+    Создание пачки счетов одним запросом (выгрузка очереди продаж с кассы).
+
+    Все счета валидируются заранее, магазины проверяются одним запросом, остатки всех
+    позиций блокируются одним SELECT и списываются одним UPDATE по суммарному количеству,
+    счета и позиции пишутся через bulk_create. Режим atomic: при любой ошибке не создается
+    ни один счет. Режим partial: счета с ошибками (в том числе без остатка с учетом счетов
+    выше по списку) пропускаются, остальные создаются. Результат - по каждому счету
+    в порядке запроса.
+    """
+
+    def __init__(self, user, mode=ATOMIC):
+        if mode not in BATCH_MODES:
+            raise serializers.ValidationError({'mode': [f'Mode must be one of: {", ".join(BATCH_MODES)}']})
+        self.user = user
+        self.mode = mode
+        self.results = []
+
+    def run(self, invoices):
+        if not isinstance(invoices, list) or not invoices:
+            raise serializers.ValidationError({'invoices': ['You need to provide a non-empty list of invoices!']})
+        if len(invoices) > settings.INVOICE_BATCH_MAX_SIZE:
+            raise serializers.ValidationError({
+                'invoices': [f'A batch cannot contain more than {settings.INVOICE_BATCH_MAX_SIZE} invoices']
+            })
+
+        self.results = [{'index': index, 'status': 'pending'} for index in range(len(invoices))]
+        valid = self._check_shops(self._validate(invoices))
+
+        with transaction.atomic():
+            # Остатки проверяются по заблокированным строкам, а не по данным до транзакции
+            accepted = self._allocate_stock(valid)
+            if self.mode == ATOMIC and self.failed:
+                accepted = []
+            if accepted:
+                self._write(accepted)
+
+        for result in self.results:
+            if result['status'] == 'pending':
+                result['status'] = 'skipped'
+        return self.report()
+
+    @property
+    def created(self):
+        return sum(result['status'] == 'created' for result in self.results)
+
+    @property
+    def failed(self):
+        return sum(result['status'] == 'failed' for result in self.results)
+
+    def report(self):
+        return {
+            'mode': self.mode,
+            'created': self.created,
+            'failed': self.failed,
+            'results': self.results,
+        }
+
+    def _fail(self, index, errors):
+        self.results[index].update(status='failed', errors=errors)
+
+    def _validate(self, invoices):
+        """ Валидация каждого счета сериализатором, строки счета - как в InvoiceItemManager.create_for_invoice """
+
+        serializer = InvoiceSerializer()
+        valid = []
+        for index, data in enumerate(invoices):
+            if not isinstance(data, dict):
+                self._fail(index, {'non_field_errors': ['Invoice must be an object']})
+                continue
+            try:
+                validated_data = serializer.run_validation({**data, 'created_by_id': self.user.id})
+            except serializers.ValidationError as e:
+                self._fail(index, _plain_errors(serializers.as_serializer_error(e)))
+                continue
+
+            try:
+                lines = [(int(line['item_id']), line['quantity']) for line in validated_data['invoice_item_data']]
+                shop_id = int(validated_data['shop_id'])
+            except ValueError:
+                self._fail(index, {'non_field_errors': ['Item and shop ids must be integers!']})
+                continue
+            if not lines:
+                self._fail(index, {'invoice_item_data': ['You need to provide at least one invoice item!']})
+                continue
+            if any(quantity < 0 for _, quantity in lines):
+                self._fail(index, {'invoice_item_data': ['Quantity cannot be negative!']})
+                continue
+            valid.append((index, shop_id, lines))
+        return valid
+
+    def _check_shops(self, valid):
+        existing = set(Shop.objects.filter(
+            id__in={shop_id for _, shop_id, _ in valid}
+        ).values_list('id', flat=True))
+
+        checked = []
+        for index, shop_id, lines in valid:
+            if shop_id in existing:
+                checked.append((index, shop_id, lines))
+            else:
+                self._fail(index, {'shop_id': [f'Shop with id {shop_id} not found']})
+        return checked
+
+    def _allocate_stock(self, valid):
+        """ Распределяет заблокированные остатки между счетами по порядку, возвращает принятые счета """
+
+        items = InvoiceItem.objects.lock_stock({
+            item_id for _, _, lines in valid for item_id, _ in lines
+        })
+        remaining = {item_id: item.remaining for item_id, item in items.items()}
+
+        accepted = []
+        for index, shop_id, lines in valid:
+            quantities = Counter()
+            for item_id, quantity in lines:
+                quantities[item_id] += quantity
+
+            errors = []
+            for item_id, quantity in quantities.items():
+                if item_id not in items:
+                    errors.append(f'Item with id {item_id} not found!')
+                elif remaining[item_id] < quantity:
+                    errors.append(f'Item with code {items[item_id].code} does not have enough quantity!')
+            if errors:
+                self._fail(index, {'invoice_item_data': errors})
+                continue
+
+            for item_id, quantity in quantities.items():
+                remaining[item_id] -= quantity
+            accepted.append((index, shop_id, lines))
+
+        self.items = items
+        return accepted
+
+    def _write(self, accepted):
+        totals = Counter()
+        for _, _, lines in accepted:
+            for item_id, quantity in lines:
+                totals[item_id] += quantity
+        InvoiceItem.objects.take_stock(totals, self.items)
+
+        invoices = Invoice.objects.bulk_create([
+            Invoice(created_by=self.user, shop_id=shop_id) for _, shop_id, _ in accepted
+        ])
+        invoice_items = InvoiceItem.objects.bulk_create([
+            InvoiceItem(
+                invoice=invoice,
+                item=self.items[item_id],
+                item_name=self.items[item_id].name,
+                item_code=self.items[item_id].code,
+                quantity=quantity,
+                amount=quantity * self.items[item_id].price
+            )
+            for invoice, (_, _, lines) in zip(invoices, accepted)
+            for item_id, quantity in lines
+        ])
+        DailySales.objects.record(invoice_items)
+        SearchDocument.objects.index(Invoice, [invoice.pk for invoice in invoices])
+        bump_versions('invoice', 'inventory')
+        add_user_activities_batch(self.user, ['added new invoice'] * len(invoices))
+
+        for invoice, (index, _, _) in zip(invoices, accepted):
+            self.results[index].update(status='created', id=invoice.pk)
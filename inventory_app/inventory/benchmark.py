@@ -0,0 +1,139 @@
+import math
+import time
+import tracemalloc
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from django.urls import NoReverseMatch, reverse
+from rest_framework.mixins import RetrieveModelMixin
+
+from my_user.models import CustomUser
+from my_user.utils import get_access_token
+
+
+def bench_client(email=None, host='localhost'):
+    """
+    Клиент для запросов в том же процессе от имени пользователя email
+    (по умолчанию - первого администратора или первого пользователя).
+    """
+
+    users = CustomUser.objects.order_by('id')
+    if email:
+        user = users.filter(email=email).first()
+    else:
+        user = users.filter(role='admin').first() or users.first()
+    if user is None:
+        raise Exception('User not found')
+
+    return Client(
+        HTTP_HOST=host,
+        HTTP_AUTHORIZATION=f'Bearer {get_access_token({"user_id": user.id}, 1)}',
+        raise_request_exception=False,
+    )
+
+
+class QueryCounter:
+    """
+    Счетчик запросов к БД. CaptureQueriesContext здесь не подходит: клиент посылает
+    request_started, который очищает connection.queries посреди замера.
+    """
+
+    def __init__(self, using=None):
+        self.connection = connections[using or DEFAULT_DB_ALIAS]
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.wrapper = self.connection.execute_wrapper(self)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wrapper.__exit__(*exc_info)
+
+
+def percentile(values, percent):
+    """ Перцентиль по ближайшему рангу: всегда одно из измеренных значений """
+
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def router_endpoints(*routers):
+    """
+    GET адреса всех зарегистрированных в роутерах представлений: список и, если у
+    представления есть retrieve, первый объект из его queryset.
+    """
+
+    endpoints = []
+    for router in routers:
+        for prefix, viewset, basename in router.registry:
+            if 'get' not in viewset.http_method_names:
+                continue
+            endpoints.append((f'{basename}:list', reverse(f'{basename}-list')))
+
+            has_retrieve = (
+                viewset.retrieve is not RetrieveModelMixin.retrieve or
+                getattr(viewset, 'serializer_class', None) is not None
+            )
+            queryset = getattr(viewset, 'queryset', None)
+            if not has_retrieve or queryset is None:
+                continue
+            pk = queryset.order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                continue
+            try:
+                endpoints.append((f'{basename}:detail', reverse(f'{basename}-detail', kwargs={'pk': pk})))
+            except NoReverseMatch:
+                continue
+    return endpoints
+
+
+def fetch(client, path, params=None):
+    """ GET запрос с чтением всего тела, в том числе потокового """
+
+    response = client.get(path, params or {})
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    return response.status_code, content
+
+
+def measure(client, path, params=None, repeat=20, warmup=2):
+    """ Время ответа (p50/p95 в мс), количество запросов к БД и пик памяти Python на запрос """
+
+    for _ in range(warmup):
+        fetch(client, path, params)
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        status, content = fetch(client, path, params)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    with QueryCounter() as queries:
+        fetch(client, path, params)
+
+    # tracemalloc замедляет выполнение, поэтому память меряем отдельным запросом
+    tracemalloc.start()
+    try:
+        fetch(client, path, params)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'path': path,
+        'status': status,
+        'bytes': len(content),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'min_ms': round(min(timings), 3),
+        'queries': queries.count,
+        'peak_kb': round(peak / 1024, 1),
+    }
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from config.db_router import current_replica
+from my_user.cache import get_versions
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count_response(result):
+    with _stats_lock:
+        _stats[result] += 1
+
+
+def response_cache_stats():
+    """ Статистика кэша ответов текущего процесса """
+
+    with _stats_lock:
+        stats = {result: _stats[result] for result in ('hit', 'miss', 'not_modified')}
+    served = stats['hit'] + stats['not_modified']
+    total = served + stats['miss']
+    stats['hit_ratio'] = round(served / total, 4) if total else None
+    return stats
+
+
+class VersionedResponseMixin:
+    """
+    Условные GET запросы и кэш ответов по версиям ресурсов.
+
+    Ключ ответа - хост, путь, параметры запроса, роль пользователя и версии ресурсов
+    из cache_resources (см. my_user.cache.get_versions). Версии меняются после каждого
+    изменения моделей, поэтому кэш не нужно сбрасывать вручную. ETag и Last-Modified
+    позволяют клиенту получить 304 без выполнения запросов к БД и сериализации.
+    С параметром fresh (например, ?fresh=1 у сводки) кэш ответов не используется.
+    """
+
+    cache_resources = ()
+    cached_actions = ('list', 'retrieve')
+    fresh_query_param = 'fresh'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.response_cache_key = None
+        self.response_cache_result = None
+        if (
+            request.method != 'GET' or not self.cache_resources or
+            getattr(self, 'action', None) not in self.cached_actions or
+            request.query_params.get(self.fresh_query_param)
+        ):
+            return
+
+        versions = get_versions(*self.cache_resources)
+        user = request.user
+        raw_key = '|'.join((
+            request.get_host(), request.path, request.META.get('QUERY_STRING', ''),
+            f'{getattr(user, "role", "")}:{int(bool(getattr(user, "is_superuser", False)))}',
+            ':'.join(str(version) for version in versions),
+        ))
+        digest = hashlib.sha1(raw_key.encode()).hexdigest()
+        self.response_cache_key = f'response:{digest}'
+        self.etag = f'"{digest}"'
+        self.last_modified = max(versions) // 1000000
+        # Last-Modified - целые секунды: по If-Modified-Since можно ответить 304, только если
+        # версия ровно на границе секунды, иначе запись в ту же секунду осталась бы незамеченной
+        self.last_modified_exact = max(versions) % 1000000 == 0
+
+        if self.is_not_modified(request):
+            self.serve_cached(request, Response(status=status.HTTP_304_NOT_MODIFIED), 'not_modified')
+            return
+        data = cache.get(self.response_cache_key)
+        if data is not None:
+            self.serve_cached(request, Response(data), 'hit')
+        else:
+            self.response_cache_result = 'miss'
+            count_response('miss')
+
+    def is_not_modified(self, request):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or self.etag in tags or f'W/{self.etag}' in tags
+        if not self.last_modified_exact:
+            return False
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and self.last_modified <= if_modified_since
+
+    def serve_cached(self, request, response, result):
+        """ Подменяем обработчик действия: ответ уже есть, view выполнять не нужно """
+
+        self.response_cache_result = result
+        count_response(result)
+        setattr(self, request.method.lower(), lambda *args, **kwargs: response)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'response_cache_key', None) is None:
+            return response
+
+        # Реплика может отставать от версий ресурсов: ее ответ не кэшируем и не отдаем
+        # с ETag, иначе устаревшие данные закрепились бы под новыми версиями
+        from_replica = self.response_cache_result == 'miss' and current_replica() is not None
+        if (
+            self.response_cache_result == 'miss' and response.status_code == status.HTTP_200_OK and
+            isinstance(response, Response) and settings.RESPONSE_CACHE_TIMEOUT > 0 and not from_replica
+        ):
+            cache.set(self.response_cache_key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            if not from_replica:
+                response['ETag'] = self.etag
+                response['Last-Modified'] = http_date(self.last_modified)
+            response['Cache-Control'] = 'private, no-cache'
+            response['Vary'] = 'Authorization'
+            response['X-Cache'] = self.response_cache_result.upper()
+        return response
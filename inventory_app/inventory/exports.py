@@ -0,0 +1,105 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.viewsets import ModelViewSet
+
+from .filters import FilteredListMixin
+from .search import search
+from my_user.permissions import IsAuthenticatedCustom
+
+
+class Echo:
+    """ Псевдо-файл для csv.writer: возвращает записанную строку вместо записи """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(
+            value.isoformat() if hasattr(value, 'isoformat') else value for value in row
+        )
+
+
+def ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+class ExportView(FilteredListMixin, ModelViewSet):
+    """
+    Базовое представление потоковой выгрузки в CSV или NDJSON (параметр output).
+
+    Строки берутся плоскими values_list(*export_fields) через iterator(chunk_size), поэтому
+    память не зависит от размера таблицы. Фильтры и keyword - те же, что у списка;
+    filter_prefix позволяет применить фильтры списка к связанной модели.
+    """
+
+    http_method_names = ('get',)
+    permission_classes = (IsAuthenticatedCustom,)
+    export_name = None
+    export_fields = ()
+    filter_prefix = ''
+    search_model = None
+
+    @classmethod
+    def export_queryset(cls, query_params):
+        """ Выгружаемые записи по параметрам запроса (вне запроса - для фоновой выгрузки) """
+
+        lookups = cls.filterset_class(query_params).get_lookups()
+        queryset = cls.queryset.filter(
+            **{cls.filter_prefix + key: value for key, value in lookups.items()}
+        )
+
+        keyword = query_params.get('keyword', None)
+        if keyword and cls.search_model is not None:
+            found = search(cls.search_model.objects.all(), keyword)
+            if cls.filter_prefix:
+                queryset = queryset.filter(**{f'{cls.filter_prefix}in': found.values('pk')})
+            else:
+                queryset = search(queryset, keyword)
+        return queryset
+
+    @classmethod
+    def get_output(cls, query_params):
+        output = query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': [f'Expected one of: {", ".join(EXPORT_FORMATS)}']})
+        return output
+
+    @classmethod
+    def render(cls, output, queryset):
+        """ Строки файла выгрузки: values_list(*export_fields) пачками по EXPORT_CHUNK_SIZE """
+
+        rows = queryset.values_list(*cls.export_fields).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        header = [field.replace('__', '_') for field in cls.export_fields]
+        return EXPORT_FORMATS[output][0](header, rows)
+
+    @classmethod
+    def get_filename(cls, output):
+        return f'{cls.export_name}-{timezone.localdate():%Y%m%d}.{output}'
+
+    def get_queryset(self):
+        return self.export_queryset(self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        output = self.get_output(request.query_params)
+        lines = self.render(output, self.filter_queryset(self.get_queryset()))
+
+        response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[output][1])
+        response['Content-Disposition'] = f'attachment; filename="{self.get_filename(output)}"'
+        return response
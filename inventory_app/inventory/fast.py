@@ -0,0 +1,319 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import FileField, prefetch_related_objects
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.response import Response
+
+
+class Unsupported(Exception):
+    """ Поле сериализатора нельзя прочитать из values(), используем обычный сериализатор """
+
+
+class RenderContext:
+    """ Отложенные шаги (связи, которые читаются отдельным запросом на всю страницу) """
+
+    def __init__(self):
+        self.pending = defaultdict(list)
+        self.cache = {}
+
+    def defer(self, step, out, value):
+        self.pending[step].append((out, value))
+
+    def resolve(self):
+        while self.pending:
+            step, items = self.pending.popitem()
+            step.resolve(items, self)
+
+
+class ColumnStep:
+
+    def __init__(self, key, column, field, model_field):
+        self.key = key
+        self.column = column
+        self.field = field
+        self.is_file = isinstance(model_field, FileField)
+        self.model_field = model_field
+
+    def apply(self, row, out, context):
+        value = row[self.column]
+        if self.is_file:
+            # Сериализатор получает FieldFile даже для пустого значения
+            value = self.model_field.attr_class(None, self.model_field, value)
+        elif value is None:
+            out[self.key] = None
+            return
+        out[self.key] = self.field.to_representation(value)
+
+
+class ConstStep:
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def apply(self, row, out, context):
+        out[self.key] = self.value
+
+
+class NestedStep:
+    """ Вложенный сериализатор по внешнему ключу: поля читаются в том же запросе через join """
+
+    def __init__(self, key, plan):
+        self.key = key
+        self.plan = plan
+
+    def apply(self, row, out, context):
+        if row[self.plan.pk_column] is None:
+            out[self.key] = None
+        else:
+            out[self.key] = self.plan.render_row(row, context)
+
+
+class ManyStep:
+    """ Вложенный список по обратной связи: один запрос на всю страницу """
+
+    def __init__(self, key, pk_column, plan, remote_field):
+        self.key = key
+        self.pk_column = pk_column
+        self.plan = plan
+        self.remote_field = remote_field
+
+    def apply(self, row, out, context):
+        out[self.key] = []
+        context.defer(self, out, row[self.pk_column])
+
+    def resolve(self, items, context):
+        fk_column = self.remote_field.attname
+        rows = self.plan.model._default_manager.filter(**{
+            f'{self.remote_field.name}__in': {value for _, value in items}
+        }).values(*self.plan.columns, fk_column)
+
+        grouped = defaultdict(list)
+        for row in rows:
+            grouped[row[fk_column]].append(self.plan.render_row(row, context))
+        for out, value in items:
+            out[self.key] = grouped.get(value, [])
+
+
+class ManyToManyStep:
+    """ Список id по связи многие-ко-многим: один запрос к промежуточной таблице """
+
+    def __init__(self, key, pk_column, model_field):
+        self.key = key
+        self.pk_column = pk_column
+        self.model_field = model_field
+
+    def apply(self, row, out, context):
+        out[self.key] = []
+        context.defer(self, out, row[self.pk_column])
+
+    def resolve(self, items, context):
+        through = self.model_field.remote_field.through
+        source = self.model_field.m2m_field_name()
+        target = self.model_field.m2m_reverse_field_name()
+        # Порядок как у related manager: по сортировке связанной модели
+        ordering = [
+            f'-{target}__{field[1:]}' if field.startswith('-') else f'{target}__{field}'
+            for field in self.model_field.related_model._meta.ordering
+        ]
+        grouped = defaultdict(list)
+        rows = through._default_manager.filter(**{
+            f'{source}__in': {value for _, value in items}
+        }).order_by(*ordering, 'pk').values_list(source, target)
+        for source_id, target_id in rows:
+            grouped[source_id].append(target_id)
+        for out, value in items:
+            out[self.key] = grouped.get(value, [])
+
+
+class StrRelationStep:
+    """ Внешний ключ, выводимый строкой (str объекта): объекты страницы загружаются пачкой """
+
+    def __init__(self, key, column, field, related_model):
+        self.key = key
+        self.column = column
+        self.field = field
+        self.related_model = related_model
+
+    def apply(self, row, out, context):
+        value = row[self.column]
+        out[self.key] = None
+        if value is not None:
+            context.defer(self, out, value)
+
+    def resolve(self, items, context):
+        objects = self.related_model._base_manager.in_bulk({value for _, value in items})
+        # __str__ может обращаться к связанным объектам, загружаем их заранее
+        prefetch_related_objects(list(objects.values()), *[
+            field.name for field in self.related_model._meta.concrete_fields if field.many_to_one
+        ])
+        for out, value in items:
+            if value in objects:
+                out[self.key] = self.field.to_representation(objects[value])
+
+
+class SelfRelationStep:
+    """
+    Связь из collapsed_fields сериализатора (например belongs_to группы): объект по id
+    выводится тем же сериализатором. Уровни иерархии читаются по одному запросу.
+    """
+
+    def __init__(self, key, column, serializer, model):
+        self.key = key
+        self.column = column
+        self.serializer = serializer
+        self.model = model
+
+    def apply(self, row, out, context):
+        value = row[self.column]
+        out[self.key] = None
+        if value is not None:
+            context.defer(self, out, value)
+
+    def resolve(self, items, context):
+        cache_key = (type(self.serializer), self.model)
+        if cache_key not in context.cache:
+            target = type(self.serializer)(context=self.serializer.context, field_spec=None)
+            context.cache[cache_key] = (RowPlan(target, self.model), {})
+        plan, rendered = context.cache[cache_key]
+
+        missing = {value for _, value in items} - rendered.keys()
+        if missing:
+            for row in self.model._default_manager.filter(pk__in=missing).values(*plan.columns):
+                rendered[row[plan.pk_column]] = plan.render_row(row, context)
+        for out, value in items:
+            out[self.key] = rendered.get(value)
+
+
+class RowPlan:
+    """
+    План чтения сериализатора из строк values().
+
+    Поля сериализатора переводятся в колонки одного запроса (вложенные сериализаторы по
+    внешним ключам - через join), обратные связи и многие-ко-многим читаются отдельным
+    запросом на страницу. Значения форматируются теми же полями сериализатора, поэтому
+    результат совпадает с serializer.data. Если поле нельзя прочитать так, план не строится.
+    """
+
+    def __init__(self, serializer, model, prefix='', annotations=(), extra_columns=()):
+        self.model = model
+        self.prefix = prefix
+        self.annotations = annotations
+        self.pk_column = prefix + model._meta.pk.attname
+        self.columns = [self.pk_column]
+        self.steps = []
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                step = self.compile_field(serializer, name, field)
+                if step is not None:
+                    self.steps.append(step)
+        self.add_columns(*(prefix + column for column in extra_columns))
+
+    def add_columns(self, *columns):
+        for column in columns:
+            if column not in self.columns:
+                self.columns.append(column)
+
+    def compile_field(self, serializer, name, field):
+        if field.source == '*':
+            collapsed = getattr(serializer, 'collapsed_fields', {})
+            if isinstance(field, serializers.SerializerMethodField) and name in collapsed:
+                column = self.prefix + collapsed[name]
+                self.add_columns(column)
+                return SelfRelationStep(name, column, serializer, self.model)
+            raise Unsupported(name)
+        if len(field.source_attrs) != 1:
+            raise Unsupported(name)
+
+        source = field.source
+        if source in self.annotations:
+            self.add_columns(source)
+            return ColumnStep(name, source, field, None)
+        try:
+            model_field = self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            return self.compile_missing(name, field)
+
+        if isinstance(field, serializers.ListSerializer):
+            if not model_field.one_to_many:
+                raise Unsupported(name)
+            plan = RowPlan(field.child, model_field.related_model)
+            return ManyStep(name, self.pk_column, plan, model_field.field)
+        if isinstance(field, serializers.BaseSerializer):
+            if not model_field.many_to_one:
+                raise Unsupported(name)
+            plan = RowPlan(field, model_field.related_model, f'{self.prefix}{source}__')
+            self.add_columns(*plan.columns)
+            return NestedStep(name, plan)
+        if isinstance(field, ManyRelatedField):
+            if not (model_field.many_to_many and model_field.concrete):
+                raise Unsupported(name)
+            return ManyToManyStep(name, self.pk_column, model_field)
+        if model_field.is_relation:
+            if isinstance(field, RelatedField) or not model_field.many_to_one:
+                raise Unsupported(name)
+            column = self.prefix + model_field.attname
+            self.add_columns(column)
+            return StrRelationStep(name, column, field, model_field.related_model)
+
+        column = self.prefix + model_field.attname
+        self.add_columns(column)
+        return ColumnStep(name, column, field, model_field)
+
+    def compile_missing(self, name, field):
+        """ Атрибута нет у объекта: повторяем поведение Field.get_attribute """
+
+        if hasattr(self.model, field.source) or field.default is not empty:
+            raise Unsupported(name)
+        if field.allow_null:
+            return ConstStep(name, None)
+        if not field.required:
+            return None
+        raise Unsupported(name)
+
+    def render_row(self, row, context):
+        out = {}
+        for step in self.steps:
+            step.apply(row, out, context)
+        return out
+
+    def render(self, rows):
+        context = RenderContext()
+        data = [self.render_row(row, context) for row in rows]
+        context.resolve()
+        return data
+
+
+class FastListMixin:
+    """
+    Быстрый путь чтения списка без создания моделей и ModelSerializer на каждую строку:
+    строки читаются через values() по плану RowPlan. Запись, разреженный вывод (?fields=)
+    и неподдерживаемые поля идут через обычный сериализатор. Отключается FAST_LIST_VIEWS.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_LIST_VIEWS:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer()
+        if getattr(serializer, 'field_spec', None) is not None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            # created_at и id нужны курсорной пагинации
+            plan = RowPlan(
+                serializer, queryset.model, annotations=queryset.query.annotations,
+                extra_columns=('created_at',)
+            )
+        except Unsupported:
+            return super().list(request, *args, **kwargs)
+
+        rows = queryset.prefetch_related(None).values(*plan.columns)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(rows))
@@ -0,0 +1,234 @@
+import logging
+from datetime import datetime, time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from .caching import VersionedResponseMixin
+from .utils import PAGINATION_PARAMS
+
+
+logger = logging.getLogger(__name__)
+
+NUMBER_LOOKUPS = ('exact', 'in', 'gt', 'gte', 'lt', 'lte', 'range')
+DATE_LOOKUPS = ('gt', 'gte', 'lt', 'lte', 'range')
+ID_LOOKUPS = ('exact', 'in')
+MAX_IN_VALUES = 100
+
+
+def match_lookup(value, lookup, expected):
+    """ Проверка значения по lookup так же, как в SQL: NULL не проходит сравнения """
+
+    if lookup == 'isnull':
+        return (value is None) == expected
+    if value is None:
+        return False
+    if lookup == 'exact':
+        return value == expected
+    if lookup == 'in':
+        return value in expected
+    if lookup == 'gt':
+        return value > expected
+    if lookup == 'gte':
+        return value >= expected
+    if lookup == 'lt':
+        return value < expected
+    if lookup == 'lte':
+        return value <= expected
+    if lookup == 'range':
+        return expected[0] <= value <= expected[1]
+    raise ValueError(lookup)
+
+
+def parse_bool(value):
+    if value.lower() in ('1', 'true'):
+        return True
+    if value.lower() in ('0', 'false'):
+        return False
+    raise ValueError
+
+
+def parse_moment(value):
+    """ Дата со временем или просто дата (начало суток) в текущей временной зоне """
+
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError
+        moment = datetime.combine(day, time.min)
+    if settings.USE_TZ and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Filter:
+    """ Разрешенный фильтр: поле модели, функция разбора значения и допустимые lookups """
+
+    def __init__(self, parse=str, lookups=('exact',), field_name=None):
+        self.parse = parse
+        self.lookups = lookups
+        self.field_name = field_name
+
+    def get_lookup(self, name, lookup, value):
+        if lookup == 'isnull':
+            parsed = parse_bool(value)
+        elif lookup in ('in', 'range'):
+            parsed = [self.parse(item) for item in value.split(',') if item != '']
+            if lookup == 'range' and len(parsed) != 2:
+                raise ValueError
+            if not parsed or len(parsed) > MAX_IN_VALUES:
+                raise ValueError
+        else:
+            parsed = self.parse(value)
+        return f'{self.field_name or name}__{lookup}', parsed
+
+
+class FilterSet:
+    """
+    Фильтрация списка по параметрам запроса.
+
+    Разрешены только параметры из filters в виде <поле> или <поле>__<lookup>,
+    значения приводятся к типу поля. Неизвестный параметр или неверное значение -
+    ошибка 400. Служебные параметры (пагинация, поиск и т.п.) пропускаются.
+    """
+
+    filters = {}
+    # Служебные параметры: пагинация, поиск, выгрузка, поля ответа, обход кэша (fresh), формат ответа DRF
+    reserved_params = PAGINATION_PARAMS + (
+        'keyword', 'explain', 'output', 'fields', 'expand', VersionedResponseMixin.fresh_query_param,
+        *filter(None, (api_settings.URL_FORMAT_OVERRIDE,))
+    )
+
+    def __init__(self, query_params):
+        self.query_params = query_params
+
+    def get_lookups(self):
+        lookups, errors = {}, {}
+        for param, value in self.query_params.items():
+            if param in self.reserved_params:
+                continue
+            name, lookup = param, 'exact'
+            if '__' in param:
+                name, lookup = param.rsplit('__', 1)
+
+            field_filter = self.filters.get(name)
+            if field_filter is None or lookup not in field_filter.lookups:
+                errors[param] = ['Unknown filter']
+                continue
+            try:
+                key, parsed = field_filter.get_lookup(name, lookup, value)
+            except (TypeError, ValueError):
+                errors[param] = [f'Invalid value "{value}"']
+                continue
+            lookups[key] = parsed
+
+        if errors:
+            raise ValidationError(errors)
+        return lookups
+
+    def filter_queryset(self, queryset):
+        return queryset.filter(**self.get_lookups())
+
+    def filter_objects(self, objects):
+        """ Те же фильтры для объектов в памяти (например, строк из архива) """
+
+        lookups = [(*key.rsplit('__', 1), expected) for key, expected in self.get_lookups().items()]
+        return (
+            obj for obj in objects
+            if all(match_lookup(getattr(obj, field), lookup, expected) for field, lookup, expected in lookups)
+        )
+
+
+class InventoryFilter(FilterSet):
+    filters = {
+        'id': Filter(int, ID_LOOKUPS),
+        'code': Filter(str, ID_LOOKUPS),
+        'name': Filter(str),
+        'group_id': Filter(int, ID_LOOKUPS + ('isnull',)),
+        'created_by_id': Filter(int, ID_LOOKUPS),
+        'total': Filter(int, NUMBER_LOOKUPS),
+        'remaining': Filter(int, NUMBER_LOOKUPS),
+        'price': Filter(float, NUMBER_LOOKUPS),
+        'created_at': Filter(parse_moment, DATE_LOOKUPS),
+    }
+
+
+class InventoryGroupFilter(FilterSet):
+    filters = {
+        'id': Filter(int, ID_LOOKUPS),
+        'name': Filter(str),
+        'belongs_to_id': Filter(int, ID_LOOKUPS + ('isnull',)),
+        'created_by_id': Filter(int, ID_LOOKUPS),
+        'created_at': Filter(parse_moment, DATE_LOOKUPS),
+    }
+
+
+class ShopFilter(FilterSet):
+    filters = {
+        'id': Filter(int, ID_LOOKUPS),
+        'name': Filter(str),
+        'created_by_id': Filter(int, ID_LOOKUPS),
+        'created_at': Filter(parse_moment, DATE_LOOKUPS),
+    }
+
+
+class InvoiceFilter(FilterSet):
+    filters = {
+        'id': Filter(int, ID_LOOKUPS),
+        'shop_id': Filter(int, ID_LOOKUPS + ('isnull',)),
+        'created_by_id': Filter(int, ID_LOOKUPS),
+        'created_at': Filter(parse_moment, DATE_LOOKUPS),
+    }
+
+
+class FilteredListMixin:
+    """
+    Фильтрация списка через filterset_class.
+
+    С настройкой FILTER_EXPLAIN (или параметром explain=1 в режиме DEBUG и для администраторов)
+    план выполнения отфильтрованного запроса пишется в лог и возвращается в заголовке X-Query-Plan.
+    """
+
+    filterset_class = FilterSet
+
+    def filter_list_queryset(self, queryset):
+        return self.filterset_class(self.request.query_params).filter_queryset(queryset)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        self.explain_queryset(queryset)
+        return queryset
+
+    def explain_queryset(self, queryset):
+        if not self.explain_enabled():
+            return
+        plan = queryset.explain()
+        filters = sorted(
+            param for param in self.request.query_params
+            if param not in self.filterset_class.reserved_params
+        )
+        logger.info(
+            'Query plan for %s filters=%s:\n%s', self.request.path, ','.join(filters), plan
+        )
+        self.query_plan = plan
+
+    def explain_enabled(self):
+        if getattr(self, 'action', None) != 'list':
+            return False
+        if settings.FILTER_EXPLAIN:
+            return True
+        if self.request.query_params.get('explain') != '1':
+            return False
+        user = self.request.user
+        return settings.DEBUG or getattr(user, 'role', None) == 'admin' or user.is_superuser
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        plan = getattr(self, 'query_plan', None)
+        if plan:
+            response['X-Query-Plan'] = ' | '.join(line.strip() for line in plan.splitlines())
+        return response
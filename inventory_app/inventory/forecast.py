@@ -0,0 +1,194 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .filters import parse_bool
+from .models import Inventory
+from .reports import ALL_DAYS, daily_sales
+
+
+MOVING_AVERAGE_WINDOWS = (7, 30)
+# Окно скользящего среднего, по которому прогнозируется спрос
+DEMAND_WINDOW = 30
+
+
+def _fetch_columns(sql, params, using, *dtypes):
+    """
+    Результат запроса по колонкам в массивы NumPy. Запрос выполняется курсором напрямую:
+    конвертеры Django (например, строки дат SQLite в date) не вызываются для каждой строки.
+    """
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    if not rows:
+        return [np.empty(0, dtype=dtype) for dtype in dtypes]
+    return [np.array(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes)]
+
+
+class SalesForecast:
+    """
+    Скорость продаж и точка заказа для всего инвентаря.
+
+    История продаж за history_days дней (по сегодняшний день включительно) сворачивается
+    одним запросом к дневным итогам DailySales до строки на инвентарь, остатки читаются
+    одним запросом из Inventory. Дальше все считается векторно по массивам:
+
+    - velocity - средние продажи в день с первого дня продаж в окне истории;
+    - moving_average_7 / moving_average_30 - средние продажи в день за последние 7 / 30 дней;
+    - спрос (прогноз продаж в день) - скользящее среднее за DEMAND_WINDOW дней;
+    - days_of_stock - на сколько дней хватит остатка при таком спросе (None без спроса);
+    - reorder_point - остаток, при котором нужно заказывать:
+      спрос за lead_time дней + safety_factor * стандартное отклонение дневных продаж * sqrt(lead_time);
+    - reorder - остаток не больше точки заказа.
+    """
+
+    def __init__(self, history_days, lead_time, safety_factor, today=None):
+        self.history_days = history_days
+        self.lead_time = lead_time
+        self.safety_factor = safety_factor
+        self.today = today or timezone.localdate()
+        self.start = self.today - timedelta(days=history_days - 1)
+
+    @classmethod
+    def from_params(cls, data, default_limit=100):
+        """
+        Прогноз и параметры rows() из параметров запроса: days, lead_time, safety_factor,
+        reorder_only, limit (0 - без ограничения)
+        """
+
+        try:
+            history_days = int(data.get('days', settings.FORECAST_HISTORY_DAYS))
+            lead_time = float(data.get('lead_time', settings.FORECAST_LEAD_TIME_DAYS))
+            safety_factor = float(data.get('safety_factor', settings.FORECAST_SAFETY_FACTOR))
+            limit = int(data.get('limit', default_limit))
+        except (TypeError, ValueError):
+            raise ValidationError('days, lead_time, safety_factor and limit must be numbers')
+        try:
+            # В параметрах запроса строка ('1', 'false'), в задаче из JSON - еще и bool
+            reorder_only = parse_bool(str(data.get('reorder_only', False)))
+        except ValueError:
+            raise ValidationError({'reorder_only': 'Must be one of: 1, 0, true, false'})
+        if not 1 <= history_days <= settings.FORECAST_MAX_HISTORY_DAYS:
+            raise ValidationError(f'days must be between 1 and {settings.FORECAST_MAX_HISTORY_DAYS}')
+        if lead_time < 0 or safety_factor < 0 or limit < 0:
+            raise ValidationError('lead_time, safety_factor and limit cannot be negative')
+
+        forecast = cls(history_days, lead_time, safety_factor)
+        return forecast, {'reorder_only': reorder_only, 'limit': limit or None}
+
+    def sales_per_item(self):
+        """
+        Итоги по инвентарю одним запросом: сначала продажи суммируются по дням (по всем
+        магазинам), затем по инвентарю - сумма, сумма квадратов дневных продаж, первый день
+        продаж и суммы за последние дни для каждого окна скользящего среднего.
+        """
+
+        # Только нижняя граница: дней позже сегодняшнего в итогах нет, а с диапазоном по day
+        # SQLite без статистики выбирает уникальный индекс (day, shop, item) вместо (item, day)
+        daily = daily_sales(ALL_DAYS, item__isnull=False, day__gte=self.start).values(
+            'item_id', 'day'
+        ).annotate(total=Sum('quantity')).order_by()
+        connection = connections[daily.db]
+        inner_sql, inner_params = daily.query.sql_with_params()
+        window_sums = ''.join(
+            ', SUM(CASE WHEN day >= %s THEN total ELSE 0 END)' for _ in MOVING_AVERAGE_WINDOWS
+        )
+        window_params = [
+            connection.ops.adapt_datefield_value(self.today - timedelta(days=window - 1))
+            for window in MOVING_AVERAGE_WINDOWS
+        ]
+        sql = (
+            f'SELECT item_id, SUM(total), SUM(total * total), MIN(day){window_sums} '
+            f'FROM ({inner_sql}) daily GROUP BY item_id'
+        )
+        return _fetch_columns(
+            sql, (*window_params, *inner_params), daily.db,
+            np.int64, np.float64, np.float64, 'datetime64[D]', *(np.float64 for _ in MOVING_AVERAGE_WINDOWS)
+        )
+
+    def compute(self):
+        items = Inventory.objects.order_by('id').values_list('id', 'remaining')
+        ids, remaining = _fetch_columns(*items.query.sql_with_params(), items.db, np.int64, np.float64)
+        remaining = np.nan_to_num(remaining)
+        sale_items, totals, squares, first_days, *window_totals = self.sales_per_item()
+
+        size = len(ids)
+        # Позиции инвентаря для строк итогов (ids отсортированы), удаленный инвентарь отбрасываем
+        positions = np.minimum(np.searchsorted(ids, sale_items), max(size - 1, 0))
+        known = ids[positions] == sale_items if size else np.zeros(len(sale_items), dtype=bool)
+        positions = positions[known]
+
+        def per_item(values, fill=0):
+            result = np.full(size, fill, dtype=values.dtype)
+            result[positions] = values[known]
+            return result
+
+        # Дни в окне с первой продажи: товар, который начали продавать недавно, не занижает скорость
+        first_day = per_item((first_days - np.datetime64(self.start, 'D')).astype(np.int64), self.history_days)
+        active_days = np.maximum(self.history_days - first_day, 1)
+
+        velocity = per_item(totals) / active_days
+        averages = {
+            window: per_item(window_total) / np.minimum(window, active_days)
+            for window, window_total in zip(MOVING_AVERAGE_WINDOWS, window_totals)
+        }
+
+        # Дисперсия дневных продаж с учетом дней без продаж
+        variance = np.maximum(per_item(squares) / active_days - velocity ** 2, 0)
+        demand = averages[DEMAND_WINDOW]
+        reorder_point = np.ceil(
+            demand * self.lead_time + self.safety_factor * np.sqrt(variance * self.lead_time)
+        )
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days_of_stock = np.where(demand > 0, remaining / demand, np.inf)
+
+        return {
+            'id': ids,
+            'remaining': remaining,
+            'velocity': velocity,
+            'moving_average_7': averages[7],
+            'moving_average_30': averages[30],
+            'days_of_stock': days_of_stock,
+            'reorder_point': reorder_point,
+            'reorder': (remaining <= reorder_point) & (demand > 0),
+        }
+
+    def rows(self, reorder_only=False, limit=None):
+        """ Строки отчета от самых срочных (меньше всего дней остатка), с кодом и названием """
+
+        result = self.compute()
+        selected = np.flatnonzero(result['reorder']) if reorder_only else np.arange(len(result['id']))
+        selected = selected[np.lexsort((result['id'][selected], result['days_of_stock'][selected]))]
+        if limit is not None:
+            selected = selected[:limit]
+
+        names = Inventory.objects.all()
+        # Большую выборку проще прочитать целиком, чем передавать десятки тысяч id параметрами
+        max_query_params = connections[names.db].features.max_query_params
+        if max_query_params is None or len(selected) <= max_query_params:
+            names = names.filter(id__in=result['id'][selected].tolist())
+        names = {pk: (code, name) for pk, code, name in names.values_list('id', 'code', 'name')}
+        rows = []
+        for index in selected.tolist():
+            pk = int(result['id'][index])
+            code, name = names.get(pk, (None, None))
+            days_of_stock = result['days_of_stock'][index]
+            rows.append({
+                'id': pk,
+                'code': code,
+                'name': name,
+                'remaining': int(result['remaining'][index]),
+                'velocity': round(float(result['velocity'][index]), 3),
+                'moving_average_7': round(float(result['moving_average_7'][index]), 3),
+                'moving_average_30': round(float(result['moving_average_30'][index]), 3),
+                'days_of_stock': None if np.isinf(days_of_stock) else round(float(days_of_stock), 1),
+                'reorder_point': int(result['reorder_point'][index]),
+                'reorder': bool(result['reorder'][index]),
+            })
+        return rows
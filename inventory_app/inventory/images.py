@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections
+from django.utils.deconstruct import deconstructible
+from PIL import Image, ImageOps
+
+from my_user.cache import bump_versions
+
+
+logger = logging.getLogger(__name__)
+
+# Размеры вписываются в квадрат, от большего к меньшему: меньшая копия строится из большей
+RENDITIONS = {
+    'preview': (800, 800),
+    'thumbnail': (200, 200),
+}
+RENDITION_QUALITY = 85
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файлы хранятся по sha256 содержимого: <каталог upload_to>/ab/cd/<sha256>.<расширение>.
+    Одинаковые изображения записываются один раз, повторная загрузка возвращает готовое имя.
+    """
+
+    chunk_size = 64 * 1024
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(self.chunk_size):
+            digest.update(chunk)
+        content.seek(0)
+
+        digest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(name), digest[:2], digest[2:4], digest + extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def save_derived(self, name, content):
+        """ Файл, производный от сохраненного (копия изображения), пишется под заданным именем """
+
+        saved = super().save(name, content)
+        if saved != name:
+            # Тот же файл уже записал другой процесс: копии одинаковые, дубль не нужен
+            self.delete(saved)
+        return name
+
+
+image_storage = ContentAddressedStorage()
+
+
+def rendition_name(image_name, rendition):
+    """ Копии лежат рядом с оригиналом, поэтому у одинаковых изображений они тоже общие """
+
+    return f'{posixpath.splitext(image_name)[0]}.{rendition}.jpg'
+
+
+# Одно изображение могут загрузить к нескольким товарам сразу: его копии строит один поток
+_build_locks = [threading.Lock() for _ in range(64)]
+
+
+def build_renditions(storage, image_name):
+    """ Создает недостающие копии изображения, возвращает {название копии: имя файла} """
+
+    with _build_locks[hash(image_name) % len(_build_locks)]:
+        return _build_renditions(storage, image_name)
+
+
+def _build_renditions(storage, image_name):
+    names = {rendition: rendition_name(image_name, rendition) for rendition in RENDITIONS}
+    missing = [rendition for rendition, name in names.items() if not storage.exists(name)]
+    if not missing:
+        return names
+
+    with storage.open(image_name) as file:
+        image = Image.open(file)
+        # JPEG декодируется сразу в уменьшенном размере, если это возможно
+        image.draft('RGB', RENDITIONS[missing[0]])
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        for rendition in missing:
+            image.thumbnail(RENDITIONS[rendition])
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=RENDITION_QUALITY, optimize=True)
+            names[rendition] = storage.save_derived(names[rendition], ContentFile(buffer.getvalue()))
+    return names
+
+
+def process_image(model, pk, image_name):
+    """ Строит копии изображения и записывает их в image_renditions, если изображение не сменилось """
+
+    try:
+        field = model._meta.get_field('image')
+        renditions = build_renditions(field.storage, image_name)
+        # Изображение могли заменить, пока строились копии
+        if model._base_manager.filter(pk=pk, image=image_name).update(image_renditions=renditions):
+            bump_versions(model._meta.model_name)
+    except Exception:
+        logger.exception('Failed to build renditions for %s %s (%s)', model._meta.label, pk, image_name)
+
+
+def _process_in_worker(model, pk, image_name):
+    """ Задача пула: у потока свое соединение с БД, закрываем его как после запроса """
+
+    try:
+        process_image(model, pk, image_name)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def schedule_renditions(model, pk, image_name):
+    """
+    Ставит построение копий в локальный пул потоков (IMAGE_RENDITION_WORKERS).
+    Вызывается после фиксации транзакции. При IMAGE_RENDITION_WORKERS=0 копии строятся сразу.
+    """
+
+    global _executor
+    if settings.IMAGE_RENDITION_WORKERS <= 0:
+        process_image(model, pk, image_name)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_RENDITION_WORKERS, thread_name_prefix='image-renditions'
+            )
+    _executor.submit(_process_in_worker, model, pk, image_name)
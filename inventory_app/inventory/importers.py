@@ -0,0 +1,190 @@
+import codecs
+import csv
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Inventory, InventoryGroup, CodeSequence, SearchDocument, INVENTORY_CODE_SEQUENCE
+from .serializers import InventorySerializer
+from .utils import format_inventory_code
+from my_user.cache import bump_versions
+from my_user.utils import add_user_activities_batch
+
+
+CSV_COLUMNS = ('group_id', 'total', 'name', 'price')
+
+
+def read_csv_rows(file, encoding='utf-8'):
+    """ Потоковое чтение CSV: отдаем номер строки и значения, пустые строки пропускаем """
+
+    csv_reader = csv.reader(codecs.iterdecode(file, encoding))
+    for row in csv_reader:
+        if not row or not row[0]:
+            continue
+        yield csv_reader.line_num, row
+
+
+def chunked(iterable, size):
+    """ Разбиваем итератор на списки по size элементов """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _plain_errors(detail):
+    """ Приводим ошибки DRF к обычным спискам/словарям строк, чтобы их можно было передать между процессами """
+
+    if isinstance(detail, dict):
+        return {key: _plain_errors(value) for key, value in detail.items()}
+    if isinstance(detail, (list, tuple)):
+        return [_plain_errors(value) for value in detail]
+    return str(detail)
+
+
+def validate_chunk(chunk, user_id):
+    """ Валидация пачки строк CSV. Возвращает валидные данные и ошибки по номерам строк """
+
+    serializer = InventorySerializer()
+    valid, errors = [], []
+    for line_number, row in chunk:
+        if len(row) < len(CSV_COLUMNS):
+            errors.append({
+                'row': line_number,
+                'errors': {'non_field_errors': [
+                    f'Expected {len(CSV_COLUMNS)} columns, got {len(row)}'
+                ]}
+            })
+            continue
+        try:
+            validated_data = serializer.run_validation(
+                {**dict(zip(CSV_COLUMNS, row)), 'created_by_id': user_id}
+            )
+        except serializers.ValidationError as e:
+            errors.append({
+                'row': line_number,
+                'errors': _plain_errors(serializers.as_serializer_error(e))
+            })
+            continue
+        valid.append((line_number, validated_data))
+    return valid, errors
+
+
+class InventoryCSVImporter:
+    """
+    Импорт инвентаря из CSV файла.
+
+    Файл читается потоково и обрабатывается пачками по chunk_size строк: каждая пачка
+    валидируется, получает блок кодов из счетчика и записывается через bulk_create,
+    активность пользователя пишется одним запросом на пачку. Невалидные строки
+    не прерывают импорт, а попадают в отчет об ошибках. Если workers > 0, валидация
+    пачек выполняется в пуле процессов.
+    """
+
+    max_errors = 1000
+
+    def __init__(self, user, chunk_size=None, workers=None, progress=None):
+        self.user = user
+        # Вызывается после записи каждой пачки (например, прогресс фоновой задачи)
+        self.progress = progress
+        self.chunk_size = chunk_size or settings.INVENTORY_IMPORT_CHUNK_SIZE
+        self.workers = settings.INVENTORY_IMPORT_WORKERS if workers is None else workers
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, file):
+        rows = read_csv_rows(file)
+        try:
+            if self.workers > 0:
+                self._run_in_pool(rows)
+            else:
+                for chunk in chunked(rows, self.chunk_size):
+                    self._write_chunk(*validate_chunk(chunk, self.user.id))
+        except csv.Error as e:
+            self._add_errors([{'row': None, 'errors': {'non_field_errors': [str(e)]}}])
+        return self.report()
+
+    def report(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+    def _run_in_pool(self, rows):
+        # spawn, а не fork: дочерние процессы не должны наследовать соединения с БД
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        )
+        pending = deque()
+        with executor:
+            for chunk in chunked(rows, self.chunk_size):
+                pending.append(executor.submit(validate_chunk, chunk, self.user.id))
+                # Ограничиваем очередь, чтобы не держать в памяти весь файл
+                if len(pending) >= self.workers * 2:
+                    self._write_chunk(*pending.popleft().result())
+            while pending:
+                self._write_chunk(*pending.popleft().result())
+
+    def _add_errors(self, errors):
+        self.failed += len(errors)
+        self.errors.extend(errors[:max(self.max_errors - len(self.errors), 0)])
+
+    def _write_chunk(self, valid, errors):
+        valid, group_errors = self._check_groups(valid)
+        self._add_errors(sorted(errors + group_errors, key=lambda error: error['row']))
+        if valid:
+            with transaction.atomic():
+                codes = CodeSequence.objects.reserve(INVENTORY_CODE_SEQUENCE, len(valid))
+                items = [
+                    Inventory(remaining=data['total'], code=format_inventory_code(code), **data)
+                    for (_, data), code in zip(valid, codes)
+                ]
+                Inventory.objects.bulk_create(items)
+                SearchDocument.objects.index(Inventory, [item.pk for item in items])
+                bump_versions('inventory')
+                add_user_activities_batch(self.user, [
+                    f'added new inventory item "{item.name}" with code "{item.code}"'
+                    for item in items
+                ])
+            self.created += len(items)
+        if self.progress is not None:
+            self.progress(self.created + self.failed)
+
+    @staticmethod
+    def _check_groups(valid):
+        """ Отбрасываем строки с несуществующими группами одним запросом на пачку """
+
+        group_ids = set()
+        for _, data in valid:
+            try:
+                data['group_id'] = int(data['group_id'])
+            except ValueError:
+                continue
+            group_ids.add(data['group_id'])
+        existing = set(
+            InventoryGroup.objects.filter(id__in=group_ids).values_list('id', flat=True)
+        )
+
+        checked, errors = [], []
+        for line_number, data in valid:
+            if data['group_id'] in existing:
+                checked.append((line_number, data))
+            else:
+                errors.append({
+                    'row': line_number,
+                    'errors': {'group_id': [f'Group with id {data["group_id"]} not found']}
+                })
+        return checked, errors
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from inventory.benchmark import bench_client, percentile
+
+
+ENDPOINTS = (
+    '/api/v1/summary',
+    '/api/v1/top-selling',
+    '/api/v1/sale-by-shop',
+    '/api/v1/purchase-summary',
+)
+MODES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность отчетов под WSGI (синхронные представления, потоки) '
+        'и ASGI (асинхронные представления, ASYNC_REPORT_VIEWS). Каждый режим запускается '
+        'в отдельном процессе, запросы идут через обработчики Django без сервера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=MODES, help='Прогнать только один режим в этом процессе')
+        parser.add_argument('--email', help='Пользователь для запросов (по умолчанию администратор)')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый адрес')
+        parser.add_argument('endpoints', nargs='*', default=ENDPOINTS)
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            with override_settings(RESPONSE_CACHE_TIMEOUT=0, SUMMARY_CACHE_TIMEOUT=0, ALLOWED_HOSTS=['*']):
+                results = self.run_mode(options)
+            self.stdout.write(json.dumps(results))
+            return
+
+        reports = {mode: self.spawn(mode, options) for mode in MODES}
+        for endpoint in options['endpoints']:
+            wsgi, asgi = reports['wsgi'][endpoint], reports['asgi'][endpoint]
+            self.stdout.write(
+                f'{endpoint}: wsgi {wsgi["rps"]:.1f} req/s (p95 {wsgi["p95_ms"]:.1f} ms), '
+                f'asgi {asgi["rps"]:.1f} req/s (p95 {asgi["p95_ms"]:.1f} ms), '
+                f'x{asgi["rps"] / wsgi["rps"]:.2f}'
+            )
+
+    def spawn(self, mode, options):
+        """ Режим задается при запуске процесса: представления выбираются при загрузке urls """
+
+        command = [
+            sys.executable, sys.argv[0], 'bench_deployments', '--mode', mode,
+            '--concurrency', str(options['concurrency']), '--requests', str(options['requests']),
+            *options['endpoints'],
+        ]
+        if options['email']:
+            command += ['--email', options['email']]
+        env = {**os.environ, 'ASYNC_REPORT_VIEWS': '1' if mode == 'asgi' else '0'}
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f'{mode} run failed:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def run_mode(self, options):
+        if (options['mode'] == 'asgi') != settings.ASYNC_REPORT_VIEWS:
+            raise CommandError('ASYNC_REPORT_VIEWS does not match --mode')
+        runner = self.run_asgi if options['mode'] == 'asgi' else self.run_wsgi
+        try:
+            headers = bench_client(options['email'], 'testserver').defaults
+        except Exception as e:
+            raise CommandError(str(e))
+
+        results = {}
+        for endpoint in options['endpoints']:
+            # Прогрев: соединения потоков, импорты, пул подзапросов
+            runner(endpoint, options['concurrency'], headers, options['concurrency'])
+            started = time.perf_counter()
+            timings = runner(endpoint, options['requests'], headers, options['concurrency'])
+            elapsed = time.perf_counter() - started
+            results[endpoint] = {
+                'rps': len(timings) / elapsed,
+                'p50_ms': percentile(timings, 50),
+                'p95_ms': percentile(timings, 95),
+            }
+        return results
+
+    def run_wsgi(self, endpoint, count, headers, concurrency):
+        def request(_):
+            # Клиент у каждого запроса свой, как у отдельных потоков сервера
+            started = time.perf_counter()
+            response = Client(raise_request_exception=False, **headers).get(endpoint)
+            if response.status_code != 200:
+                raise CommandError(f'{endpoint}: status {response.status_code}')
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(request, range(count)))
+
+    def run_asgi(self, endpoint, count, headers, concurrency):
+        token = headers['HTTP_AUTHORIZATION']
+
+        async def run():
+            client = AsyncClient(raise_request_exception=False)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request():
+                async with semaphore:
+                    started = time.perf_counter()
+                    # AsyncClient не берет HTTP_AUTHORIZATION из defaults, заголовок передаем так
+                    response = await client.get(endpoint, authorization=token)
+                    if response.status_code != 200:
+                        raise CommandError(f'{endpoint}: status {response.status_code}')
+                    return (time.perf_counter() - started) * 1000
+
+            return await asyncio.gather(*(request() for _ in range(count)))
+
+        return asyncio.run(run())
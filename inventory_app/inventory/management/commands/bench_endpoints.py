@@ -0,0 +1,141 @@
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from inventory import urls as inventory_urls
+from inventory.benchmark import bench_client, measure, router_endpoints
+from inventory.models import Inventory, InventoryGroup, Invoice, InvoiceItem, Shop
+from inventory.utils import count_many
+from my_user import urls as my_user_urls
+from my_user.models import CustomUser, UserActivities
+
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'queries', 'peak_kb')
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет GET запросы ко всем представлениям роутеров inventory и my_user в том же процессе '
+        'и выводит JSON с p50/p95 времени ответа, количеством запросов к БД и пиком памяти. '
+        'С --compare сравнивает результат с предыдущим прогоном'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Пользователь для запросов (по умолчанию администратор)')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', action='append', default=[], help='Только адреса с этой подстрокой')
+        parser.add_argument('--with-cache', action='store_true', help='Не отключать кэш ответов')
+        parser.add_argument('--output', help='Файл для результата (по умолчанию stdout)')
+        parser.add_argument('--compare', help='Результат предыдущего прогона для сравнения')
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='Рост p50/p95/памяти в процентах, который считается регрессией'
+        )
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive')
+
+        overrides = {'ALLOWED_HOSTS': [options['host']]}
+        if not options['with_cache']:
+            # Иначе измеряется кэш, а не сами представления
+            overrides.update(RESPONSE_CACHE_TIMEOUT=0, SUMMARY_CACHE_TIMEOUT=0)
+
+        with override_settings(**overrides):
+            try:
+                client = bench_client(options['email'], options['host'])
+            except Exception as e:
+                raise CommandError(str(e))
+
+            results = {}
+            for name, path in router_endpoints(inventory_urls.router, my_user_urls.router):
+                if options['only'] and not any(part in path for part in options['only']):
+                    continue
+                results[name] = measure(client, path, repeat=options['repeat'], warmup=options['warmup'])
+                self.stderr.write(
+                    f'{name}: {results[name]["status"]} p50 {results[name]["p50_ms"]} ms, '
+                    f'{results[name]["queries"]} queries'
+                )
+
+        report = {'meta': self.get_meta(options), 'endpoints': results}
+        output = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            # Если JSON уже в stdout, таблицу сравнения пишем в stderr
+            out = self.stdout if options['output'] else self.stderr
+            regressions = self.compare(baseline, report, options['threshold'], out)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Regressions: {", ".join(regressions)}')
+
+    def get_meta(self, options):
+        return {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'warmup': options['warmup'],
+            'response_cache': options['with_cache'],
+            'fast_list_views': settings.FAST_LIST_VIEWS,
+            'dataset': count_many(
+                users=CustomUser.objects.all(),
+                groups=InventoryGroup.objects.all(),
+                items=Inventory.objects.all(),
+                shops=Shop.objects.all(),
+                invoices=Invoice.objects.all(),
+                invoice_items=InvoiceItem.objects.all(),
+                activities=UserActivities.objects.all(),
+            ),
+        }
+
+    def compare(self, baseline, report, threshold, out):
+        """ Таблица изменений относительно baseline, возвращает список регрессий """
+
+        if baseline['meta'].get('dataset') != report['meta']['dataset']:
+            out.write(self.style.WARNING('Datasets differ, comparison may be meaningless'))
+
+        regressions = []
+        for name, current in sorted(report['endpoints'].items()):
+            previous = baseline['endpoints'].get(name)
+            if previous is None:
+                out.write(f'{name}: new endpoint')
+                continue
+
+            changes = []
+            for metric in COMPARED_METRICS:
+                before, after = previous[metric], current[metric]
+                if metric == 'queries':
+                    regressed = after > before
+                    change = f'{metric} {before} -> {after}'
+                else:
+                    delta = (after - before) / before * 100 if before else 0
+                    regressed = delta > threshold
+                    change = f'{metric} {before} -> {after} ({delta:+.0f}%)'
+                if regressed:
+                    regressions.append(f'{name} {metric}')
+                    change = self.style.ERROR(change)
+                changes.append(change)
+            if previous['status'] != current['status']:
+                regressions.append(f'{name} status')
+                changes.append(self.style.ERROR(f'status {previous["status"]} -> {current["status"]}'))
+            out.write(f'{name}: {", ".join(changes)}')
+
+        for name in sorted(baseline['endpoints'].keys() - report['endpoints'].keys()):
+            out.write(f'{name}: missing')
+        return regressions
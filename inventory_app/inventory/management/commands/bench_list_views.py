@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from inventory.benchmark import QueryCounter, bench_client
+
+
+ENDPOINTS = (
+    '/api/v1/inventory',
+    '/api/v1/invoice',
+    '/api/v1/shop',
+    '/api/v1/user/users-activities',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает списки через ModelSerializer и быстрый путь (FAST_LIST_VIEWS): '
+        'время ответа, количество запросов и совпадение тел ответов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Пользователь для запросов (по умолчанию администратор)')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('endpoints', nargs='*', default=ENDPOINTS)
+
+    def handle(self, *args, **options):
+        params = {'cursor': '', 'page_size': options['page_size']}
+
+        # Кэш ответов отключаем, иначе измеряется он, а не сериализация
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0, ALLOWED_HOSTS=[options['host']]):
+            try:
+                client = bench_client(options['email'], options['host'])
+            except Exception as e:
+                raise CommandError(str(e))
+            for endpoint in options['endpoints']:
+                slow = self.measure(client, endpoint, params, options['repeat'], fast=False)
+                fast = self.measure(client, endpoint, params, options['repeat'], fast=True)
+                if slow['content'] != fast['content']:
+                    raise CommandError(f'{endpoint}: fast list response differs from serializer')
+                self.stdout.write(
+                    f'{endpoint}: serializer {slow["median"]:.1f} ms / {slow["queries"]} queries, '
+                    f'fast {fast["median"]:.1f} ms / {fast["queries"]} queries, '
+                    f'x{slow["median"] / fast["median"]:.1f}, {len(fast["content"])} bytes'
+                )
+
+    def measure(self, client, endpoint, params, repeat, fast):
+        timings = []
+        with override_settings(FAST_LIST_VIEWS=fast):
+            for _ in range(repeat):
+                started = time.perf_counter()
+                response = client.get(endpoint, params)
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{endpoint}: status {response.status_code}')
+            with QueryCounter() as queries:
+                client.get(endpoint, params)
+        return {
+            'median': statistics.median(timings),
+            'queries': queries.count,
+            'content': response.content,
+        }
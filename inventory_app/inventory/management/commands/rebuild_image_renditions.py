@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from inventory.images import process_image
+from inventory.models import Inventory
+
+
+class Command(BaseCommand):
+    help = 'Строит копии изображений инвентаря (миниатюра, превью), по умолчанию только недостающие'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Проверить копии у всего инвентаря с изображением')
+
+    def handle(self, *args, **options):
+        queryset = Inventory.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            queryset = queryset.filter(image_renditions={})
+
+        total = 0
+        for pk, image_name in queryset.order_by('id').values_list('id', 'image').iterator():
+            process_image(Inventory, pk, image_name)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Image renditions built for {total} items'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from inventory.models import DailySales
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу дневных продаж (DailySales) по всем позициям счетов'
+
+    def handle(self, *args, **options):
+        DailySales.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Daily sales rebuilt: {DailySales.objects.count()} rows'
+        ))
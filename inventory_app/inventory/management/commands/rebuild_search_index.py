@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from inventory.models import SearchDocument
+from inventory.search import FTS_TABLE, has_fts_table
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс (SearchDocument) для инвентаря, групп, магазинов и счетов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = SearchDocument.objects.rebuild()
+        if connection.vendor == 'sqlite' and has_fts_table(connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {total} documents'))
@@ -0,0 +1,228 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.importers import chunked
+from inventory.models import (
+    CodeSequence, DailySales, Inventory, InventoryGroup, Invoice, InvoiceItem, SearchDocument, Shop,
+    INVENTORY_CODE_SEQUENCE, group_path_segment, GROUP_PATH_STEP
+)
+from inventory.utils import format_inventory_code
+from my_user.cache import bump_versions
+from my_user.models import CustomUser, UserActivities, ROLES
+
+
+ACTIONS = (
+    'added new inventory item', 'updated inventory item', 'added new invoice', 'added new shop',
+    'added new group', 'updated group', 'deleted inventory item',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет БД синтетическими данными для нагрузочных тестов: пользователи, дерево групп, '
+        'инвентарь, магазины, счета с позициями и история активности. Данные вставляются '
+        'через bulk_create, при одинаковом --seed набор данных повторяется'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--group-roots', type=int, default=5)
+        parser.add_argument('--group-depth', type=int, default=4)
+        parser.add_argument('--items', type=int, default=5000)
+        parser.add_argument('--shops', type=int, default=20)
+        parser.add_argument('--invoices', type=int, default=10000)
+        parser.add_argument('--lines', type=int, default=5, help='Максимум позиций в счете')
+        parser.add_argument('--activities', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=90, help='Глубина истории в днях')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='seed', help='Префикс имен и почты объектов')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--clear', action='store_true', help='Удалить объекты, созданные раньше с тем же префиксом'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('At least one user is required')
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+            users = self.create_users(options['users'])
+            groups = self.create_groups(
+                users, options['groups'], options['group_roots'], options['group_depth']
+            )
+            shops = self.create_shops(users, options['shops'])
+            invoices = self.plan_invoices(options['invoices'], options['items'], options['lines'])
+            items = self.create_items(users, groups, options['items'], invoices)
+            self.create_invoices(users, shops, items, invoices)
+            activities = self.create_activities(users, options['activities'])
+
+            DailySales.objects.rebuild()
+            documents = SearchDocument.objects.rebuild()
+        bump_versions('inventory', 'group', 'shop', 'invoice', 'user')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(groups)} groups, {len(items)} items, {len(shops)} shops, '
+            f'{len(invoices)} invoices ({sum(len(lines) for lines in invoices)} lines), '
+            f'{activities} activities; {documents} search documents'
+        ))
+
+    def moment(self):
+        """ Случайный момент за последние days дней """
+
+        return self.now - timedelta(seconds=self.rng.randrange(self.days * 24 * 60 * 60))
+
+    def clear(self):
+        users = CustomUser.objects.filter(email__startswith=f'{self.prefix}.', email__endswith='@example.com')
+        UserActivities.objects.filter(user__in=users).delete()
+        Invoice.objects.filter(created_by__in=users).delete()
+        Inventory.objects.filter(created_by__in=users).delete()
+        InventoryGroup.objects.filter(created_by__in=users).delete()
+        Shop.objects.filter(created_by__in=users).delete()
+        users.delete()
+
+    def set_created_at(self, model, objects):
+        """ auto_now_add перезаписывает дату при вставке, поэтому историю проставляем отдельно """
+
+        for obj in objects:
+            obj.created_at = self.moment()
+        model.objects.bulk_update(objects, ['created_at'], batch_size=self.batch_size)
+
+    def create_users(self, count):
+        password = make_password(None)
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f'{self.prefix}.user{number}@example.com',
+                fullname=f'{self.prefix.title()} User {number}',
+                # Первый пользователь - администратор, от его имени удобно гонять бенчмарки
+                role='admin' if number == 0 else self.rng.choice(ROLES)[0],
+                password=password,
+            ) for number in range(count)
+        ], batch_size=self.batch_size)
+        return users
+
+    def create_groups(self, users, count, roots, max_depth):
+        # Родителем может быть любая уже созданная группа, у которой еще есть место для уровня
+        depths, parents, candidates = [], [], []
+        for number in range(count):
+            parent = None
+            if number >= roots and candidates:
+                parent = self.rng.choice(candidates)
+            parents.append(parent)
+            depths.append(0 if parent is None else depths[parent] + 1)
+            if depths[number] < max_depth - 1:
+                candidates.append(number)
+
+        # Вставляем по уровням, чтобы id родителей были известны до вставки детей
+        groups = [None] * count
+        for depth in range(max(depths, default=-1) + 1):
+            level = [number for number in range(count) if depths[number] == depth]
+            created = InventoryGroup.objects.bulk_create([
+                InventoryGroup(
+                    name=f'{self.prefix} group {number}',
+                    belongs_to=groups[parents[number]] if parents[number] is not None else None,
+                    created_by=self.rng.choice(users),
+                ) for number in level
+            ], batch_size=self.batch_size)
+            for number, group in zip(level, created):
+                parent_path = groups[parents[number]].path if parents[number] is not None else ''
+                group.path = parent_path + group_path_segment(group.pk)
+                group.depth = len(parent_path) // GROUP_PATH_STEP
+                groups[number] = group
+            InventoryGroup.objects.bulk_update(created, ['path', 'depth'], batch_size=self.batch_size)
+        self.set_created_at(InventoryGroup, groups)
+        return groups
+
+    def create_shops(self, users, count):
+        shops = Shop.objects.bulk_create([
+            Shop(name=f'{self.prefix} shop {number}', created_by=self.rng.choice(users))
+            for number in range(count)
+        ], batch_size=self.batch_size)
+        self.set_created_at(Shop, shops)
+        return shops
+
+    def plan_invoices(self, count, item_count, max_lines):
+        """ Позиции счетов: список [(номер инвентаря, количество), ...] на каждый счет """
+
+        if not item_count:
+            return [[] for _ in range(count)]
+        return [
+            [
+                (self.rng.randrange(item_count), self.rng.randint(1, 5))
+                for _ in range(self.rng.randint(1, max_lines))
+            ] for _ in range(count)
+        ]
+
+    def create_items(self, users, groups, count, invoices):
+        sold = [0] * count
+        for lines in invoices:
+            for number, quantity in lines:
+                sold[number] += quantity
+
+        codes = CodeSequence.objects.reserve(INVENTORY_CODE_SEQUENCE, count) if count else []
+        items = []
+        for number, code in enumerate(codes):
+            total = sold[number] + self.rng.randint(0, 500)
+            items.append(Inventory(
+                name=f'{self.prefix} item {number}',
+                code=format_inventory_code(code),
+                group=self.rng.choice(groups) if groups and self.rng.random() < 0.9 else None,
+                total=total,
+                remaining=total - sold[number],
+                price=round(self.rng.uniform(1, 1000), 2),
+                created_by=self.rng.choice(users),
+            ))
+        for chunk in chunked(items, self.batch_size):
+            Inventory.objects.bulk_create(chunk)
+        self.set_created_at(Inventory, items)
+        return items
+
+    def create_invoices(self, users, shops, items, invoices):
+        created = []
+        for chunk in chunked(invoices, self.batch_size):
+            objects = Invoice.objects.bulk_create([
+                Invoice(shop=self.rng.choice(shops) if shops else None, created_by=self.rng.choice(users))
+                for _ in chunk
+            ])
+            self.set_created_at(Invoice, objects)
+            created.extend(zip(objects, chunk))
+
+        lines = (
+            InvoiceItem(
+                invoice=invoice,
+                item=items[number],
+                item_name=items[number].name,
+                item_code=items[number].code,
+                quantity=quantity,
+                amount=quantity * items[number].price,
+            ) for invoice, invoice_lines in created for number, quantity in invoice_lines
+        )
+        for chunk in chunked(lines, self.batch_size):
+            InvoiceItem.objects.bulk_create(chunk)
+            # Позиция создается вместе со счетом
+            for line in chunk:
+                line.created_at = line.invoice.created_at
+            InvoiceItem.objects.bulk_update(chunk, ['created_at'])
+
+    def create_activities(self, users, count):
+        activities = (
+            UserActivities(
+                user=user, email=user.email, fullname=user.fullname,
+                action=self.rng.choice(ACTIONS), created_at=self.moment(),
+            ) for user in (self.rng.choice(users) for _ in range(count))
+        )
+        for chunk in chunked(activities, self.batch_size):
+            UserActivities.objects.bulk_create(chunk)
+        return count
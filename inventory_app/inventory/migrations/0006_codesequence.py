@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+INVENTORY_CODE_SEQUENCE = 'inventory_code'
+
+
+def seed_code_sequence(apps, schema_editor):
+    """ Продолжаем нумерацию с текущего максимального id: раньше код совпадал с id """
+
+    Inventory = apps.get_model('inventory', 'Inventory')
+    CodeSequence = apps.get_model('inventory', 'CodeSequence')
+    last_value = Inventory.objects.aggregate(last_value=Max('id'))['last_value'] or 0
+
+    CodeSequence.objects.create(name=INVENTORY_CODE_SEQUENCE, last_value=last_value)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {INVENTORY_CODE_SEQUENCE}_seq')
+        schema_editor.execute(
+            'SELECT setval(%s, %s, %s)',
+            [f'{INVENTORY_CODE_SEQUENCE}_seq', max(last_value, 1), last_value > 0]
+        )
+
+
+def drop_code_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {INVENTORY_CODE_SEQUENCE}_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_alter_inventory_options_alter_inventorygroup_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Code Sequence',
+                'verbose_name_plural': 'Code Sequences',
+            },
+        ),
+        migrations.RunPython(seed_code_sequence, drop_code_sequence),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def fill_daily_sales(apps, schema_editor):
+    InvoiceItem = apps.get_model('inventory', 'InvoiceItem')
+    DailySales = apps.get_model('inventory', 'DailySales')
+
+    rows = InvoiceItem.objects.filter(
+        invoice__shop__isnull=False, item__isnull=False
+    ).values(
+        'item_id', day=TruncDate('invoice__created_at'), shop=F('invoice__shop_id')
+    ).annotate(
+        total_quantity=Sum('quantity'),
+        total_amount=Coalesce(Sum('amount'), 0.0),
+        total_quantity_amount=Coalesce(Sum(F('quantity') * F('amount')), 0.0),
+    ).order_by()
+
+    DailySales.objects.bulk_create([
+        DailySales(
+            day=row['day'],
+            shop_id=row['shop'],
+            item_id=row['item_id'],
+            quantity=row['total_quantity'],
+            amount=row['total_amount'],
+            quantity_amount=row['total_quantity_amount'],
+        ) for row in rows.iterator()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_codesequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('quantity_amount', models.FloatField(default=0)),
+                ('item', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='inventory.inventory')),
+                ('shop', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='inventory.shop')),
+            ],
+            options={
+                'verbose_name': 'Daily Sales',
+                'verbose_name_plural': 'Daily Sales',
+                'ordering': ('-day',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailysales',
+            index=models.Index(fields=['item', 'day'], name='inventory_d_item_id_aa3320_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysales',
+            index=models.Index(fields=['shop', 'day'], name='inventory_d_shop_id_61719d_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('day', 'shop', 'item'), name='unique_daily_sales'),
+        ),
+        migrations.RunPython(fill_daily_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['created_at', 'id'], name='inventory_i_created_16f572_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_at', 'id'], name='inventory_i_created_5d82b7_idx'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:51
+
+import re
+
+from django.db import migrations, models
+
+
+# Поля поискового текста на момент миграции, дальше индекс поддерживают модели
+SEARCH_FIELDS = {
+    'Inventory': ('code', 'created_by__fullname', 'created_by__email', 'group__name', 'name'),
+    'InventoryGroup': ('created_by__fullname', 'created_by__email', 'name'),
+    'Shop': ('created_by__fullname', 'created_by__email', 'name'),
+    'Invoice': ('created_by__fullname', 'created_by__email', 'shop__name'),
+}
+
+FTS_TABLE = 'inventory_searchdocument_fts'
+
+
+def create_search_index(apps, schema_editor):
+    """ Полнотекстовый индекс под СУБД и заполнение документов для существующих объектов """
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX inventory_searchdocument_body_fts ON inventory_searchdocument "
+            "USING GIN (to_tsvector('simple', body))"
+        )
+    elif vendor == 'sqlite' and has_fts5(schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"body, content='inventory_searchdocument', content_rowid='id')"
+        )
+        # Внешняя таблица FTS5 синхронизируется с документами триггерами
+        schema_editor.execute(
+            f"CREATE TRIGGER inventory_searchdocument_ai AFTER INSERT ON inventory_searchdocument BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER inventory_searchdocument_ad AFTER DELETE ON inventory_searchdocument BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER inventory_searchdocument_au AFTER UPDATE ON inventory_searchdocument BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.id, old.body); "
+            f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.id, new.body); END"
+        )
+
+    SearchDocument = apps.get_model('inventory', 'SearchDocument')
+    for model_name, fields in SEARCH_FIELDS.items():
+        model = apps.get_model('inventory', model_name)
+        SearchDocument.objects.bulk_create((
+            SearchDocument(
+                object_type=model._meta.model_name,
+                object_id=pk,
+                body=' '.join(
+                    token for value in values if value is not None
+                    for token in re.findall(r'\w+', str(value).lower())
+                )
+            )
+            for pk, *values in model.objects.order_by().values_list('pk', *fields).iterator()
+        ), batch_size=1000)
+
+
+def has_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS inventory_searchdocument_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField()),
+                ('body', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'Search Document',
+                'verbose_name_plural': 'Search Documents',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('object_type', 'object_id'), name='unique_search_document'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['group', 'created_at'], name='inventory_i_group_i_64a915_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['created_by', 'created_at'], name='inventory_i_created_2ea8af_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['name'], name='inventory_i_name_43f130_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorygroup',
+            index=models.Index(fields=['belongs_to', 'created_at'], name='inventory_i_belongs_a2803b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorygroup',
+            index=models.Index(fields=['created_by', 'created_at'], name='inventory_i_created_c00a26_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['shop', 'created_at'], name='inventory_i_shop_id_200ce6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_by', 'created_at'], name='inventory_i_created_7ee09f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['created_by', 'created_at'], name='inventory_s_created_31d7a9_idx'),
+        ),
+    ]
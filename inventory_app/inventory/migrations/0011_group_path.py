@@ -0,0 +1,51 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:54
+
+from django.db import migrations, models
+
+
+def fill_group_paths(apps, schema_editor):
+    """ Пути групп по текущим связям belongs_to, циклы разрываем, делая группу корневой """
+
+    InventoryGroup = apps.get_model('inventory', 'InventoryGroup')
+    parents = dict(InventoryGroup.objects.values_list('id', 'belongs_to_id'))
+    paths = {}
+
+    def get_path(group_id, visiting=()):
+        if group_id not in paths:
+            parent_id = parents[group_id]
+            prefix = ''
+            if parent_id is not None and parent_id in parents and parent_id not in visiting:
+                prefix = get_path(parent_id, visiting + (group_id,))
+            paths[group_id] = prefix + f'{group_id:010d}/'
+        return paths[group_id]
+
+    groups = list(InventoryGroup.objects.only('id'))
+    for group in groups:
+        group.path = get_path(group.id)
+        group.depth = group.path.count('/') - 1
+    InventoryGroup.objects.bulk_update(groups, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorygroup',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='inventorygroup',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=1100),
+        ),
+        migrations.AddIndex(
+            model_name='inventorygroup',
+            index=models.Index(fields=['path'], name='inventory_group_path_idx', opclasses=('varchar_pattern_ops',)),
+        ),
+        migrations.RunPython(fill_group_paths, migrations.RunPython.noop),
+    ]
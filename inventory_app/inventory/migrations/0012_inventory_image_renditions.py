@@ -0,0 +1,24 @@
+# Generated by Django 4.0.5 on 2026-10-17 12:24
+
+from django.db import migrations, models
+import inventory.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_group_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='inventory',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=inventory.images.ContentAddressedStorage(), upload_to='inventory_image/'),
+        ),
+    ]
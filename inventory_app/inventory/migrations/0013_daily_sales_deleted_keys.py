@@ -0,0 +1,48 @@
+# Generated by Django 4.0.5 on 2026-10-17 13:06
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def merge_deleted_keys(apps, schema_editor):
+    """ Строки, у которых SET_NULL обнулил магазин или инвентарь, сливаются в одну на ключ """
+
+    DailySales = apps.get_model('inventory', 'DailySales')
+    rows = DailySales.objects.using(schema_editor.connection.alias).filter(
+        Q(shop__isnull=True) | Q(item__isnull=True)
+    ).order_by('id')
+    merged = {}
+    for row in rows:
+        key = (row.day, row.shop_id, row.item_id)
+        kept = merged.get(key)
+        if kept is None:
+            merged[key] = row
+            continue
+        kept.quantity += row.quantity
+        kept.amount += row.amount
+        kept.quantity_amount += row.quantity_amount
+        kept.save(update_fields=('quantity', 'amount', 'quantity_amount'))
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_inventory_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_deleted_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(condition=models.Q(('item__isnull', False), ('shop__isnull', True)), fields=('day', 'item'), name='unique_daily_sales_without_shop'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(condition=models.Q(('item__isnull', True), ('shop__isnull', False)), fields=('day', 'shop'), name='unique_daily_sales_without_item'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(condition=models.Q(('item__isnull', True), ('shop__isnull', True)), fields=('day',), name='unique_daily_sales_without_shop_and_item'),
+        ),
+    ]
@@ -1,11 +1,96 @@
-from django.db import models
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Concat, Substr, TruncDate
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 from my_user.models import CustomUser
+from my_user.cache import bump_versions
 from my_user.utils import add_user_activities
+from .images import image_storage, schedule_renditions
+from .utils import format_inventory_code, search_tokens
+
+
+GROUP_PATH_STEP = 11
+
+
+def group_path_segment(pk):
+    """ Звено пути группы: id, дополненный нулями до 10 знаков, и разделитель """
+
+    return f'{pk:010d}/'
+
+
+def group_path_ids(path):
+    return [int(segment) for segment in path.split('/') if segment]
+
+
+class InventoryGroupQuerySet(models.QuerySet):
+
+    def subtree(self, path):
+        """ Группа с путем path и все ее потомки по индексу path """
+
+        # В PostgreSQL сравнение строк зависит от правил сортировки, поэтому LIKE по
+        # индексу varchar_pattern_ops, в остальных СУБД - диапазон ('0'-'9' и '/' меньше ':')
+        if connections[self.db].vendor == 'postgresql':
+            return self.filter(path__startswith=path)
+        return self.filter(path__gte=path, path__lt=path + ':')
+
+
+class InventoryGroupManager(models.Manager.from_queryset(InventoryGroupQuerySet)):
+
+    def ancestors_in_bulk(self, groups):
+        """ Все предки групп одним запросом: {id: группа} """
+
+        ids = {pk for group in groups for pk in group_path_ids(group.path)[:-1]}
+        return self.select_related('created_by').in_bulk(ids) if ids else {}
+
+    def tree(self, root=None):
+        """
+        Дерево групп (все корни или поддерево root) со вложенными children.
+        items - количество инвентаря в самой группе, total_items - во всем поддереве,
+        количество считается одним сгруппированным запросом.
+        """
+
+        groups = self.all() if root is None else self.subtree(root.path)
+        rows = sorted(groups.values('id', 'name', 'depth', 'path'), key=lambda row: row['path'])
+        counts = dict(
+            Inventory.objects.filter(group__in=groups.values('pk')).values('group_id').annotate(
+                items=models.Count('id')
+            ).order_by().values_list('group_id', 'items')
+        )
+
+        nodes, roots = {}, []
+        for row in rows:
+            path = row.pop('path')
+            node = nodes[row['id']] = {
+                **row, 'items': counts.get(row['id'], 0), 'total_items': 0, 'children': []
+            }
+            parent_ids = group_path_ids(path)[:-1]
+            parent = nodes.get(parent_ids[-1]) if parent_ids else None
+            (parent['children'] if parent else roots).append(node)
+
+        # Путь родителя - префикс пути потомка, поэтому в обратном порядке потомки идут раньше
+        for row in reversed(rows):
+            node = nodes[row['id']]
+            node['total_items'] = node['items'] + sum(
+                child['total_items'] for child in node['children']
+            )
+        return roots
 
 
 class InventoryGroup(models.Model):
-    """ Модель групп инвентаря """
+    """
+    Модель групп инвентаря.
+
+    path - материализованный путь от корня до группы (id предков и самой группы,
+    см. group_path_segment), depth - глубина, у корневой группы 0. Путь пересчитывается
+    при сохранении, перенос группы обновляет все поддерево одним запросом.
+    """
 
     created_by = models.ForeignKey(
         CustomUser, null=True, related_name='inventory_groups', on_delete=models.SET_NULL
@@ -14,35 +99,172 @@ class InventoryGroup(models.Model):
     belongs_to = models.ForeignKey(
         'self', blank=True, null=True, related_name='group_relations', on_delete=models.SET_NULL
     )
+    path = models.CharField(max_length=1100, default='', editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    search_fields = ('created_by__fullname', 'created_by__email', 'name')
+
+    objects = InventoryGroupManager()
+
     class Meta:
         ordering = ('-created_at',)
         verbose_name = 'Inventory Group'
         verbose_name_plural = 'Inventory Groups'
+        indexes = [
+            models.Index(fields=('belongs_to', 'created_at')),
+            models.Index(fields=('created_by', 'created_at')),
+            models.Index(fields=('path',), name='inventory_group_path_idx', opclasses=('varchar_pattern_ops',)),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.old_name = self.name
+        # Без обращения к отложенному полю, чтобы only() не вызывал лишних запросов
+        self.old_name = self.__dict__.get('name')
+        self.old_belongs_to_id = self.__dict__.get('belongs_to_id')
 
     def save(self, *args, **kwargs):
         action = f'added new group - "{self.name}"'
-        if self.pk is not None:
+        is_new = self.pk is None
+        if not is_new:
             action = f'updated group from - "{self.old_name}" to "{self.name}"'
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            if not is_new:
+                # Группа могла быть перенесена после загрузки (сама или вместе с предком),
+                # берем текущие путь и родителя
+                current = InventoryGroup.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values_list('path', 'depth', 'belongs_to_id').first()
+                if current is not None:
+                    self.path, self.depth, current_parent_id = current
+                    if str(self.belongs_to_id) == str(self.old_belongs_to_id):
+                        # Родителя меняли не в этом экземпляре: остается текущий
+                        self.belongs_to_id = current_parent_id
+                    self.old_belongs_to_id = current_parent_id
+            parent_changed = is_new or str(self.belongs_to_id) != str(self.old_belongs_to_id)
+            if parent_changed:
+                parent_path = self.get_parent_path()
+            elif 'update_fields' not in kwargs:
+                # Путь и глубину меняет только move_subtree, обычное сохранение их не пишет
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in ('path', 'depth')
+                ]
+            super().save(*args, **kwargs)
+            if parent_changed:
+                self.move_subtree(parent_path)
+        SearchDocument.objects.index(InventoryGroup, [self.pk])
+        if self.old_name != self.name:
+            # Название группы входит в поисковый текст ее инвентаря
+            SearchDocument.objects.index_queryset(self.inventories.all())
+        bump_versions('group')
         add_user_activities(self.created_by, action=action)
 
     def delete(self, *args, **kwargs):
         created_by = self.created_by
         action = f'deleted group - "{self.name}"'
-        super().delete(*args, **kwargs)
+        group_id, inventories = self.pk, list(self.inventories.values_list('pk', flat=True))
+        with transaction.atomic():
+            super().delete(*args, **kwargs)
+            # Подгруппы удаленной группы становятся корневыми вместе со своими поддеревьями
+            if self.path:
+                InventoryGroup.objects.subtree(self.path).update(
+                    path=Substr('path', len(self.path) + 1),
+                    depth=F('depth') - (self.depth + 1)
+                )
+        SearchDocument.objects.remove(InventoryGroup, [group_id])
+        SearchDocument.objects.index(Inventory, inventories)
+        bump_versions('group')
         add_user_activities(created_by, action=action)
 
+    def get_parent_path(self):
+        if self.belongs_to_id is None:
+            return ''
+        parent_path = InventoryGroup.objects.filter(
+            pk=self.belongs_to_id
+        ).values_list('path', flat=True).first()
+        if parent_path is None:
+            raise Exception(f'Group with id {self.belongs_to_id} not found')
+        if self.path and parent_path.startswith(self.path):
+            raise Exception('Group cannot belong to itself or to its subgroup')
+        return parent_path
+
+    def move_subtree(self, parent_path):
+        """ Новый путь группы и ее поддерева под родителем с путем parent_path """
+
+        path = parent_path + group_path_segment(self.pk)
+        depth = len(parent_path) // GROUP_PATH_STEP
+        if self.path:
+            InventoryGroup.objects.subtree(self.path).update(
+                path=Concat(Value(path), Substr('path', len(self.path) + 1)),
+                depth=F('depth') + (depth - self.depth)
+            )
+        else:
+            InventoryGroup.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        self.path, self.depth = path, depth
+        self.old_belongs_to_id = self.belongs_to_id
+
+    def get_ancestors(self):
+        return InventoryGroup.objects.filter(pk__in=group_path_ids(self.path)[:-1])
+
+    def get_descendants(self, include_self=False):
+        descendants = InventoryGroup.objects.subtree(self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
     def __str__(self):
         return self.name
 
 
+INVENTORY_CODE_SEQUENCE = 'inventory_code'
+
+
+class CodeSequenceManager(models.Manager):
+    """ Менеджер для резервирования номеров из счетчиков """
+
+    def reserve(self, name, count=1):
+        """
+        Резервирует count номеров и возвращает их списком.
+        На PostgreSQL используется нативная последовательность (`<name>_seq`), на остальных
+        базах - строка счетчика, которая сдвигается на весь блок одним UPDATE.
+        """
+
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(%s) FROM generate_series(1, %s)', [f'{name}_seq', count]
+                )
+                return [row[0] for row in cursor.fetchall()]
+
+        with transaction.atomic(using=self.db):
+            sequence = self.filter(name=name)
+            if not sequence.update(last_value=F('last_value') + count):
+                self.get_or_create(name=name)
+                sequence.update(last_value=F('last_value') + count)
+            last_value = sequence.values_list('last_value', flat=True).get()
+        return list(range(last_value - count + 1, last_value + 1))
+
+
+class CodeSequence(models.Model):
+    """ Модель счетчиков для выдачи кодов до вставки записей """
+
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    objects = CodeSequenceManager()
+
+    class Meta:
+        verbose_name = 'Code Sequence'
+        verbose_name_plural = 'Code Sequences'
+
+    def __str__(self):
+        return f'{self.name} - {self.last_value}'
+
+
 class Inventory(models.Model):
     """ Модель инвентаря """
 
@@ -50,7 +272,9 @@ class Inventory(models.Model):
         CustomUser, null=True, related_name='inventory_items', on_delete=models.SET_NULL
     )
     code = models.CharField(max_length=10, unique=True, null=True)
-    image = models.ImageField(upload_to='inventory_image/%Y/%m/%d/', blank=True, null=True)
+    image = models.ImageField(upload_to='inventory_image/', storage=image_storage, blank=True, null=True)
+    # {название копии: имя файла}, заполняется после запроса (см. inventory.images)
+    image_renditions = models.JSONField(default=dict, blank=True)
     group = models.ForeignKey(
         InventoryGroup, related_name='inventories', null=True, on_delete=models.SET_NULL
     )
@@ -61,24 +285,48 @@ class Inventory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    search_fields = ('code', 'created_by__fullname', 'created_by__email', 'group__name', 'name')
+
     class Meta:
         ordering = ('-created_at',)
         verbose_name = 'Inventory'
         verbose_name_plural = 'Inventories'
+        indexes = [
+            models.Index(fields=('created_at', 'id')),
+            models.Index(fields=('group', 'created_at')),
+            models.Index(fields=('created_by', 'created_at')),
+            models.Index(fields=('name',)),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # До обращения к дескриптору в __dict__ лежит имя файла, а не FieldFile
+        self.old_image = getattr(self.__dict__.get('image'), 'name', self.__dict__.get('image'))
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         if is_new:
             self.remaining = self.total
+            self.code = format_inventory_code(
+                CodeSequence.objects.reserve(INVENTORY_CODE_SEQUENCE)[0]
+            )
+
+        image_changed = 'image' in self.__dict__ and (
+            not self.image._committed or (self.image.name or None) != (self.old_image or None)
+        )
+        if image_changed:
+            self.image_renditions = {}
 
         super().save(*args, **kwargs)
+        SearchDocument.objects.index(Inventory, [self.pk])
+        bump_versions('inventory')
+
+        if image_changed:
+            self.old_image = self.image.name
+            if self.image:
+                pk, image_name = self.pk, self.image.name
+                transaction.on_commit(lambda: schedule_renditions(Inventory, pk, image_name))
 
-        if is_new:
-            id_length = len(str(self.id))
-            code_length = 6 - id_length
-            zeros = ''.join('0' for i in range(code_length))
-            self.code = f'{zeros}{self.id}'
-            self.save()
         action = f'added new inventory item "{self.name}" with code "{self.code}"'
 
         if not is_new:
@@ -88,7 +336,10 @@ class Inventory(models.Model):
     def delete(self, *args, **kwargs):
         created_by = self.created_by
         action = f'deleted inventory item "{self.name}" with code "{self.code}"'
+        inventory_id = self.pk
         super().delete(*args, **kwargs)
+        SearchDocument.objects.remove(Inventory, [inventory_id])
+        bump_versions('inventory')
         add_user_activities(created_by, action=action)
 
     def __str__(self):
@@ -105,26 +356,41 @@ class Shop(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    search_fields = ('created_by__fullname', 'created_by__email', 'name')
+
     class Meta:
         ordering = ('-created_at',)
         verbose_name = 'Shop'
         verbose_name_plural = 'Shops'
+        indexes = [
+            models.Index(fields=('created_by', 'created_at')),
+        ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.old_name = self.name
+        # Без обращения к отложенному полю, чтобы only() не вызывал лишних запросов
+        self.old_name = self.__dict__.get('name')
 
     def save(self, *args, **kwargs):
         action = f'added new shop - "{self.name}"'
         if self.pk is not None:
             action = f'updated shop from - "{self.old_name}" to "{self.name}"'
         super().save(*args, **kwargs)
+        SearchDocument.objects.index(Shop, [self.pk])
+        if self.old_name != self.name:
+            # Название магазина входит в поисковый текст его счетов
+            SearchDocument.objects.index_queryset(self.sale_shop.all())
+        bump_versions('shop')
         add_user_activities(self.created_by, action=action)
 
     def delete(self, *args, **kwargs):
         created_by = self.created_by
         action = f'deleted shop - "{self.name}"'
+        shop_id, invoices = self.pk, list(self.sale_shop.values_list('pk', flat=True))
         super().delete(*args, **kwargs)
+        SearchDocument.objects.remove(Shop, [shop_id])
+        SearchDocument.objects.index(Invoice, invoices)
+        bump_versions('shop')
         add_user_activities(created_by, action=action)
 
     def __str__(self):
@@ -140,26 +406,117 @@ class Invoice(models.Model):
     shop = models.ForeignKey(Shop, related_name='sale_shop', null=True, on_delete=models.SET_NULL)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    search_fields = ('created_by__fullname', 'created_by__email', 'shop__name')
+
     class Meta:
         ordering = ('-created_at',)
         verbose_name = 'Invoice'
         verbose_name_plural = 'Invoices'
+        indexes = [
+            models.Index(fields=('created_at', 'id')),
+            models.Index(fields=('shop', 'created_at')),
+            models.Index(fields=('created_by', 'created_at')),
+        ]
 
     def save(self, *args, **kwargs):
         action = f'added new invoice'
         super().save(*args, **kwargs)
+        SearchDocument.objects.index(Invoice, [self.pk])
+        bump_versions('invoice')
         add_user_activities(self.created_by, action=action)
 
     def delete(self, *args, **kwargs):
         created_by = self.created_by
         action = f'deleted invoice - "{self.id}"'
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            DailySales.objects.record(self.invoice_items.all(), sign=-1)
+            invoice_id = self.pk
+            super().delete(*args, **kwargs)
+            SearchDocument.objects.remove(Invoice, [invoice_id])
+            bump_versions('invoice')
         add_user_activities(created_by, action=action)
 
     def __str__(self):
         return f'{self.id} - {self.shop} - {self.created_at}'
 
 
+class InvoiceItemManager(models.Manager):
+    """ Менеджер инвентаря из счетов: списание остатков набором запросов фиксированной длины """
+
+    def lock_stock(self, item_ids):
+        """ Блокирует инвентарь одним SELECT ... FOR UPDATE, возвращает его по id """
+
+        return {
+            item.id: item for item in Inventory.objects.select_for_update().filter(
+                id__in=item_ids
+            ).order_by('id').only('id', 'name', 'code', 'price', 'remaining')
+        }
+
+    def take_stock(self, quantities, items=None):
+        """
+        Списывает остатки по словарю {id инвентаря: количество}.
+        Должен вызываться внутри transaction.atomic(): все позиции блокируются одним SELECT
+        (или уже заблокированы через lock_stock и переданы в items), остатки уменьшаются
+        одним условным UPDATE. Возвращает заблокированный инвентарь по id.
+        """
+
+        if items is None:
+            items = self.lock_stock(quantities.keys())
+        for item_id, quantity in quantities.items():
+            item = items.get(item_id)
+            if item is None:
+                raise Exception(f'Item with id {item_id} not found!')
+            if item.remaining < quantity:
+                raise Exception(f'Item with code {item.code} does not have enough quantity!')
+
+        updated = Inventory.objects.filter(reduce(or_, (
+            Q(id=item_id, remaining__gte=quantity) for item_id, quantity in quantities.items()
+        ))).update(
+            remaining=Case(
+                *(When(id=item_id, then=F('remaining') - quantity)
+                  for item_id, quantity in quantities.items()),
+                output_field=models.PositiveIntegerField()
+            ),
+            updated_at=timezone.now()
+        )
+        # Остатки могли измениться между SELECT и UPDATE там, где нет блокировки строк (SQLite)
+        if updated != len(quantities):
+            raise Exception('Some items do not have enough quantity!')
+
+        for item_id, quantity in quantities.items():
+            items[item_id].remaining -= quantity
+        return items
+
+    def create_for_invoice(self, invoice, invoice_item_data):
+        """ Списывает остатки и создает все позиции счета через bulk_create """
+
+        try:
+            lines = [(int(data['item_id']), data['quantity']) for data in invoice_item_data]
+        except ValueError:
+            raise Exception('Item id must be an integer!')
+
+        quantities = Counter()
+        for item_id, quantity in lines:
+            if quantity < 0:
+                raise Exception('Quantity cannot be negative!')
+            quantities[item_id] += quantity
+
+        items = self.take_stock(quantities)
+        invoice_items = self.bulk_create([
+            self.model(
+                invoice=invoice,
+                item=items[item_id],
+                item_name=items[item_id].name,
+                item_code=items[item_id].code,
+                quantity=quantity,
+                amount=quantity * items[item_id].price
+            ) for item_id, quantity in lines
+        ])
+        DailySales.objects.record(invoice_items)
+        bump_versions('inventory')
+        return invoice_items
+
+
 class InvoiceItem(models.Model):
     """ Модель инвентаря из счета """
 
@@ -173,23 +530,264 @@ class InvoiceItem(models.Model):
     amount = models.FloatField(null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = InvoiceItemManager()
+
     class Meta:
         ordering = ('-created_at',)
         verbose_name = 'Invoice Item'
         verbose_name_plural = 'Invoice Items'
 
     def save(self, *args, **kwargs):
-        if self.item.remaining < self.quantity:
-            raise Exception(f'Item with code {self.item.code} does not have enough quantity!')
+        if self.pk is not None:
+            return super().save(*args, **kwargs)
 
-        self.item_name = self.item.name
-        self.item_code = self.item.code
+        with transaction.atomic():
+            item = InvoiceItem.objects.take_stock({self.item_id: self.quantity})[self.item_id]
 
-        self.amount = self.quantity * self.item.price
-        self.item.remaining = self.item.remaining - self.quantity
-        self.item.save()
+            self.item_name = item.name
+            self.item_code = item.code
+            self.amount = self.quantity * item.price
 
-        super().save(*args, **kwargs)
+            super().save(*args, **kwargs)
+            DailySales.objects.record([self])
+            bump_versions('inventory', 'invoice')
 
     def __str__(self):
         return f'{self.item_code} - {self.item_name} - {self.quantity} - {self.invoice.shop.name}'
+
+
+class DailySalesManager(models.Manager):
+    """ Менеджер дневных продаж: инкрементальное обновление вместе со счетами """
+
+    batch_size = 200
+
+    def rebuild(self):
+        """ Полный пересчет дневных итогов по всем позициям счетов """
+
+        rows = InvoiceItem.objects.values(
+            'item_id', day=TruncDate('invoice__created_at'), shop=F('invoice__shop_id')
+        ).annotate(
+            total_quantity=Sum('quantity'),
+            total_amount=Coalesce(Sum('amount'), 0.0),
+            total_quantity_amount=Coalesce(Sum(F('quantity') * F('amount')), 0.0),
+        ).order_by()
+
+        with transaction.atomic():
+            self.all().delete()
+            batch = []
+            for row in rows.iterator(chunk_size=self.batch_size * 10):
+                batch.append(self.model(
+                    day=row['day'],
+                    shop_id=row['shop'],
+                    item_id=row['item_id'],
+                    quantity=row['total_quantity'],
+                    amount=row['total_amount'],
+                    quantity_amount=row['total_quantity_amount'],
+                ))
+                if len(batch) >= self.batch_size * 10:
+                    self.bulk_create(batch)
+                    batch = []
+            self.bulk_create(batch)
+
+    def record(self, invoice_items, sign=1):
+        """
+        Добавляет (sign=1) или вычитает (sign=-1) позиции счетов из дневных итогов.
+        Вызывается в той же транзакции, что и создание или удаление счета.
+        """
+
+        totals = {}
+        for line in invoice_items:
+            shop_id, item_id = line.invoice.shop_id, line.item_id
+            # Позиции без магазина или инвентаря (удалены) хранятся в строках с NULL вместо них,
+            # id могут прийти из сериализатора строками
+            key = (
+                timezone.localdate(line.invoice.created_at),
+                None if shop_id is None else int(shop_id),
+                None if item_id is None else int(item_id)
+            )
+            amount = line.amount or 0
+            quantity, amount_sum, quantity_amount = totals.get(key, (0, 0, 0))
+            totals[key] = (
+                quantity + line.quantity, amount_sum + amount, quantity_amount + line.quantity * amount
+            )
+
+        self._apply_all(totals, sign)
+
+    def fold(self, field, pk):
+        """
+        Перед удалением магазина (field='shop') или инвентаря (field='item') переносит его итоги
+        в строки с NULL вместо него. Его продажи остаются в общих отчетах, а позиции счетов,
+        удаленных позже, приходят в record уже без него и вычитаются из этих же строк.
+        """
+
+        rows = self.filter(**{f'{field}_id': pk})
+        totals = {
+            (day, None if field == 'shop' else shop_id, None if field == 'item' else item_id): values
+            for day, shop_id, item_id, *values in rows.values_list(
+                'day', 'shop_id', 'item_id', 'quantity', 'amount', 'quantity_amount'
+            )
+        }
+        rows.delete()
+        self._apply_all(totals, 1)
+
+    def _apply_all(self, totals, sign):
+        keys = list(totals)
+        for start in range(0, len(keys), self.batch_size):
+            self._apply({key: totals[key] for key in keys[start:start + self.batch_size]}, sign)
+
+    def _apply(self, totals, sign):
+        if sign > 0:
+            self.bulk_create([
+                self.model(day=day, shop_id=shop_id, item_id=item_id)
+                for day, shop_id, item_id in totals
+            ], ignore_conflicts=True)
+
+        ids = {
+            (day, shop_id, item_id): pk for pk, day, shop_id, item_id in self.filter(reduce(or_, (
+                Q(day=day, shop_id=shop_id, item_id=item_id) for day, shop_id, item_id in totals
+            ))).values_list('id', 'day', 'shop_id', 'item_id')
+        }
+        if not ids:
+            return
+
+        def increment(field, index, output_field):
+            return Case(
+                *(When(pk=ids[key], then=F(field) + sign * values[index])
+                  for key, values in totals.items() if key in ids),
+                default=F(field),
+                output_field=output_field
+            )
+
+        self.filter(pk__in=ids.values()).update(
+            quantity=increment('quantity', 0, models.IntegerField()),
+            amount=increment('amount', 1, models.FloatField()),
+            quantity_amount=increment('quantity_amount', 2, models.FloatField()),
+        )
+
+
+class DailySales(models.Model):
+    """ Модель дневных итогов продаж по магазину и инвентарю для отчетов """
+
+    day = models.DateField()
+    shop = models.ForeignKey(Shop, related_name='daily_sales', null=True, on_delete=models.SET_NULL)
+    item = models.ForeignKey(
+        Inventory, related_name='daily_sales', null=True, on_delete=models.SET_NULL
+    )
+    quantity = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+    # Sum(quantity * amount) - в таком виде суммы продаж считают отчеты
+    quantity_amount = models.FloatField(default=0)
+
+    objects = DailySalesManager()
+
+    class Meta:
+        ordering = ('-day',)
+        verbose_name = 'Daily Sales'
+        verbose_name_plural = 'Daily Sales'
+        constraints = [
+            models.UniqueConstraint(fields=('day', 'shop', 'item'), name='unique_daily_sales'),
+            # NULL не равен NULL в уникальных индексах: строки удаленных магазинов и инвентаря
+            # ограничиваются отдельно
+            models.UniqueConstraint(
+                fields=('day', 'item'), condition=Q(shop__isnull=True, item__isnull=False),
+                name='unique_daily_sales_without_shop'
+            ),
+            models.UniqueConstraint(
+                fields=('day', 'shop'), condition=Q(shop__isnull=False, item__isnull=True),
+                name='unique_daily_sales_without_item'
+            ),
+            models.UniqueConstraint(
+                fields=('day',), condition=Q(shop__isnull=True, item__isnull=True),
+                name='unique_daily_sales_without_shop_and_item'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=('item', 'day')),
+            models.Index(fields=('shop', 'day')),
+        ]
+
+    def __str__(self):
+        return f'{self.day} - {self.shop_id} - {self.item_id} - {self.quantity}'
+
+
+@receiver(pre_delete, sender=Shop)
+def fold_shop_sales(sender, instance, **kwargs):
+    DailySales.objects.fold('shop', instance.pk)
+
+
+@receiver(pre_delete, sender=Inventory)
+def fold_item_sales(sender, instance, **kwargs):
+    DailySales.objects.fold('item', instance.pk)
+
+
+class SearchDocumentManager(models.Manager):
+    """ Поддержка поискового индекса: один документ на объект, текст собирается из model.search_fields """
+
+    batch_size = 500
+
+    def index(self, model, pks):
+        """ Пересобирает документы объектов model с указанными id пачками по batch_size """
+
+        object_type = model._meta.model_name
+        pks = list(pks)
+        for start in range(0, len(pks), self.batch_size):
+            batch = pks[start:start + self.batch_size]
+            rows = model._base_manager.filter(pk__in=batch).order_by().values_list(
+                'pk', *model.search_fields
+            )
+            documents = [
+                self.model(object_type=object_type, object_id=pk, body=search_body(values))
+                for pk, *values in rows
+            ]
+            self.filter(object_type=object_type, object_id__in=batch).delete()
+            self.bulk_create(documents)
+
+    def index_queryset(self, queryset):
+        self.index(queryset.model, queryset.order_by().values_list('pk', flat=True))
+
+    def remove(self, model, pks):
+        self.filter(object_type=model._meta.model_name, object_id__in=list(pks)).delete()
+
+    def rebuild(self, models_to_index=None):
+        """ Полная перестройка индекса, возвращает количество документов """
+
+        models_to_index = models_to_index or SEARCH_MODELS
+        self.filter(object_type__in=[model._meta.model_name for model in models_to_index]).delete()
+        for model in models_to_index:
+            self.index_queryset(model._base_manager.all())
+        return self.count()
+
+
+def search_body(values):
+    """ Текст документа: слова всех полей через пробел """
+
+    return ' '.join(
+        token for value in values if value is not None for token in search_tokens(value)
+    )
+
+
+class SearchDocument(models.Model):
+    """
+    Модель поискового индекса.
+    На SQLite по ней построена внешняя таблица FTS5, на PostgreSQL - GIN индекс по tsvector
+    (см. миграцию 0009_searchdocument и inventory.search).
+    """
+
+    object_type = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    body = models.TextField()
+
+    objects = SearchDocumentManager()
+
+    class Meta:
+        verbose_name = 'Search Document'
+        verbose_name_plural = 'Search Documents'
+        constraints = [
+            models.UniqueConstraint(fields=('object_type', 'object_id'), name='unique_search_document')
+        ]
+
+    def __str__(self):
+        return f'{self.object_type} - {self.object_id}'
+
+
+SEARCH_MODELS = (Inventory, InventoryGroup, Shop, Invoice)
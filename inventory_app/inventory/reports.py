@@ -0,0 +1,110 @@
+from django.db.models import Exists, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncMonth
+from django.utils.dateparse import parse_date
+
+from .models import DailySales
+
+
+ALL_DAYS = (None, None)
+
+
+def whole_days(query_data):
+    """
+    Диапазон дней для отчета по таблице DailySales.
+
+    ALL_DAYS - без ограничения по датам, (start, end) - полуинтервал дней [start, end),
+    который совпадает с фильтром created_at__range=[start_date, end_date] для дат без
+    времени. None - диапазон не выровнен по суткам, отчет нужно считать по сырым данным.
+    """
+
+    start_date = query_data.get('start_date', None)
+    if query_data.get('total', None) or not start_date:
+        return ALL_DAYS
+
+    end_date = query_data.get('end_date', None)
+    try:
+        start, end = parse_date(start_date or ''), parse_date(end_date or '')
+    except ValueError:
+        return None
+    if start is None or end is None:
+        return None
+    return start, end
+
+
+def daily_sales(days, **filters):
+    sales = DailySales.objects.filter(quantity__gt=0, **filters)
+    start, end = days
+    if start is not None:
+        sales = sales.filter(day__gte=start, day__lt=end)
+    return sales
+
+
+def top_selling(queryset, days, limit=10, gather=None):
+    """
+    Самый продаваемый инвентарь с полем sum_of_item по дневным итогам.
+    С gather (см. AsyncReportMixin.gather) рейтинг, инвентарь из рейтинга и товары
+    без продаж читаются одновременно.
+    """
+
+    ranking_query = daily_sales(days, item__isnull=False).values('item_id').annotate(
+        sum_of_item=Sum('quantity')
+    ).order_by('-sum_of_item', 'item_id')
+    top_ids = ranking_query.values('item_id')[:limit]
+
+    if gather is not None:
+        calls = {
+            'ranking': lambda: list(ranking_query.values_list('item_id', 'sum_of_item')[:limit]),
+            'items': lambda: {item.id: item for item in queryset.filter(id__in=top_ids)},
+        }
+        if days is ALL_DAYS:
+            calls['unsold'] = lambda: list(queryset.exclude(id__in=top_ids)[:limit])
+        fetched = gather(**calls)
+        ranking, items, unsold = fetched['ranking'], fetched['items'], fetched.get('unsold')
+    else:
+        ranking = list(ranking_query.values_list('item_id', 'sum_of_item')[:limit])
+        items = queryset.in_bulk([item_id for item_id, _ in ranking])
+        unsold = None
+
+    result = []
+    for item_id, sum_of_item in ranking:
+        item = items.get(item_id)
+        if item is not None:
+            item.sum_of_item = sum_of_item
+            result.append(item)
+
+    # Без ограничения по датам в отчет попадают и товары без продаж
+    if days is ALL_DAYS and len(result) < limit:
+        if unsold is None:
+            unsold = queryset.exclude(id__in=items.keys())[:limit - len(result)]
+        for item in list(unsold)[:limit - len(result)]:
+            item.sum_of_item = 0
+            result.append(item)
+    return result
+
+
+def sales_by_shop(queryset, days, monthly=False):
+    """ Магазины с суммой продаж amount_total по дневным итогам """
+
+    sales = daily_sales(days, shop=OuterRef('pk'))
+    query = queryset.annotate(amount_total=Subquery(
+        sales.order_by().values('shop').annotate(
+            total=Sum('quantity_amount')
+        ).values('total'),
+        output_field=FloatField()
+    ))
+    if days is not ALL_DAYS:
+        query = query.filter(Exists(sales))
+
+    if monthly:
+        return query.annotate(month=TruncMonth('created_at')).values(
+            'month', 'name', 'amount_total'
+        )
+    return query.order_by('-amount_total')
+
+
+def purchase_totals(days):
+    """ Общая сумма и количество продаж по дневным итогам """
+
+    return daily_sales(days).aggregate(
+        amount_total=Sum('quantity_amount'), total=Sum('quantity')
+    )
@@ -0,0 +1,106 @@
+from django.db import connections
+from django.db.models import Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from my_user.models import CustomUser
+from .models import SearchDocument, SEARCH_MODELS
+from .utils import normalize_query, search_tokens
+
+
+DOCUMENT_TABLE = SearchDocument._meta.db_table
+FTS_TABLE = f'{DOCUMENT_TABLE}_fts'
+
+_fts_tables = {}
+
+
+def has_fts_table(using):
+    """ Есть ли в SQLite таблица FTS5 (создается миграцией, если SQLite собран с FTS5) """
+
+    if using not in _fts_tables:
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM sqlite_master WHERE name = %s', [FTS_TABLE])
+            _fts_tables[using] = cursor.fetchone() is not None
+    return _fts_tables[using]
+
+
+def search(queryset, keyword):
+    """
+    Поиск по индексу SearchDocument: все слова запроса должны встречаться в документе
+    как начало слова. Результат отсортирован по релевантности (поле search_rank,
+    меньше - лучше), при равной релевантности - по обычной сортировке модели.
+    """
+
+    tokens = [token for term in normalize_query(keyword) for token in search_tokens(term)]
+    if not tokens:
+        return queryset.none()
+
+    connection = connections[queryset.db]
+    object_type = queryset.model._meta.model_name
+    quote_name = connection.ops.quote_name
+    outer_id = f'{quote_name(queryset.model._meta.db_table)}.{quote_name(queryset.model._meta.pk.column)}'
+
+    if connection.vendor == 'postgresql':
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        ids = RawSQL(
+            f"SELECT object_id FROM {DOCUMENT_TABLE} WHERE object_type = %s "
+            f"AND to_tsvector('simple', body) @@ to_tsquery('simple', %s)",
+            (object_type, query)
+        )
+        rank = RawSQL(
+            f"SELECT -ts_rank(to_tsvector('simple', body), to_tsquery('simple', %s)) "
+            f"FROM {DOCUMENT_TABLE} WHERE object_type = %s AND object_id = {outer_id}",
+            (query, object_type)
+        )
+    elif connection.vendor == 'sqlite' and has_fts_table(queryset.db):
+        query = ' AND '.join(f'"{token}"*' for token in tokens)
+        ids = RawSQL(
+            f'SELECT d.object_id FROM {FTS_TABLE} JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s AND d.object_type = %s',
+            (query, object_type)
+        )
+        rank = RawSQL(
+            f'SELECT {FTS_TABLE}.rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = (SELECT d.id FROM {DOCUMENT_TABLE} d '
+            f'WHERE d.object_type = %s AND d.object_id = {outer_id})',
+            (query, object_type)
+        )
+    else:
+        # Без полнотекстового индекса: все равно одна таблица вместо join по связанным моделям
+        documents = SearchDocument.objects.filter(object_type=object_type)
+        for token in tokens:
+            documents = documents.filter(Q(body__startswith=token) | Q(body__contains=f' {token}'))
+        ids, rank = Subquery(documents.values('object_id')), Value(0)
+
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.filter(pk__in=ids).annotate(search_rank=rank).order_by('search_rank', *ordering)
+
+
+def _created_by(user):
+    return [model._base_manager.filter(created_by=user) for model in SEARCH_MODELS]
+
+
+@receiver(post_save, sender=CustomUser)
+def reindex_user_objects(sender, instance, created, **kwargs):
+    """ Имя и почта автора входят в поисковый текст его объектов """
+
+    if created or (instance.fullname, instance.email) == (instance.old_fullname, instance.old_email):
+        return
+    for queryset in _created_by(instance):
+        SearchDocument.objects.index_queryset(queryset)
+    instance.old_fullname, instance.old_email = instance.fullname, instance.email
+
+
+@receiver(pre_delete, sender=CustomUser)
+def collect_user_objects(sender, instance, **kwargs):
+    instance.search_objects = [
+        (queryset.model, list(queryset.values_list('pk', flat=True)))
+        for queryset in _created_by(instance)
+    ]
+
+
+@receiver(post_delete, sender=CustomUser)
+def reindex_deleted_user_objects(sender, instance, **kwargs):
+    for model, pks in getattr(instance, 'search_objects', ()):
+        SearchDocument.objects.index(model, pks)
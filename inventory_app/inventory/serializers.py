@@ -1,10 +1,29 @@
+from django.db import transaction
 from rest_framework import serializers
 
+from .images import image_storage
 from .models import InventoryGroup, Inventory, Shop, Invoice, InvoiceItem
+from .utils import DynamicFieldsMixin
 from my_user.serializers import CustomUserSerializer
 
 
-class InventoryGroupSerializer(serializers.ModelSerializer):
+class ImageRenditionsField(serializers.Field):
+    """ Ссылки на копии изображения {название: url}, как у ImageField - абсолютные, если есть request """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for rendition, name in value.items():
+            url = image_storage.url(name)
+            urls[rendition] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+
+class InventoryGroupSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """ Сериализатор групп инвентаря """
 
     created_by = CustomUserSerializer(read_only=True)
@@ -13,23 +32,47 @@ class InventoryGroupSerializer(serializers.ModelSerializer):
     belongs_to_id = serializers.CharField(write_only=True)
     total_items = serializers.CharField(read_only=True, required=False)
 
+    collapsed_fields = {'belongs_to': 'belongs_to_id'}
+    sparse_requires = {'belongs_to': ('belongs_to', 'path')}
+
     class Meta:
         model = InventoryGroup
-        fields = "__all__"
+        exclude = ('path', 'depth')
 
     def get_belongs_to(self, obj):
-        if obj.belongs_to is not None:
-            return InventoryGroupSerializer(obj.belongs_to).data
-        return None
-
-
-class InventorySerializer(serializers.ModelSerializer):
+        if obj.belongs_to_id is None:
+            return None
+
+        # Предки берутся по материализованному пути одним запросом и кэшируются
+        # в контексте, общем для всех объектов списка и вложенных сериализаторов
+        ancestors = self.context.setdefault('group_ancestors', {})
+        if obj.belongs_to_id not in ancestors:
+            ancestors.update(InventoryGroup.objects.ancestors_in_bulk(
+                [obj, *self.get_listed_groups()]
+            ))
+        parent = ancestors.get(obj.belongs_to_id)
+        if parent is None:
+            return None
+        return InventoryGroupSerializer(
+            parent, context=self.context, field_spec=self.nested_field_spec('belongs_to')
+        ).data
+
+    def get_listed_groups(self):
+        """ Группы из сериализуемого списка, чтобы загрузить предков для всей страницы сразу """
+
+        if self.parent is None or not isinstance(self.parent.instance, (list, tuple)):
+            return []
+        return [group for group in self.parent.instance if isinstance(group, InventoryGroup)]
+
+
+class InventorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """ Сериализатор инвентаря """
 
     created_by = CustomUserSerializer(read_only=True)
     created_by_id = serializers.CharField(write_only=True, required=False)
     group = InventoryGroupSerializer(read_only=True)
     group_id = serializers.CharField(write_only=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Inventory
@@ -42,7 +85,7 @@ class InventoryWithSumSerializer(InventorySerializer):
     sum_of_item = serializers.IntegerField()
 
 
-class ShopSerializer(serializers.ModelSerializer):
+class ShopSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """ Сериализатор магазина """
 
     created_by = CustomUserSerializer(read_only=True)
@@ -62,7 +105,7 @@ class ShopWithAmountSerializer(ShopSerializer):
     month = serializers.CharField(required=False)
 
 
-class InvoiceItemSerializer(serializers.ModelSerializer):
+class InvoiceItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """ Сериализатор инвентаря из счета """
 
     invoice = serializers.CharField(read_only=True)
@@ -82,7 +125,7 @@ class InvoiceItemDataSerializer(serializers.Serializer):
     quantity = serializers.IntegerField()
 
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """ Сериализатор счетов """
 
     created_by = CustomUserSerializer(read_only=True)
@@ -101,14 +144,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
         if not invoice_item_data:
             raise Exception('You need to provide at least one invoice item!')
 
-        invoice = super().create(validated_data)
-
-        invoice_item_serializer = InvoiceItemSerializer(data=[
-            {'invoice_id': invoice.id, **item} for item in invoice_item_data
-        ], many=True)
-        if invoice_item_serializer.is_valid():
-            invoice_item_serializer.save()
-        else:
-            invoice.delete()
-            raise Exception(invoice_item_serializer.errors)
+        with transaction.atomic():
+            invoice = super().create(validated_data)
+            InvoiceItem.objects.create_for_invoice(invoice, invoice_item_data)
         return invoice
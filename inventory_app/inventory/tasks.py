@@ -0,0 +1,106 @@
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+
+from jobs.registry import job_handler
+from jobs.runtime import JobError
+from jobs.storage import job_storage
+from .forecast import SalesForecast
+from .importers import InventoryCSVImporter
+
+
+# Выгрузки, доступные фоновой задачей inventory.export (параметр export)
+EXPORT_VIEWS = {
+    'inventory': 'inventory.views.InventoryExportView',
+    'invoices': 'inventory.views.InvoiceExportView',
+    'users-activities': 'my_user.views.UserActivitiesExportView',
+}
+
+
+def save_result_file(job, name, write):
+    """
+    Файл результата задачи: write(file) пишет во временный файл, он сохраняется в job_storage.
+    Скачать его можно через GET /api/v1/jobs/<id>/result
+    """
+
+    with tempfile.TemporaryFile() as file:
+        write(file)
+        size = file.tell()
+        file.seek(0)
+        name = job_storage.save(job.file_name(name), File(file, name=name))
+    return {'file': name, 'size': size}
+
+
+@job_handler('inventory.import_csv', timeout=3600, concurrency=1)
+def import_inventory_csv(job):
+    """
+    Импорт инвентаря из CSV, загруженного вместе с задачей (файл data), как в InventoryCSVLoaderView.
+    Без повторов: повтор после частичного импорта создал бы инвентарь второй раз.
+    """
+
+    name = job.payload.get('data')
+    if not job.owns_file(name):
+        raise JobError("You need to provide inventory CSV 'data'")
+    if job.created_by is None:
+        raise JobError('The user who submitted the import no longer exists')
+
+    size = job_storage.size(name)
+    with job_storage.open(name, 'rb') as file:
+        importer = InventoryCSVImporter(
+            job.created_by, workers=0,
+            progress=lambda rows: job.set_progress(file.tell() * 100 / size if size else 100)
+        )
+        report = importer.run(file)
+    if not report['created'] and not report['failed']:
+        raise JobError('CSV file cannot be empty')
+    return report
+
+
+@job_handler('inventory.sales_forecast', timeout=1800, max_attempts=2, concurrency=2)
+def sales_forecast(job):
+    """ Прогноз продаж по параметрам SalesForecastView (по умолчанию без limit), результат - JSON файл """
+
+    try:
+        forecast, options = SalesForecast.from_params(job.payload, default_limit=0)
+    except ValidationError as e:
+        raise JobError(json.dumps(e.detail))
+    rows = forecast.rows(**options)
+    job.set_progress(90)
+    result = save_result_file(job, 'sales-forecast.json', lambda file: file.write(json.dumps(rows).encode()))
+    return {'rows': len(rows), **result}
+
+
+@job_handler('inventory.export', timeout=3600, max_attempts=2, concurrency=2)
+def export(job):
+    """
+    Выгрузка в файл: export - название из EXPORT_VIEWS, params - параметры запроса выгрузки
+    (фильтры, keyword, output)
+    """
+
+    view_path = EXPORT_VIEWS.get(job.payload.get('export'))
+    if view_path is None:
+        raise JobError(f'export must be one of: {", ".join(EXPORT_VIEWS)}')
+    params = job.payload.get('params') or {}
+    if not isinstance(params, dict):
+        raise JobError('params must be an object')
+
+    view = import_string(view_path)
+    params = {key: str(value) for key, value in params.items()}
+    try:
+        output = view.get_output(params)
+        queryset = view.export_queryset(params)
+    except ValidationError as e:
+        raise JobError(json.dumps(e.detail))
+    total = queryset.count()
+
+    def write(file):
+        for index, line in enumerate(view.render(output, queryset)):
+            file.write(line.encode())
+            if total and index % settings.EXPORT_CHUNK_SIZE == 0:
+                job.set_progress(index * 100 / total)
+
+    return {'rows': total, **save_result_file(job, view.get_filename(output), write)}
@@ -1,3 +1,371 @@
-from django.test import TestCase
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from my_user.models import CustomUser
+from my_user.utils import get_access_token
+from .importers import InventoryCSVImporter
+from .models import DailySales, Inventory, InventoryGroup, Invoice, InvoiceItem, Shop
+
+
+@override_settings(USER_ACTIVITIES_SINK='sync')
+class APITestBase(APITestCase):
+    """ Клиент с токеном администратора, кэш ответов очищается перед каждым тестом """
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(email='admin@example.com', fullname='Admin User', role='admin')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {get_access_token({"user_id": self.user.id}, 1)}')
+
+
+class InvoiceItemManagerTest(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.shop = Shop.objects.create(name='Shop', created_by=self.user)
+        self.items = [
+            Inventory.objects.create(name=f'Item {index}', total=10, remaining=10, price=5, created_by=self.user)
+            for index in range(3)
+        ]
+
+    def create_invoice(self, lines):
+        with transaction.atomic():
+            invoice = Invoice.objects.create(shop=self.shop, created_by=self.user)
+            return InvoiceItem.objects.create_for_invoice(invoice, [
+                {'item_id': item.id, 'quantity': quantity} for item, quantity in lines
+            ])
+
+    def remaining(self):
+        return list(Inventory.objects.order_by('id').values_list('remaining', flat=True))
+
+    def test_remaining_is_decremented(self):
+        first, second, _ = self.items
+        invoice_items = self.create_invoice([(first, 3), (second, 10), (first, 2)])
+        self.assertEqual(self.remaining(), [5, 0, 10])
+        self.assertEqual([line.amount for line in invoice_items], [15, 50, 10])
+
+    def test_oversold_line_rolls_back_whole_invoice(self):
+        first, second, third = self.items
+        with self.assertRaisesMessage(Exception, 'does not have enough quantity'):
+            self.create_invoice([(first, 1), (second, 6), (third, 2), (second, 5)])
+        self.assertEqual(self.remaining(), [10, 10, 10])
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(InvoiceItem.objects.exists())
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_missing_item_rolls_back_whole_invoice(self):
+        with self.assertRaisesMessage(Exception, 'not found'):
+            self.create_invoice([(self.items[0], 1), (Inventory(id=0), 1)])
+        self.assertEqual(self.remaining(), [10, 10, 10])
+
+    def test_statement_count_does_not_depend_on_lines(self):
+        counts = []
+        for lines in ([(self.items[0], 1)], [(item, 1) for item in self.items]):
+            invoice = Invoice.objects.create(shop=self.shop, created_by=self.user)
+            with CaptureQueriesContext(connection) as queries, transaction.atomic():
+                InvoiceItem.objects.create_for_invoice(invoice, [
+                    {'item_id': item.id, 'quantity': quantity} for item, quantity in lines
+                ])
+            counts.append(len(queries))
+        # Точка сохранения и ее освобождение (тест уже в транзакции), блокировка, списание,
+        # позиции счета, дневные итоги (вставка строк, их id, прибавление)
+        self.assertEqual(counts, [8, 8])
+
+
+class InventoryCSVImporterTest(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.group = InventoryGroup.objects.create(name='Group', created_by=self.user)
+
+    def run_import(self, lines, chunk_size=2):
+        importer = InventoryCSVImporter(self.user, chunk_size=chunk_size, workers=0)
+        return importer.run(BytesIO('\n'.join(lines).encode()))
+
+    def codes(self):
+        return dict(Inventory.objects.values_list('name', 'code'))
+
+    def test_invalid_rows_are_reported_per_chunk(self):
+        g = self.group.id
+        report = self.run_import([
+            f'{g},5,First,10', f'{g},x,Bad total,10',
+            f'{g},5', f'999,5,Missing group,10',
+            '', f'{g},5,Second,10', f'{g},7,Third,1.5',
+        ])
+        self.assertEqual((report['created'], report['failed']), (3, 3))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4])
+        self.assertIn('total', report['errors'][0]['errors'])
+        self.assertIn('non_field_errors', report['errors'][1]['errors'])
+        self.assertEqual(report['errors'][2]['errors'], {'group_id': ['Group with id 999 not found']})
+        self.assertEqual(
+            dict(Inventory.objects.values_list('name', 'remaining')), {'First': 5, 'Second': 5, 'Third': 7}
+        )
+
+    def test_codes_are_reserved_in_blocks_per_chunk(self):
+        g = self.group.id
+        Inventory.objects.create(name='Before', total=1, created_by=self.user)
+        self.run_import([f'{g},1,A,1', f'{g},1,B,1', f'{g},1,C,1'])
+        # Пачка только с ошибками номера не резервирует
+        self.run_import([f'{g},x,Bad,1', f'{g},y,Worse,1'])
+        Inventory.objects.create(name='After', total=1, created_by=self.user)
+        self.assertEqual(self.codes(), {
+            'Before': '000001', 'A': '000002', 'B': '000003', 'C': '000004', 'After': '000005'
+        })
+
+    def test_failed_chunk_releases_its_codes(self):
+        g = self.group.id
+        with mock.patch('inventory.importers.add_user_activities_batch', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.run_import([f'{g},1,A,1', f'{g},1,B,1'])
+        self.assertFalse(Inventory.objects.exists())
+        self.run_import([f'{g},1,C,1'])
+        # Счетчик откатывается вместе с пачкой, последовательность PostgreSQL - нет (пропуск номеров)
+        self.assertEqual(self.codes(), {'C': '000003' if connection.vendor == 'postgresql' else '000001'})
+
+
+class InvoiceBatchTest(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.shop = Shop.objects.create(name='Shop', created_by=self.user)
+        self.item = Inventory.objects.create(name='Item', total=5, remaining=5, price=10, created_by=self.user)
+
+    def invoice(self, quantity, shop_id=None):
+        return {
+            'shop_id': shop_id or self.shop.id,
+            'invoice_item_data': [{'item_id': self.item.id, 'quantity': quantity}]
+        }
+
+    def post(self, mode, invoices):
+        return self.client.post('/api/v1/invoice-batch', {'mode': mode, 'invoices': invoices}, format='json')
+
+    def remaining(self):
+        self.item.refresh_from_db()
+        return self.item.remaining
+
+    def test_atomic_creates_nothing_on_any_error(self):
+        response = self.post('atomic', [self.invoice(2), self.invoice(2), self.invoice(2)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']], ['skipped', 'skipped', 'failed']
+        )
+        self.assertEqual((self.remaining(), Invoice.objects.count(), DailySales.objects.count()), (5, 0, 0))
+
+    def test_atomic_creates_all(self):
+        response = self.post('atomic', [self.invoice(2), self.invoice(3)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual((self.remaining(), InvoiceItem.objects.count()), (0, 2))
+
+    def test_partial_skips_failed_invoices(self):
+        response = self.post('partial', [self.invoice(2), self.invoice(4), self.invoice(1, shop_id=999), self.invoice(3)])
+        self.assertEqual(response.status_code, 201)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'failed', 'failed', 'created'])
+        # Остаток проверяется с учетом счетов выше по списку
+        self.assertIn('does not have enough quantity', results[1]['errors']['invoice_item_data'][0])
+        self.assertIn('shop_id', results[2]['errors'])
+        self.assertEqual(self.remaining(), 0)
+        self.assertEqual(
+            set(Invoice.objects.values_list('id', flat=True)), {results[0]['id'], results[3]['id']}
+        )
+
+    def test_invalid_mode_and_invoices_are_bad_request(self):
+        self.assertEqual(self.post('all', [self.invoice(1)]).data, {'mode': ['Mode must be one of: atomic, partial']})
+        self.assertEqual(self.post('partial', []).status_code, 400)
+        self.assertEqual(self.remaining(), 5)
+
+
+class KeysetPaginationTest(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.shops = [Shop.objects.create(name=f'Shop {index}', created_by=self.user) for index in range(7)]
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']], response.data
+
+    def test_forward_back_forward(self):
+        ids = [shop.id for shop in reversed(self.shops)]
+        page1, data1 = self.page('/api/v1/shop?cursor=&page_size=2')
+        page2, data2 = self.page(data1['next'])
+        page3, data3 = self.page(data2['next'])
+        self.assertEqual([page1, page2, page3], [ids[0:2], ids[2:4], ids[4:6]])
+
+        back2, data = self.page(data3['previous'])
+        self.assertEqual(back2, page2)
+        self.assertEqual(self.page(data['next'])[0], page3)
+
+        back1, data = self.page(data['previous'])
+        self.assertEqual(back1, page1)
+        self.assertIsNone(data['previous'])
+        self.assertEqual(self.page(data['next'])[0], page2)
+
+    def test_last_page(self):
+        page1, data = self.page('/api/v1/shop?cursor=&page_size=4')
+        page2, data = self.page(data['next'])
+        self.assertEqual(len(page1 + page2), 7)
+        self.assertIsNone(data['next'])
+        self.assertEqual(self.page(data['previous'])[0], page1)
+
+
+class SalesRollupTest(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.shop = Shop.objects.create(name='Shop', created_by=self.user)
+        self.item = Inventory.objects.create(name='Item', total=10, remaining=10, price=50, created_by=self.user)
+        self.invoice = Invoice.objects.create(shop=self.shop, created_by=self.user)
+        InvoiceItem.objects.create_for_invoice(self.invoice, [{'item_id': self.item.id, 'quantity': 5}])
+
+    def totals(self):
+        cache.clear()
+        summary = self.client.get('/api/v1/purchase-summary').data
+        top = {row['id']: row['sum_of_item'] for row in self.client.get('/api/v1/top-selling').data}
+        return summary, top.get(self.item.id)
+
+    def test_shop_deleted_before_invoice(self):
+        self.assertEqual(self.totals(), ({'price': 1250.0, 'count': 5}, 5))
+        self.shop.delete()
+        # Продажи удаленного магазина остаются в общих итогах, как и его позиции счетов
+        self.assertEqual(self.totals(), ({'price': 1250.0, 'count': 5}, 5))
+
+        Invoice.objects.get(pk=self.invoice.pk).delete()
+        summary, sold = self.totals()
+        self.assertFalse(summary['count'])
+        self.assertFalse(sold)
+        self.assertFalse(DailySales.objects.filter(quantity__gt=0).exists())
+
+    def test_item_and_shop_deleted_before_invoice(self):
+        self.item.delete()
+        self.shop.delete()
+        self.assertEqual(DailySales.objects.get().quantity, 5)
+
+        Invoice.objects.get(pk=self.invoice.pk).delete()
+        self.assertEqual(DailySales.objects.get().quantity, 0)
+
+    def test_rebuild_matches_incremental(self):
+        self.shop.delete()
+        other = Invoice.objects.create(shop=None, created_by=self.user)
+        InvoiceItem.objects.create_for_invoice(other, [{'item_id': self.item.id, 'quantity': 2}])
+        rows = set(DailySales.objects.filter(quantity__gt=0).values_list('day', 'shop_id', 'item_id', 'quantity'))
+        DailySales.objects.rebuild()
+        self.assertEqual(set(DailySales.objects.values_list('day', 'shop_id', 'item_id', 'quantity')), rows)
+
+
+class InventoryGroupPathTest(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.a = InventoryGroup.objects.create(name='A', created_by=self.user)
+        self.b = InventoryGroup.objects.create(name='B', belongs_to=self.a, created_by=self.user)
+        self.c = InventoryGroup.objects.create(name='C', belongs_to=self.b, created_by=self.user)
+
+    def subtree_names(self, group):
+        group.refresh_from_db()
+        return set(group.get_descendants().values_list('name', flat=True))
+
+    def test_stale_instance_keeps_moved_path(self):
+        stale = InventoryGroup.objects.get(pk=self.c.pk)
+        self.b.belongs_to = None
+        self.b.save()
+
+        stale.name = 'C2'
+        stale.save()
+        self.c.refresh_from_db()
+        self.assertEqual((self.c.name, self.c.depth), ('C2', 1))
+        self.assertEqual(self.subtree_names(self.a), set())
+        self.assertEqual(self.subtree_names(self.b), {'C2'})
+
+    def test_stale_instance_keeps_current_parent(self):
+        stale = InventoryGroup.objects.get(pk=self.b.pk)
+        self.b.belongs_to = None
+        self.b.save()
+
+        stale.name = 'B2'
+        stale.save()
+        self.b.refresh_from_db()
+        self.assertEqual((self.b.name, self.b.belongs_to_id, self.b.depth), ('B2', None, 0))
+        self.assertEqual(self.subtree_names(self.a), set())
+        self.assertEqual(self.subtree_names(self.b), {'C'})
+
+    def test_stale_instance_moved_after_concurrent_move(self):
+        stale = InventoryGroup.objects.get(pk=self.c.pk)
+        self.c.belongs_to = self.a
+        self.c.save()
+
+        stale.belongs_to = None
+        stale.save()
+        self.c.refresh_from_db()
+        self.assertEqual((self.c.belongs_to_id, self.c.depth), (None, 0))
+        self.assertEqual(self.subtree_names(self.a), {'B'})
+        self.assertEqual(self.subtree_names(self.b), set())
+
+    def test_stale_instance_moves_from_current_path(self):
+        stale = InventoryGroup.objects.get(pk=self.c.pk)
+        self.b.belongs_to = None
+        self.b.save()
+
+        stale.belongs_to = self.a
+        stale.save()
+        self.assertEqual(self.subtree_names(self.a), {'C'})
+        self.assertEqual(self.subtree_names(self.b), set())
+        self.c.refresh_from_db()
+        self.assertEqual(self.c.depth, 1)
+
+
+class ResponseCacheTest(APITestBase):
+    def test_fresh_summary_bypasses_response_cache(self):
+        self.assertEqual(self.client.get('/api/v1/summary')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/v1/summary')['X-Cache'], 'HIT')
+        for _ in range(2):
+            response = self.client.get('/api/v1/summary?fresh=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('X-Cache'))
+            self.assertFalse(response.has_header('ETag'))
+
+    def test_fresh_and_format_are_not_filters(self):
+        for url in ('/api/v1/inventory?fresh=1&total__gte=0', '/api/v1/shop?format=json&name=x', '/api/v1/invoice?fresh=1'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+        self.assertEqual(self.client.get('/api/v1/inventory?total__gte=0')['X-Cache'], 'MISS')
+        self.assertFalse(self.client.get('/api/v1/inventory?fresh=1&total__gte=0').has_header('X-Cache'))
+
+    def test_write_in_the_same_second_is_not_hidden_by_if_modified_since(self):
+        response = self.client.get('/api/v1/inventory')
+        # Версии ресурсов меняются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.create(name='Item', total=1, remaining=1, created_by=self.user)
+        response = self.client.get('/api/v1/inventory', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data['results']], ['Item'])
+
+        response = self.client.get('/api/v1/inventory', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class SalesForecastTest(APITestBase):
+    def setUp(self):
+        super().setUp()
+        shop = Shop.objects.create(name='Shop', created_by=self.user)
+        self.sold_out = Inventory.objects.create(name='Sold out', total=5, remaining=5, price=10, created_by=self.user)
+        Inventory.objects.create(name='Unsold', total=10, remaining=10, price=10, created_by=self.user)
+        invoice = Invoice.objects.create(shop=shop, created_by=self.user)
+        InvoiceItem.objects.create_for_invoice(invoice, [{'item_id': self.sold_out.id, 'quantity': 5}])
+
+    def ids(self, query):
+        response = self.client.get(f'/api/v1/sales-forecast?fresh=1&{query}')
+        self.assertEqual(response.status_code, 200, query)
+        return [row['id'] for row in response.data]
+
+    def test_reorder_only_is_parsed_as_boolean(self):
+        for value in ('0', 'false', 'False'):
+            self.assertEqual(len(self.ids(f'reorder_only={value}')), 2, value)
+        for value in ('1', 'true'):
+            self.assertEqual(self.ids(f'reorder_only={value}'), [self.sold_out.id], value)
+
+    def test_invalid_params_are_bad_request(self):
+        for query in ('days=abc', 'days=0', 'lead_time=-1', 'reorder_only=maybe'):
+            response = self.client.get(f'/api/v1/sales-forecast?{query}')
+            self.assertEqual(response.status_code, 400, query)
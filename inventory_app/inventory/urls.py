@@ -2,8 +2,9 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    InventoryView, InventoryGroupView, ShopView, InvoiceView, SummaryView, TopSellingView,
-    SaleByShopView, PurchaseView, InventoryCSVLoaderView
+    InventoryView, InventoryGroupView, InventoryGroupTreeView, ShopView, InvoiceView, SummaryView,
+    TopSellingView, SaleByShopView, PurchaseView, SalesForecastView, InventoryCSVLoaderView, InventoryExportView,
+    InvoiceExportView, InvoiceBatchView, ResponseCacheStatsView
 )
 
 
@@ -11,13 +12,19 @@ router = DefaultRouter(trailing_slash=False)
 
 router.register('inventory', InventoryView, basename='inventory')
 router.register('group', InventoryGroupView, basename='group')
+router.register('group-tree', InventoryGroupTreeView, basename='group-tree')
 router.register('shop', ShopView, basename='shop')
 router.register('invoice', InvoiceView, basename='invoice')
+router.register('invoice-batch', InvoiceBatchView, basename='invoice-batch')
 router.register('summary', SummaryView, basename='summary')
 router.register('top-selling', TopSellingView, basename='top-selling')
 router.register('sale-by-shop', SaleByShopView, basename='sale-by-shop')
 router.register('purchase-summary', PurchaseView, basename='purchase-summary')
+router.register('sales-forecast', SalesForecastView, basename='sales-forecast')
 router.register('inventory-csv', InventoryCSVLoaderView, basename='inventory-csv')
+router.register('inventory-export', InventoryExportView, basename='inventory-export')
+router.register('invoice-export', InvoiceExportView, basename='invoice-export')
+router.register('response-cache-stats', ResponseCacheStatsView, basename='response-cache-stats')
 
 urlpatterns = [
     path('', include(router.urls))
@@ -1,14 +1,183 @@
+import json
 import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
 
-from django.db.models import Q
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Prefetch, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+INVENTORY_CODE_LENGTH = 6
+
+
+def format_inventory_code(number):
+    """ Код инвентаря - номер, дополненный нулями слева до 6 символов """
+
+    return str(number).zfill(INVENTORY_CODE_LENGTH)
+
+
+def count_many(**querysets):
+    """ Несколько COUNT(*) одним запросом к БД: count_many(name=queryset, ...) -> {name: count} """
+
+    selects, params, using = [], [], None
+    for name, queryset in querysets.items():
+        sql, query_params = queryset.order_by().values('pk').query.sql_with_params()
+        selects.append(f'(SELECT COUNT(*) FROM ({sql}) AS counted_{name}) AS {name}')
+        params.extend(query_params)
+        using = queryset.db
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(selects)}', params)
+        return dict(zip(querysets, cursor.fetchone()))
+
+
+# Параметры пагинации, которые не являются фильтрами
+PAGINATION_PARAMS = ('page', 'cursor', 'page_size', 'count')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по (created_at, id) без COUNT(*) и OFFSET.
+
+    Курсор - непрозрачная строка с позицией последней записи страницы. Размер страницы
+    задается параметром page_size (не больше max_page_size). С параметром count=estimate
+    в ответ добавляется оценка количества записей из планировщика PostgreSQL,
+    с count=exact - точное количество.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    page_size = 20
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+    position_field = 'created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count, self.count_estimated = self.get_count(queryset, request)
+
+        # Направление берем из сортировки по created_at, даже если перед ней идут другие поля
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        descending = f'-{self.position_field}' in ordering
+        position, reverse = self.decode_cursor(request)
+
+        # Для предыдущей страницы идем в обратную сторону и разворачиваем результат
+        backwards = descending != reverse
+        sign = '-' if backwards else ''
+        queryset = queryset.order_by(f'{sign}created_at', f'{sign}id')
+        if position is not None:
+            created_at, pk = position
+            lookup = 'lt' if backwards else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'created_at__{lookup}': created_at}) |
+                Q(created_at=created_at, **{f'id__{lookup}': pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        first, last = (results[0], results[-1]) if results else (None, None)
+        if reverse:
+            # Следующая страница начинается после последней записи этой, а не с позиции курсора
+            self.next_position = self.get_position(last) if results else position
+            self.previous_position = self.get_position(first) if has_more else None
+        else:
+            self.next_position = self.get_position(last) if has_more else None
+            self.previous_position = self.get_position(first) if position is not None else None
+        return results
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+            response['count_estimated'] = self.count_estimated
+        response['next'] = self.encode_cursor(self.next_position, reverse=False)
+        response['previous'] = self.encode_cursor(self.previous_position, reverse=True)
+        response['results'] = data
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'estimate' and connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows']), True
+        if mode in ('estimate', 'exact'):
+            return queryset.count(), False
+        return None, False
+
+    @staticmethod
+    def get_position(obj):
+        if isinstance(obj, dict):
+            return obj['created_at'], obj['id']
+        return obj.created_at, obj.id
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            created_at = parse_datetime(payload['c'])
+            if created_at is None:
+                raise ValueError
+            return (created_at, int(payload['i'])), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        if position is None:
+            return None
+        created_at, pk = position
+        payload = {'c': created_at.isoformat(), 'i': pk}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload).encode('ascii')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
 
 
 class CustomPagination(PageNumberPagination):
-    """ Кастомный класс пагинации """
+    """
+    Кастомный класс пагинации.
+    По умолчанию постраничная, с параметром cursor - курсорная (см. KeysetPagination).
+    """
 
     page_size = 20
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
 
 def normalize_query(
         query_string,
@@ -20,21 +189,161 @@ def normalize_query(
     return [normspace(' ', (t[0] or t[1]).strip()) for t in findterms(query_string)]
 
 
-def get_query(query_string, search_fields):
-    """ Поиск """
+def search_tokens(text, findtokens=re.compile(r'\w+').findall):
+    """ Слова текста в нижнем регистре: так текст хранится в поисковом индексе и так разбирается запрос """
+
+    return findtokens(str(text).lower())
+
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+UNSET = object()
+
+
+def parse_field_spec(value):
+    """ 'id,group.name,group.created_by' -> {'id': {}, 'group': {'name': {}, 'created_by': {}}} """
+
+    spec = {}
+    for path in value.split(','):
+        node = spec
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return spec
+
+
+class DynamicFieldsMixin:
+    """
+    Выбор полей (?fields=) и раскрытие связей (?expand=) в сериализаторе.
+
+    Без этих параметров вывод полный, как раньше. Если передан хотя бы один из них, вывод
+    разреженный: fields оставляет только перечисленные поля (через точку - поля вложенных
+    объектов), а связи, не перечисленные в expand, выводятся своим id (списком id).
+    """
+
+    # Связи, которые сериализатор строит сам (SerializerMethodField): имя -> атрибут с id
+    collapsed_fields = {}
+    # Поля модели, нужные методам сериализатора, для only(): имя поля -> поля модели
+    sparse_requires = {}
+
+    def __init__(self, *args, field_spec=UNSET, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._field_spec = field_spec
+
+    @property
+    def field_spec(self):
+        """ None - полный вывод, иначе (fields, expand) для этого уровня вложенности """
+
+        if self._field_spec is UNSET:
+            self._field_spec = self.get_request_field_spec() if self.is_root() else None
+        return self._field_spec
+
+    def is_root(self):
+        parent = self.parent
+        return parent is None or (
+            isinstance(parent, serializers.ListSerializer) and parent.parent is None
+        )
 
-    query = None
-    terms = normalize_query(query_string)
-    for term in terms:
-        or_query = None
-        for field_name in search_fields:
-            q = Q(**{"%s__icontains" % field_name: term})
-            if or_query is None:
-                or_query = q
+    def get_request_field_spec(self):
+        request = self.context.get('request', None)
+        if request is None:
+            return None
+        params = request.query_params
+        if FIELDS_PARAM not in params and EXPAND_PARAM not in params:
+            return None
+        return parse_field_spec(params.get(FIELDS_PARAM, '')), parse_field_spec(params.get(EXPAND_PARAM, ''))
+
+    def nested_field_spec(self, name):
+        if self.field_spec is None:
+            return None
+        only, expand = self.field_spec
+        return only.get(name, {}), expand.get(name, {})
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.field_spec is None:
+            return fields
+
+        only, expand = self.field_spec
+        sparse = OrderedDict()
+        for name, field in fields.items():
+            if field.write_only:
+                sparse[name] = field
+                continue
+            if only and name not in only:
+                continue
+
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, DynamicFieldsMixin):
+                if name in expand:
+                    nested._field_spec = self.nested_field_spec(name)
+                    sparse[name] = field
+                elif nested is field:
+                    # Поля еще не привязаны к сериализатору, source по умолчанию - имя поля
+                    sparse[name] = serializers.ReadOnlyField(source=f'{field.source or name}_id')
+                else:
+                    sparse[name] = serializers.PrimaryKeyRelatedField(
+                        source=field.source, many=True, read_only=True
+                    )
+            elif name in self.collapsed_fields and name not in expand:
+                sparse[name] = serializers.ReadOnlyField(source=self.collapsed_fields[name])
             else:
-                or_query = or_query | q
-        if query is None:
-            query = or_query
+                sparse[name] = field
+        return sparse
+
+
+def sparse_queryset(queryset, serializer, required=()):
+    """ select_related/prefetch_related/only() под поля разреженного сериализатора """
+
+    only, select, prefetch = list(required), [], []
+    _collect_sparse_lookups(queryset.model, serializer, '', only, select, prefetch)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select:
+        queryset = queryset.select_related(*select)
+    return queryset.prefetch_related(*prefetch).only(*only)
+
+
+def _collect_sparse_lookups(model, serializer, prefix, only, select, prefetch):
+    only.append(prefix + model._meta.pk.name)
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*' or '.' in field.source:
+            only.extend(prefix + required for required in getattr(serializer, 'sparse_requires', {}).get(name, ()))
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            # Аннотации и вычисляемые атрибуты
+            continue
+
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if not model_field.is_relation:
+            only.append(prefix + model_field.name)
+        elif model_field.many_to_one or (model_field.one_to_one and model_field.concrete):
+            only.append(prefix + model_field.name)
+            if isinstance(nested, serializers.BaseSerializer):
+                select.append(prefix + model_field.name)
+                _collect_sparse_lookups(
+                    model_field.related_model, nested, f'{prefix}{model_field.name}__', only, select, prefetch
+                )
         else:
-            query = query & or_query
-        return query
+            related_model = model_field.related_model
+            # Для обратной связи нужен внешний ключ на родителя, чтобы разложить объекты
+            required = (model_field.field.name,) if model_field.one_to_many else ()
+            if isinstance(nested, serializers.BaseSerializer):
+                related = sparse_queryset(related_model._default_manager.all(), nested, required)
+            else:
+                related = related_model._default_manager.only(related_model._meta.pk.name, *required)
+            prefetch.append(Prefetch(prefix + field.source, queryset=related))
+
+
+class SparseFieldsMixin:
+    """ Подстраивает queryset представления под ?fields= и ?expand= его сериализатора """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer = self.get_serializer()
+        if getattr(serializer, 'field_spec', None) is None:
+            return queryset
+        return sparse_queryset(queryset, serializer)
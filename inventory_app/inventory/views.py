@@ -1,6 +1,6 @@
-import codecs
-import csv
-
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from django.db.models import Count, Sum, F
@@ -11,35 +11,45 @@ from .serializers import (
     InventoryWithSumSerializer, ShopWithAmountSerializer
 )
 from .models import Inventory, Shop, Invoice, InvoiceItem, InventoryGroup
-from .utils import CustomPagination, get_query
-from my_user.permissions import IsAuthenticatedCustom
+from .filters import (
+    FilteredListMixin, InventoryFilter, InventoryGroupFilter, ShopFilter, InvoiceFilter
+)
+from .importers import InventoryCSVImporter
+from .batches import InvoiceBatch, ATOMIC
+from .exports import ExportView
+from .async_views import AsyncReportMixin
+from .caching import VersionedResponseMixin, response_cache_stats
+from .fast import FastListMixin
+from .forecast import SalesForecast
+from . import reports
+from .search import search
+from .utils import CustomPagination, SparseFieldsMixin, count_many
+from my_user.permissions import IsAuthenticatedCustom, IsAdminCustom
 from my_user.models import CustomUser
+from my_user.cache import get_versions
+from config.db_router import current_replica
 
 
-class InventoryView(ModelViewSet):
+class InventoryView(VersionedResponseMixin, FilteredListMixin, SparseFieldsMixin, FastListMixin, ModelViewSet):
     """ Представление для получения информации об инвентаре """
 
     queryset = Inventory.objects.select_related('group', 'created_by')
     serializer_class = InventorySerializer
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('inventory', 'group', 'user')
+    read_replica = True
     pagination_class = CustomPagination
+    filterset_class = InventoryFilter
 
     def get_queryset(self):
         if self.request.method.lower() != 'get':
             return self.queryset
 
-        data = self.request.query_params.dict()
-        data.pop('page', None)
-        keyword = data.pop('keyword', None)
-
-        results = self.queryset.filter(**data)
+        keyword = self.request.query_params.get('keyword', None)
+        results = self.filter_list_queryset(self.queryset)
 
         if keyword:
-            search_fields = (
-                'code', 'created_by__fullname', 'created_by__email', 'group__name', 'name'
-            )
-            query = get_query(keyword, search_fields)
-            return results.filter(query)
+            return search(results, keyword)
         return results
 
     def create(self, request, *args, **kwargs):
@@ -47,32 +57,26 @@ class InventoryView(ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class InventoryGroupView(ModelViewSet):
+class InventoryGroupView(VersionedResponseMixin, FilteredListMixin, SparseFieldsMixin, ModelViewSet):
     """ Представление для получения информации о группах инвентаря, сколько в них товаров """
 
-    queryset = InventoryGroup.objects.select_related(
-        'belongs_to', 'created_by'
-    ).prefetch_related('inventories')
+    queryset = InventoryGroup.objects.select_related('created_by').prefetch_related('inventories')
     serializer_class = InventoryGroupSerializer
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('group', 'inventory', 'user')
+    read_replica = True
     pagination_class = CustomPagination
+    filterset_class = InventoryGroupFilter
 
     def get_queryset(self):
         if self.request.method.lower() != 'get':
             return self.queryset
 
-        data = self.request.query_params.dict()
-        data.pop('page', None)
-        keyword = data.pop('keyword', None)
-
-        results = self.queryset.filter(**data)
+        keyword = self.request.query_params.get('keyword', None)
+        results = self.filter_list_queryset(self.queryset)
 
         if keyword:
-            search_fields = (
-                'created_by__fullname', 'created_by__email', 'name'
-            )
-            query = get_query(keyword, search_fields)
-            results = results.filter(query)
+            results = search(results, keyword)
 
         return results.annotate(
             total_items=Count('inventories')
@@ -83,30 +87,42 @@ class InventoryGroupView(ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class ShopView(ModelViewSet):
+class InventoryGroupTreeView(VersionedResponseMixin, ModelViewSet):
+    """ Представление дерева групп инвентаря с количеством товаров по поддеревьям """
+
+    http_method_names = ('get',)
+    queryset = InventoryGroup.objects.all()
+    permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('group', 'inventory')
+    read_replica = True
+
+    def list(self, request, *args, **kwargs):
+        return Response(InventoryGroup.objects.tree())
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(InventoryGroup.objects.tree(self.get_object())[0])
+
+
+class ShopView(VersionedResponseMixin, FilteredListMixin, SparseFieldsMixin, FastListMixin, ModelViewSet):
     """ Представление для получения информации про магазины """
 
     queryset = Shop.objects.select_related('created_by')
     serializer_class = ShopSerializer
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('shop', 'user')
+    read_replica = True
     pagination_class = CustomPagination
+    filterset_class = ShopFilter
 
     def get_queryset(self):
         if self.request.method.lower() != 'get':
             return self.queryset
 
-        data = self.request.query_params.dict()
-        data.pop('page', None)
-        keyword = data.pop('keyword', None)
-
-        results = self.queryset.filter(**data)
+        keyword = self.request.query_params.get('keyword', None)
+        results = self.filter_list_queryset(self.queryset)
 
         if keyword:
-            search_fields = (
-                'created_by__fullname', 'created_by__email', 'name'
-            )
-            query = get_query(keyword, search_fields)
-            results = results.filter(query)
+            results = search(results, keyword)
 
         return results
 
@@ -115,7 +131,7 @@ class ShopView(ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class InvoiceView(ModelViewSet):
+class InvoiceView(VersionedResponseMixin, FilteredListMixin, SparseFieldsMixin, FastListMixin, ModelViewSet):
     """ Представление для получения информации о счетах """
 
     queryset = Invoice.objects.select_related(
@@ -123,24 +139,20 @@ class InvoiceView(ModelViewSet):
     ).prefetch_related('invoice_items')
     serializer_class = InvoiceSerializer
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('invoice', 'shop', 'inventory', 'group', 'user')
+    read_replica = True
     pagination_class = CustomPagination
+    filterset_class = InvoiceFilter
 
     def get_queryset(self):
         if self.request.method.lower() != 'get':
             return self.queryset
 
-        data = self.request.query_params.dict()
-        data.pop('page', None)
-        keyword = data.pop('keyword', None)
-
-        results = self.queryset.filter(**data)
+        keyword = self.request.query_params.get('keyword', None)
+        results = self.filter_list_queryset(self.queryset)
 
         if keyword:
-            search_fields = (
-                'created_by__fullname', 'created_by__email', 'shop__name'
-            )
-            query = get_query(keyword, search_fields)
-            results = results.filter(query)
+            results = search(results, keyword)
 
         return results
 
@@ -149,38 +161,105 @@ class InvoiceView(ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class SummaryView(ModelViewSet):
+class InvoiceBatchView(ModelViewSet):
+    """ Представление для создания пачки счетов: {"mode": "atomic" | "partial", "invoices": [...]} """
+
+    http_method_names = ('post',)
+    queryset = Invoice.objects.none()
+    permission_classes = (IsAuthenticatedCustom,)
+    serializer_class = InvoiceSerializer
+
+    def create(self, request, *args, **kwargs):
+        report = InvoiceBatch(request.user, mode=request.data.get('mode', ATOMIC)).run(
+            request.data.get('invoices')
+        )
+
+        if not report['created']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
+class InventoryExportView(ExportView):
+    """ Представление для выгрузки инвентаря в CSV/NDJSON """
+
+    queryset = Inventory.objects.all()
+    filterset_class = InventoryFilter
+    search_model = Inventory
+    export_name = 'inventory'
+    export_fields = (
+        'id', 'code', 'name', 'group_id', 'group__name', 'total', 'remaining', 'price',
+        'created_by_id', 'created_by__email', 'created_at', 'updated_at'
+    )
+
+
+class InvoiceExportView(ExportView):
+    """ Представление для выгрузки позиций счетов в CSV/NDJSON, фильтры - как у списка счетов """
+
+    queryset = InvoiceItem.objects.all()
+    filterset_class = InvoiceFilter
+    filter_prefix = 'invoice__'
+    search_model = Invoice
+    export_name = 'invoices'
+    export_fields = (
+        'invoice_id', 'invoice__created_at', 'invoice__shop_id', 'invoice__shop__name',
+        'invoice__created_by_id', 'invoice__created_by__email', 'id', 'item_id', 'item_code',
+        'item_name', 'quantity', 'amount'
+    )
+
+    @classmethod
+    def export_queryset(cls, query_params):
+        return super().export_queryset(query_params).order_by('-invoice__created_at', 'invoice_id', 'id')
+
+
+class SummaryView(AsyncReportMixin, VersionedResponseMixin, ModelViewSet):
     """ Представление для получения количества инвентаря, групп, магазинов, пользователей """
 
     http_method_names = ('get',)
     queryset = InventoryView.queryset
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('inventory', 'group', 'shop', 'user')
+    read_replica = True
 
-    def list(self, *args, **kwargs):
-        total_inventory = InventoryView.queryset.filter(
-            remaining__gt=0
-        ).count()
-        total_group = InventoryGroupView.queryset.count()
-        total_shop = ShopView.queryset.count()
-        total_users = CustomUser.objects.filter(is_superuser=False).count()
+    def list(self, request, *args, **kwargs):
+        versions = get_versions('inventory', 'group', 'shop', 'user')
+        cache_key = 'summary:' + ':'.join(str(version) for version in versions)
+
+        data = None
+        if not request.query_params.get('fresh'):
+            data = cache.get(cache_key)
+
+        if data is None:
+            # Один запрос с подзапросами быстрее четырех одновременных COUNT, в том числе под ASGI
+            data = count_many(
+                total_inventory=Inventory.objects.filter(remaining__gt=0),
+                total_group=InventoryGroup.objects.all(),
+                total_shop=Shop.objects.all(),
+                total_users=CustomUser.objects.filter(is_superuser=False)
+            )
+            # Данные реплики могут отставать от версий в ключе
+            if current_replica() is None:
+                cache.set(cache_key, data, settings.SUMMARY_CACHE_TIMEOUT)
 
-        return Response({
-            'total_inventory': total_inventory,
-            'total_group': total_group,
-            'total_shop': total_shop,
-            'total_users': total_users
-        })
+        return Response(data)
 
 
-class TopSellingView(ModelViewSet):
+class TopSellingView(AsyncReportMixin, VersionedResponseMixin, ModelViewSet):
     """ Представление для получения информации про 10 штук самого продаваемого инвентаря """
 
     http_method_names = ('get',)
     queryset = InventoryView.queryset
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('inventory', 'invoice', 'group', 'user')
+    read_replica = True
 
     def list(self, request, *args, **kwargs):
         query_data = request.query_params.dict()
+        days = reports.whole_days(query_data)
+        if days is not None:
+            items = reports.top_selling(self.queryset, days, gather=self.gather if self.concurrent else None)
+            return Response(InventoryWithSumSerializer(items, many=True).data)
+
         total = query_data.get('total', None)
         query = self.queryset
 
@@ -201,12 +280,14 @@ class TopSellingView(ModelViewSet):
         return Response(InventoryWithSumSerializer(items, many=True).data)
 
 
-class SaleByShopView(ModelViewSet):
+class SaleByShopView(AsyncReportMixin, VersionedResponseMixin, ModelViewSet):
     """ Представление для получения информации про продажи """
 
     http_method_names = ('get',)
     queryset = InventoryView.queryset
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('shop', 'invoice', 'user')
+    read_replica = True
 
     def list(self, request, *args, **kwargs):
         query_data = request.query_params.dict()
@@ -214,6 +295,11 @@ class SaleByShopView(ModelViewSet):
         monthly = query_data.get('monthly', None)
         query = ShopView.queryset
 
+        days = reports.whole_days(query_data)
+        if days is not None:
+            shops = reports.sales_by_shop(query, days, monthly=monthly)
+            return Response(ShopWithAmountSerializer(shops, many=True).data)
+
         if not total:
             start_date = query_data.get('start_date', None)
             end_date = query_data.get('end_date', None)
@@ -236,30 +322,36 @@ class SaleByShopView(ModelViewSet):
         return Response(ShopWithAmountSerializer(shops, many=True).data)
 
 
-class PurchaseView(ModelViewSet):
+class PurchaseView(AsyncReportMixin, VersionedResponseMixin, ModelViewSet):
     """ Представление для получения информации про количество заказов и общую сумму покупок """
 
     http_method_names = ('get',)
     queryset = InvoiceView.queryset
     permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('invoice',)
+    read_replica = True
 
     def list(self, request, *args, **kwargs):
         query_data = request.query_params.dict()
         total = query_data.get('total', None)
         query = InvoiceItem.objects.select_related("invoice", "item")
 
-        if not total:
-            start_date = query_data.get("start_date", None)
-            end_date = query_data.get("end_date", None)
+        days = reports.whole_days(query_data)
+        if days is not None:
+            query = reports.purchase_totals(days)
+        else:
+            if not total:
+                start_date = query_data.get("start_date", None)
+                end_date = query_data.get("end_date", None)
 
-            if start_date:
-                query = query.filter(
-                    created_at__range=[start_date, end_date]
-                )
+                if start_date:
+                    query = query.filter(
+                        created_at__range=[start_date, end_date]
+                    )
 
-        query = query.aggregate(
-            amount_total=Sum(F('amount') * F('quantity')), total=Sum('quantity')
-            )
+            query = query.aggregate(
+                amount_total=Sum(F('amount') * F('quantity')), total=Sum('quantity')
+                )
 
         return Response({
             "price": "0.00" if not query.get("amount_total") else query.get("amount_total"),
@@ -267,6 +359,24 @@ class PurchaseView(ModelViewSet):
         })
 
 
+class SalesForecastView(VersionedResponseMixin, ModelViewSet):
+    """
+    Представление прогноза продаж и точки заказа по всему инвентарю.
+    Параметры: days - глубина истории, lead_time - срок поставки в днях, safety_factor,
+    reorder_only - только инвентарь, который пора заказывать, limit (0 - без ограничения).
+    """
+
+    http_method_names = ('get',)
+    queryset = InventoryView.queryset
+    permission_classes = (IsAuthenticatedCustom,)
+    cache_resources = ('inventory', 'invoice')
+    read_replica = True
+
+    def list(self, request, *args, **kwargs):
+        forecast, rows_options = SalesForecast.from_params(request.query_params.dict())
+        return Response(forecast.rows(**rows_options))
+
+
 class InventoryCSVLoaderView(ModelViewSet):
     """ Представление для добавления инвентаря их CSV файлов """
 
@@ -281,30 +391,26 @@ class InventoryCSVLoaderView(ModelViewSet):
         except Exception as e:
             raise Exception("You need to provide inventory CSV 'data'")
 
-        inventory_items = []
-
-        try:
-            csv_reader = csv.reader(codecs.iterdecode(data, 'utf-8'))
-            for row in csv_reader:
-                if not row[0]:
-                    continue
-                inventory_items.append(
-                    {
-                        "group_id": row[0],
-                        "total": row[1],
-                        "name": row[2],
-                        "price": row[3],
-                        "created_by_id": request.user.id
-                    }
-                )
-        except csv.Error as e:
-            raise Exception(e)
+        workers = None
+        if data.size < settings.INVENTORY_IMPORT_POOL_MIN_SIZE:
+            workers = 0
+        report = InventoryCSVImporter(request.user, workers=workers).run(data)
 
-        if not inventory_items:
+        if not report['created'] and not report['failed']:
             raise Exception("CSV file cannot be empty")
 
-        data_validation = self.serializer_class(data=inventory_items, many=True)
-        data_validation.is_valid(raise_exception=True)
-        data_validation.save()
+        if not report['created']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"success": "Inventory items added successfully", **report})
+
 
-        return Response({"success": "Inventory items added successfully"})
+class ResponseCacheStatsView(ModelViewSet):
+    """ Представление статистики кэша ответов (попадания, промахи, 304) текущего процесса """
+
+    http_method_names = ('get',)
+    queryset = InventoryGroup.objects.none()
+    permission_classes = (IsAdminCustom,)
+
+    def list(self, request, *args, **kwargs):
+        return Response(response_cache_stats())
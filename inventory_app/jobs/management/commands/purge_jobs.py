@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Удаляет завершенные фоновые задачи старше JOB_RETENTION_DAYS вместе с их файлами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.JOB_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('Days cannot be negative')
+        deleted = Job.objects.purge(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} jobs'))
@@ -0,0 +1,34 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.registry import job_type_names
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет фоновые задачи из очереди в БД (jobs.Job) в пуле процессов. '
+        'SIGTERM/Ctrl+C: новые задачи не забираются, выполняемые доводятся до конца'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKERS)
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL)
+        parser.add_argument('--burst', action='store_true', help='Завершиться, когда готовых задач не останется')
+
+    def handle(self, *args, **options):
+        worker = Worker(options['processes'], options['poll_interval'])
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping: waiting for running jobs to finish')
+            worker.stop()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(
+            f'Worker {worker.name}: {worker.processes} processes, job types: {", ".join(job_type_names()) or "-"}'
+        )
+        worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker.name} stopped'))
@@ -0,0 +1,205 @@
+import logging
+import posixpath
+import shutil
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connections, models, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from my_user.models import CustomUser
+from .registry import get_job_type
+from .storage import job_storage
+
+
+logger = logging.getLogger(__name__)
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+STATUSES = (
+    (QUEUED, QUEUED),
+    (RUNNING, RUNNING),
+    (SUCCEEDED, SUCCEEDED),
+    (FAILED, FAILED),
+)
+
+# Ключ advisory lock PostgreSQL, под которым воркеры забирают задачи
+CLAIM_LOCK_KEY = 7210412
+
+
+class JobManager(models.Manager):
+    """ Менеджер очереди задач """
+
+    def submit(self, job_type, payload, user=None, files=None):
+        """
+        Ставит задачу в очередь. Файлы ({ключ: загруженный файл}) сохраняются в каталог задачи,
+        а их имена в хранилище попадают в payload под теми же ключами.
+        """
+
+        with transaction.atomic(using=self.db):
+            job = self.create(
+                type=job_type.name,
+                payload=payload,
+                created_by=user,
+                max_attempts=job_type.max_attempts,
+                timeout=job_type.get_timeout(),
+            )
+            if files:
+                # Задача станет видна воркерам только после фиксации, то есть уже с файлами
+                for key, file in files.items():
+                    job.payload[key] = job_storage.save(job.file_name(posixpath.basename(file.name)), file)
+                job.save(update_fields=['payload'])
+        return job
+
+    def _lock_claims(self):
+        """
+        Забор задач выполняется по очереди всеми воркерами, иначе два воркера могли бы
+        одновременно увидеть свободное место для одного и того же типа задач.
+        """
+
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CLAIM_LOCK_KEY])
+            elif connection.vendor == 'sqlite':
+                # Любой UPDATE берет блокировку записи SQLite до конца транзакции
+                cursor.execute(f'UPDATE {self.model._meta.db_table} SET id = id WHERE id IS NULL')
+
+    def claim(self, worker, capacity):
+        """ Забирает до capacity готовых задач с учетом ограничений типов, возвращает их id """
+
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            self._lock_claims()
+            running = Counter(dict(
+                self.filter(status=RUNNING).values_list('type').annotate(count=Count('id')).order_by()
+            ))
+            claimed = []
+            for job in self.filter(status=QUEUED, run_after__lte=now).order_by('run_after', 'id')[:capacity * 10]:
+                job_type = get_job_type(job.type)
+                if job_type is None:
+                    self.filter(pk=job.pk).update(
+                        status=FAILED, error=f'Unknown job type "{job.type}"', finished_at=now
+                    )
+                    continue
+                limit = job_type.get_concurrency()
+                if limit is not None and running[job.type] >= limit:
+                    continue
+                if self.filter(pk=job.pk, status=QUEUED).update(
+                    status=RUNNING, attempts=F('attempts') + 1, worker=worker,
+                    started_at=now, heartbeat_at=now, finished_at=None
+                ):
+                    running[job.type] += 1
+                    claimed.append(job.pk)
+                    if len(claimed) >= capacity:
+                        break
+        return claimed
+
+    def heartbeat(self, job_ids):
+        if job_ids:
+            self.filter(pk__in=job_ids, status=RUNNING).update(heartbeat_at=timezone.now())
+
+    def purge(self, before):
+        """ Удаляет задачи, завершенные раньше before; их файлы удаляет delete_job_files """
+
+        return self.filter(status__in=(SUCCEEDED, FAILED), finished_at__lt=before).delete()[0]
+
+    def recover_stale(self):
+        """ Задачи, воркер которых перестал отвечать (упал или был убит), повторяются или завершаются ошибкой """
+
+        cutoff = timezone.now() - timedelta(seconds=settings.JOB_STALE_AFTER)
+        stale = list(self.filter(status=RUNNING, heartbeat_at__lt=cutoff))
+        for job in stale:
+            job.fail(f'Worker {job.worker} stopped responding')
+        return stale
+
+
+class Job(models.Model):
+    """ Фоновая задача, которую выполняет runworker (см. jobs.worker) """
+
+    type = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    progress = models.FloatField(default=0)  # Проценты
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    timeout = models.PositiveIntegerField()  # Секунды на одну попытку
+    run_after = models.DateTimeField(default=timezone.now)  # Не раньше, чем (повтор с задержкой)
+    worker = models.CharField(max_length=255, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(CustomUser, related_name='jobs', null=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = JobManager()
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=('status', 'run_after')),
+            models.Index(fields=('created_by', 'created_at')),
+        ]
+
+    def __str__(self):
+        return f'{self.type} #{self.pk} - {self.status}'
+
+    def file_name(self, name):
+        """ Имя файла задачи (загрузки и результаты) в job_storage """
+
+        return f'{self.pk}/{name}'
+
+    def owns_file(self, name):
+        return isinstance(name, str) and name.startswith(self.file_name('')) and '..' not in name
+
+    def delete_files(self):
+        shutil.rmtree(job_storage.path(str(self.pk)), ignore_errors=True)
+
+    def set_progress(self, percent):
+        """
+        Прогресс в процентах. Ошибка записи не прерывает задачу: SQLite не дает писать, пока у
+        процесса открыт курсор чтения (потоковая выгрузка), а другой процесс фиксирует запись.
+        Значение обновится при следующем вызове.
+        """
+
+        self.progress = round(min(max(percent, 0), 100), 1)
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=self.pk).update(progress=self.progress, heartbeat_at=timezone.now())
+        except OperationalError as e:
+            logger.warning('Job %s progress was not saved: %s', self.pk, e)
+
+    def succeed(self, result):
+        Job.objects.filter(pk=self.pk, status=RUNNING).update(
+            status=SUCCEEDED, result=result, error='', progress=100, finished_at=timezone.now()
+        )
+
+    def fail(self, error, retry=True):
+        """ Ошибка попытки: задача повторяется с растущей задержкой, пока есть попытки """
+
+        now = timezone.now()
+        running = Job.objects.filter(pk=self.pk, status=RUNNING)
+        if retry and self.attempts < self.max_attempts:
+            delay = settings.JOB_RETRY_DELAY * 2 ** max(self.attempts - 1, 0)
+            running.update(
+                status=QUEUED, error=error, run_after=now + timedelta(seconds=delay),
+                worker='', heartbeat_at=None
+            )
+        else:
+            running.update(status=FAILED, error=error, finished_at=now)
+
+
+@receiver(post_delete, sender=Job)
+def delete_job_files(sender, instance, **kwargs):
+    # Файлы удаляются только после фиксации: при откате задача остается вместе с ними
+    transaction.on_commit(instance.delete_files, using=kwargs.get('using'))
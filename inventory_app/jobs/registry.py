@@ -0,0 +1,43 @@
+from django.conf import settings
+
+
+class JobType:
+    """ Тип фоновой задачи: обработчик и его ограничения """
+
+    def __init__(self, name, handler, timeout=None, max_attempts=1, concurrency=None):
+        self.name = name
+        self.handler = handler
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+
+    def get_timeout(self):
+        return self.timeout or settings.JOB_DEFAULT_TIMEOUT
+
+    def get_concurrency(self):
+        """ Сколько задач этого типа может выполняться одновременно на всех воркерах, None - без ограничения """
+
+        return settings.JOB_CONCURRENCY.get(self.name, self.concurrency)
+
+
+_job_types = {}
+
+
+def job_handler(name, **options):
+    """
+    Регистрирует обработчик задачи: функцию, которая получает Job и возвращает результат,
+    сохраняемый в JSON. Параметры: timeout (секунды), max_attempts, concurrency.
+    """
+
+    def register(handler):
+        _job_types[name] = JobType(name, handler, **options)
+        return handler
+    return register
+
+
+def get_job_type(name):
+    return _job_types.get(name)
+
+
+def job_type_names():
+    return sorted(_job_types)
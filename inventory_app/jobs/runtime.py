@@ -0,0 +1,39 @@
+import signal
+from contextlib import contextmanager
+
+import django
+
+
+# Модуль импортируется в процессе пула до django.setup(), поэтому без моделей
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class JobError(Exception):
+    """ Ошибка в данных задачи: задача завершается без повторов, текст попадает в error """
+
+
+def init_process():
+    """ Инициализация процесса пула: Ctrl+C обрабатывает только runworker, он дожидается задач """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout
+
+
+@contextmanager
+def time_limit(seconds):
+    """ JobTimeout в основном потоке процесса через seconds секунд (SIGALRM) """
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
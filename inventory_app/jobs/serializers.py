@@ -0,0 +1,15 @@
+from rest_framework import serializers
+
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """ Сериализатор фоновой задачи: состояние, прогресс и результат """
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'type', 'status', 'payload', 'progress', 'result', 'error', 'attempts', 'max_attempts',
+            'timeout', 'run_after', 'created_by_id', 'created_at', 'started_at', 'finished_at'
+        )
+        read_only_fields = fields
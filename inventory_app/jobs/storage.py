@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import LazyObject
+
+
+class JobStorage(LazyObject):
+    """
+    Хранилище файлов задач (загрузки и результаты) в JOB_FILES_DIR, вне MEDIA_ROOT:
+    выгрузки содержат данные пользователей, поэтому файлы отдаются только через
+    GET /api/v1/jobs/<id>/result с проверкой доступа к задаче.
+    """
+
+    def _setup(self):
+        self._wrapped = FileSystemStorage(location=settings.JOB_FILES_DIR)
+
+
+job_storage = JobStorage()
@@ -0,0 +1,96 @@
+import time
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import FAILED, QUEUED, RUNNING, SUCCEEDED, Job
+from .registry import get_job_type, job_handler
+from .runtime import JobError
+from .worker import execute_job
+
+
+@job_handler('tests.echo', concurrency=1)
+def echo(job):
+    return job.payload
+
+
+@job_handler('tests.crash', max_attempts=2)
+def crash(job):
+    raise RuntimeError('boom')
+
+
+@job_handler('tests.invalid', max_attempts=3)
+def invalid(job):
+    raise JobError('bad payload')
+
+
+@job_handler('tests.slow', timeout=1, max_attempts=1)
+def slow(job):
+    time.sleep(5)
+
+
+@override_settings(JOB_RETRY_DELAY=10, JOB_CONCURRENCY={})
+class JobQueueTest(TestCase):
+    def submit(self, name, payload=None):
+        return Job.objects.submit(get_job_type(name), payload or {})
+
+    def run_next(self, job):
+        """ Забирает задачу (она должна быть готова) и выполняет ее в текущем процессе """
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(Job.objects.claim('test', 1), [job.pk])
+        execute_job(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def test_claim_respects_concurrency_limit(self):
+        first, second = self.submit('tests.echo', {'n': 1}), self.submit('tests.echo', {'n': 2})
+        self.assertEqual(Job.objects.claim('test', 5), [first.pk])
+        self.assertEqual(Job.objects.claim('test', 5), [])
+
+        execute_job(first.pk)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.result), (SUCCEEDED, {'n': 1}))
+        self.assertEqual(Job.objects.claim('test', 5), [second.pk])
+
+    def test_claim_fails_unknown_type(self):
+        job = Job.objects.create(type='tests.missing', timeout=10)
+        self.assertEqual(Job.objects.claim('test', 5), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, FAILED)
+
+    def test_crash_is_retried_with_backoff(self):
+        job = self.submit('tests.crash')
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            started = timezone.now()
+            job = self.run_next(job)
+        self.assertEqual((job.status, job.attempts), (QUEUED, 1))
+        self.assertIn('boom', job.error)
+        self.assertGreaterEqual(job.run_after, started + timedelta(seconds=10))
+        self.assertEqual(Job.objects.claim('test', 1), [])
+
+        with self.assertLogs('jobs.worker', 'ERROR'):
+            job = self.run_next(job)
+        self.assertEqual((job.status, job.attempts), (FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(JOB_RETRY_DELAY=1)
+    def test_retry_delay_doubles(self):
+        job = self.submit('tests.crash')
+        Job.objects.filter(pk=job.pk).update(status=RUNNING, attempts=2, max_attempts=3)
+        job.refresh_from_db()
+        now = timezone.now()
+        job.fail('again')
+        job.refresh_from_db()
+        self.assertEqual(job.status, QUEUED)
+        self.assertGreaterEqual(job.run_after, now + timedelta(seconds=2))
+
+    def test_job_error_is_not_retried(self):
+        job = self.run_next(self.submit('tests.invalid'))
+        self.assertEqual((job.status, job.attempts, job.error), (FAILED, 1, 'bad payload'))
+
+    def test_timeout(self):
+        job = self.run_next(self.submit('tests.slow'))
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.error, 'Job timed out after 1 s')
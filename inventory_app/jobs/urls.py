@@ -0,0 +1,13 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+
+from .views import JobView
+
+
+router = DefaultRouter(trailing_slash=False)
+
+router.register('jobs', JobView, basename='jobs')
+
+urlpatterns = [
+    path('', include(router.urls))
+]
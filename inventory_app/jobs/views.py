@@ -0,0 +1,66 @@
+import json
+import posixpath
+
+from django.http import FileResponse
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet
+
+from .models import Job, SUCCEEDED
+from .registry import get_job_type, job_type_names
+from .serializers import JobSerializer
+from .storage import job_storage
+from inventory.utils import CustomPagination
+from my_user.permissions import IsAuthenticatedCustom
+
+
+class JobView(ModelViewSet):
+    """
+    Фоновые задачи: POST ставит задачу в очередь и сразу возвращает ее id (202),
+    GET /jobs/<id> - состояние, прогресс и результат, GET /jobs - задачи пользователя,
+    GET /jobs/<id>/result - файл результата (выгрузка, прогноз).
+
+    Тело POST: type и payload (JSON объект). В multipart запросе payload передается
+    строкой JSON, а файлы сохраняются в каталог задачи и попадают в payload под своими
+    ключами (например, data для inventory.import_csv).
+    """
+
+    http_method_names = ('get', 'post')
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticatedCustom,)
+    pagination_class = CustomPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.role == 'admin' or user.is_superuser:
+            return self.queryset
+        return self.queryset.filter(created_by=user)
+
+    def create(self, request, *args, **kwargs):
+        job_type = get_job_type(request.data.get('type'))
+        if job_type is None:
+            raise ValidationError({'type': [f'Expected one of: {", ".join(job_type_names())}']})
+
+        payload = request.data.get('payload') or {}
+        if isinstance(payload, str):
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                payload = None
+        if not isinstance(payload, dict):
+            raise ValidationError({'payload': ['Payload must be a JSON object']})
+
+        job = Job.objects.submit(job_type, payload, request.user, files=request.FILES)
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, *args, **kwargs):
+        # get_object проверяет доступ к задаче так же, как GET /jobs/<id>
+        job = self.get_object()
+        name = job.result.get('file') if isinstance(job.result, dict) else None
+        if job.status != SUCCEEDED or not job.owns_file(name) or not job_storage.exists(name):
+            raise NotFound('Job has no result file')
+        return FileResponse(job_storage.open(name, 'rb'), as_attachment=True, filename=posixpath.basename(name))
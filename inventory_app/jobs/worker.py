@@ -0,0 +1,156 @@
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .models import Job, RUNNING
+from .registry import get_job_type
+from .runtime import JobError, JobTimeout, init_process, time_limit
+
+
+logger = logging.getLogger(__name__)
+
+
+def _abort(job_id, timeout):
+    """ Сторож процесса: задача не прервалась по SIGALRM (висит в C коде), процесс завершается """
+
+    job = Job.objects.filter(pk=job_id, status=RUNNING).first()
+    if job is not None:
+        job.fail(f'Job timed out after {timeout} s and its process was terminated')
+    connections.close_all()
+    os._exit(1)
+
+
+def execute_job(job_id):
+    """ Выполнение задачи в процессе пула. Ошибки обработчика записываются в задачу """
+
+    job = Job.objects.filter(pk=job_id, status=RUNNING).first()
+    if job is None:
+        return
+    job_type = get_job_type(job.type)
+    watchdog = threading.Timer(job.timeout + settings.JOB_TIMEOUT_GRACE, _abort, (job.pk, job.timeout))
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        with time_limit(job.timeout):
+            result = job_type.handler(job)
+    except JobTimeout:
+        job.fail(f'Job timed out after {job.timeout} s')
+    except JobError as e:
+        job.fail(str(e), retry=False)
+    except Exception:
+        logger.exception('Job %s (%s) failed', job.pk, job.type)
+        job.fail(traceback.format_exc())
+    else:
+        job.succeed(result)
+    finally:
+        watchdog.cancel()
+        # У процесса пула нет цикла запросов, соединения закрываем после каждой задачи
+        connections.close_all()
+
+
+class Worker:
+    """
+    Воркер очереди задач: забирает задачи из БД и выполняет их в пуле процессов.
+
+    Свободные места пула заполняются задачами с учетом ограничений типов (Job.objects.claim),
+    у выполняемых задач обновляется heartbeat_at. Задачи с устаревшим heartbeat (воркер упал)
+    повторяются. Если процесс пула погиб (память, сторож таймаута), пул создается заново,
+    а его задачи повторяются или завершаются ошибкой.
+    """
+
+    def __init__(self, processes=None, poll_interval=None, name=None):
+        self.processes = processes or settings.JOB_WORKERS
+        self.poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.running = {}
+        self.stopping = False
+        self.executor = None
+        self.recovered_at = 0
+
+    def stop(self):
+        self.stopping = True
+
+    def run(self, burst=False):
+        """ Выполняет задачи до stop(), при burst - пока в очереди есть готовые задачи """
+
+        self.executor = self.create_executor()
+        try:
+            while not self.stopping or self.running:
+                claimed = self.tick()
+                if burst and not claimed and not self.running:
+                    break
+                if self.running:
+                    wait(list(self.running), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                elif not claimed:
+                    time.sleep(self.poll_interval)
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def create_executor(self):
+        # spawn, а не fork: процессы пула не должны наследовать соединения с БД
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_process
+        )
+
+    def tick(self):
+        try:
+            self.collect()
+            if time.monotonic() - self.recovered_at > settings.JOB_STALE_AFTER / 4:
+                self.recovered_at = time.monotonic()
+                for job in Job.objects.recover_stale():
+                    logger.warning('Job %s (%s) was abandoned by worker %s', job.pk, job.type, job.worker)
+            Job.objects.heartbeat(list(self.running.values()))
+
+            free = self.processes - len(self.running)
+            if self.stopping or free <= 0:
+                return []
+            claimed = Job.objects.claim(self.name, free)
+            for job_id in claimed:
+                self.running[self.executor.submit(execute_job, job_id)] = job_id
+            return claimed
+        except BrokenProcessPool:
+            self.restart_pool()
+            return []
+        except Exception:
+            # Ошибка БД не должна останавливать воркер: соединение переоткроется на следующем шаге
+            logger.exception('Job worker %s failed to poll the queue', self.name)
+            close_old_connections()
+            return []
+
+    def collect(self):
+        """ Убирает завершенные задачи из running, при гибели процесса пула - BrokenProcessPool """
+
+        broken = None
+        for future in [future for future in self.running if future.done()]:
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                broken = error
+                continue
+            job_id = self.running.pop(future)
+            if error is not None:
+                # execute_job сам записывает ошибки обработчика, сюда попадают только сбои до его запуска
+                logger.error('Job %s could not be executed: %r', job_id, error)
+                job = Job.objects.filter(pk=job_id, status=RUNNING).first()
+                if job is not None:
+                    job.fail(repr(error))
+        if broken is not None:
+            raise broken
+
+    def restart_pool(self):
+        logger.error('Job worker %s lost a pool process, restarting the pool', self.name)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for job in Job.objects.filter(pk__in=list(self.running.values()), status=RUNNING):
+            job.fail('Worker process exited unexpectedly')
+        self.running = {}
+        self.executor = self.create_executor()
@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import heapq
+import json
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import ActivityArchive, UserActivities
+from .partitions import detach_partition, drop_table, month_bounds
+
+
+COLUMNS = ('id', 'user_id', 'email', 'fullname', 'action', 'created_at')
+CHUNK_SIZE = 5000
+
+
+def archive_path(file_name):
+    return os.path.join(settings.USER_ACTIVITIES_ARCHIVE_DIR, file_name)
+
+
+def read_archive(archive):
+    """ Строки архива месяца как несохраненные UserActivities, от новых к старым """
+
+    with gzip.open(archive_path(archive.file_name), 'rt', encoding='utf-8') as file:
+        for line in file:
+            row = json.loads(line)
+            row['created_at'] = parse_datetime(row['created_at'])
+            yield UserActivities(**row)
+
+
+def _newest_first(obj):
+    return obj.created_at, obj.id
+
+
+class ArchivedRows:
+    """
+    Отфильтрованные строки архивного месяца для постраничной пагинации. Файл читается потоком
+    при подсчете и при выборке страницы, в памяти держится только страница. Строки месяца,
+    записанные в БД уже после архивации (live), подмешиваются в том же порядке.
+    """
+
+    def __init__(self, archive, filterset, live=()):
+        self.archive = archive
+        self.filterset = filterset
+        self.live = sorted(live, key=_newest_first, reverse=True)
+
+    def __iter__(self):
+        rows = heapq.merge(read_archive(self.archive), self.live, key=_newest_first, reverse=True)
+        return self.filterset.filter_objects(rows)
+
+    def count(self):
+        return sum(1 for _ in self)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('Archived rows support only slicing')
+        return list(islice(self, index.start, index.stop))
+
+
+def month_activities(month, using='default'):
+    start, end = month_bounds(month)
+    return UserActivities.objects.using(using).filter(created_at__gte=start, created_at__lt=end)
+
+
+def _newest_row_first(row):
+    return row[-1], row[0]
+
+
+def detached_rows(connection, table):
+    """ Строки отсоединенной партиции месяца (см. detach_partition), от новых к старым """
+
+    quote = connection.ops.quote_name
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(
+            f'SELECT {", ".join(map(quote, COLUMNS))} FROM {quote(table)} ORDER BY created_at DESC, id DESC'
+        )
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                return
+            yield from rows
+
+
+def archive_month(month, using='default'):
+    """
+    Переносит активность за месяц в сжатый файл user-activities-YYYY-MM-<sha256>.ndjson.gz
+    (строка JSON на действие, от новых к старым) и удаляет ее из БД.
+
+    На PostgreSQL партиция месяца сначала отсоединяется, после записи файла ее таблица удаляется.
+    Из самой таблицы активности (SQLite, партиция по умолчанию) удаляются только строки, попавшие
+    в файл: строки, записанные во время архивации, остаются в БД до следующего запуска.
+
+    Если месяц уже в архиве (в БД остались строки, записанные с задержкой), файл пересобирается
+    вместе с ними. Новый файл пишется под новым именем, запись об архиве, удаление строк и таблицы
+    партиции - в одной транзакции, прежний файл удаляется после нее. При ошибке до фиксации запись
+    об архиве указывает на прежний файл, а строки остаются в БД, поэтому повторный запуск
+    не дублирует их.
+    """
+
+    connection = connections[using]
+    os.makedirs(settings.USER_ACTIVITIES_ARCHIVE_DIR, exist_ok=True)
+    archived = ActivityArchive.objects.using(using).filter(month=month).first()
+    detached = detach_partition(connection, month)
+
+    archived_ids = []
+
+    def live_rows():
+        rows = month_activities(month, using).order_by('-created_at', '-id').values_list(*COLUMNS)
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            archived_ids.append(row[0])
+            yield row
+
+    sources = [live_rows()]
+    if detached is not None:
+        sources.append(detached_rows(connection, detached))
+    if archived is not None:
+        sources.append(tuple(getattr(obj, column) for column in COLUMNS) for obj in read_archive(archived))
+
+    count, seen = 0, set()
+    temporary = archive_path(f'user-activities-{month:%Y-%m}.ndjson.gz.tmp')
+    with gzip.open(temporary, 'wt', encoding='utf-8') as file:
+        for row in heapq.merge(*sources, key=_newest_row_first, reverse=True):
+            # Строка могла попасть и в прежний архив, и остаться в БД (архив до исправления)
+            if row[0] in seen:
+                continue
+            seen.add(row[0])
+            row = dict(zip(COLUMNS, row))
+            # Время с микросекундами (DjangoJSONEncoder округляет до миллисекунд)
+            row['created_at'] = row['created_at'].isoformat()
+            file.write(json.dumps(row, ensure_ascii=False))
+            file.write('\n')
+            count += 1
+
+    digest = hashlib.sha256()
+    with open(temporary, 'rb') as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(chunk)
+    file_name = f'user-activities-{month:%Y-%m}-{digest.hexdigest()[:16]}.ndjson.gz'
+    os.replace(temporary, archive_path(file_name))
+
+    start, end = month_bounds(month)
+    with transaction.atomic(using=using):
+        archive, _ = ActivityArchive.objects.using(using).update_or_create(month=month, defaults={
+            'file_name': file_name,
+            'rows': count,
+            'size': os.path.getsize(archive_path(file_name)),
+            'sha256': digest.hexdigest(),
+        })
+        for index in range(0, len(archived_ids), CHUNK_SIZE):
+            UserActivities.objects.using(using).filter(
+                created_at__gte=start, created_at__lt=end, id__in=archived_ids[index:index + CHUNK_SIZE]
+            ).delete()
+        if detached is not None:
+            drop_table(connection, detached)
+
+    if archived is not None and archived.file_name != file_name:
+        try:
+            os.remove(archive_path(archived.file_name))
+        except FileNotFoundError:
+            pass
+    return archive
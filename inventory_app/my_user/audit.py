@@ -0,0 +1,174 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import OperationalError, connection, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import UserActivities
+
+
+logger = logging.getLogger(__name__)
+
+
+class ActivitySink:
+    """ Базовый приемник записей активности пользователей """
+
+    def emit(self, records):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class SyncActivitySink(ActivitySink):
+    """ Синхронная запись одним bulk_create в момент вызова, удобно для тестов """
+
+    def emit(self, records):
+        UserActivities.objects.bulk_create(records)
+
+
+class BufferedActivitySink(ActivitySink):
+    """
+    Накапливает записи в памяти и пишет их пачками из фонового потока:
+    при достижении batch_size записей или раз в flush_interval секунд.
+    Записи попадают в буфер только после фиксации текущей транзакции, при откате
+    они отбрасываются вместе с ней. Остаток буфера сбрасывается при завершении процесса.
+
+    Если БД недоступна, пачка возвращается в буфер (не больше max_buffer записей),
+    если пачку не принимает БД из-за отдельных записей, остальные пишутся по одной.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_buffer=None):
+        self.batch_size = batch_size or settings.USER_ACTIVITIES_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.USER_ACTIVITIES_FLUSH_INTERVAL
+        self.max_buffer = max_buffer or self.batch_size * 100
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def emit(self, records):
+        transaction.on_commit(lambda: self._append(records))
+
+    def _append(self, records):
+        with self._lock:
+            self._buffer.extend(records)
+            is_full = len(self._buffer) >= self.batch_size
+            # После fork поток родителя в дочернем процессе не существует, запускаем заново
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='user-activities-writer', daemon=True
+                )
+                self._thread.start()
+        if is_full:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return
+            try:
+                # Отдельная транзакция (или точка сохранения): ошибка не ломает внешнюю транзакцию
+                with transaction.atomic():
+                    UserActivities.objects.bulk_create(records, batch_size=self.batch_size)
+            except OperationalError:
+                logger.exception('Failed to write %s user activities, will retry', len(records))
+                connection.close_if_unusable_or_obsolete()
+                self._requeue(records)
+            except Exception:
+                logger.exception('Failed to write %s user activities in a batch, writing one by one', len(records))
+                self._write_each(records)
+
+    def _requeue(self, records):
+        with self._lock:
+            self._buffer[:0] = records
+            dropped = len(self._buffer) - self.max_buffer
+            if dropped > 0:
+                del self._buffer[:dropped]
+        if dropped > 0:
+            logger.error('User activities buffer is full, dropped %s oldest records', dropped)
+
+    @staticmethod
+    def _write_each(records):
+        for record in records:
+            try:
+                with transaction.atomic():
+                    UserActivities.objects.bulk_create([record])
+            except Exception:
+                logger.exception('Failed to write user activity "%s" of user %s', record.action, record.user_id)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+    def _run(self):
+        try:
+            while not self._closed:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self.flush()
+        finally:
+            connection.close()
+
+
+class TransactionalActivitySink(ActivitySink):
+    """ Передает записи дальше только после фиксации текущей транзакции """
+
+    def __init__(self, sink=None):
+        self.sink = sink or SyncActivitySink()
+
+    def emit(self, records):
+        transaction.on_commit(lambda: self.sink.emit(records))
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+
+ACTIVITY_SINKS = {
+    'sync': SyncActivitySink,
+    'buffered': BufferedActivitySink,
+    'transactional': TransactionalActivitySink,
+}
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_activity_sink():
+    """ Приемник из настройки USER_ACTIVITIES_SINK: псевдоним или путь к классу """
+
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                sink_class = ACTIVITY_SINKS.get(settings.USER_ACTIVITIES_SINK)
+                if sink_class is None:
+                    sink_class = import_string(settings.USER_ACTIVITIES_SINK)
+                _sink = sink_class()
+                atexit.register(_sink.close)
+    return _sink
+
+
+@receiver(setting_changed)
+def reset_activity_sink(*, setting, **kwargs):
+    global _sink
+    if setting.startswith('USER_ACTIVITIES_') and _sink is not None:
+        _sink.close()
+        _sink = None
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import transaction
+
+
+# Бэкенды, данные которых видит только текущий процесс
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_process_local_cache(alias=DEFAULT_CACHE_ALIAS):
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+class TTLCache:
+    """ Потокобезопасный LRU кэш в памяти процесса с временем жизни записей """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+# Расшифрованные токены: токен -> (user_id, exp)
+token_cache = TTLCache(settings.JWT_CACHE_MAXSIZE, settings.JWT_CACHE_TTL)
+# Пользователи по id, сбрасываются при сохранении и удалении пользователя
+user_cache = TTLCache(settings.JWT_CACHE_MAXSIZE, settings.JWT_CACHE_TTL)
+
+
+def invalidate_user(user_id):
+    """
+    Сбрасывает пользователя из кэша текущего процесса.
+    Остальные процессы увидят изменения не позже чем через JWT_CACHE_TTL секунд.
+    """
+
+    user_cache.delete(user_id)
+
+
+def auth_cache_stats():
+    return {
+        'tokens': token_cache.stats(),
+        'users': user_cache.stats(),
+    }
+
+
+def _version_key(resource):
+    return f'version:{resource}'
+
+
+def get_versions(*resources):
+    """
+    Текущие версии ресурсов ('inventory', 'group', 'shop', 'invoice', 'user') из общего кэша.
+    Версия - время последнего изменения в микросекундах, поэтому потеря ключа
+    в кэше не возвращает старую версию. С кэшем в памяти процесса (locmem) версии у каждого
+    процесса свои, и другие процессы отдают из кэша ответы, устаревшие после записи
+    (см. check_shared_cache).
+    """
+
+    keys = [_version_key(resource) for resource in resources]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = time.time_ns() // 1000
+            cache.add(key, version, timeout=None)
+            versions[key] = cache.get(key, version)
+    return tuple(versions[key] for key in keys)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """ manage.py check --deploy: версии ресурсов и кэш ответов должны быть общими для процессов """
+
+    if not is_process_local_cache():
+        return []
+    return [checks.Warning(
+        'The default cache is local to each process: resource versions and cached responses '
+        'are not shared, so other processes keep serving responses that are stale after a write.',
+        hint='Set CACHE_BACKEND (and CACHE_LOCATION) to a shared cache such as Redis, Memcached or files.',
+        id='my_user.W001',
+    )]
+
+
+def bump_versions(*resources):
+    """ Новая версия ресурсов после фиксации текущей транзакции """
+
+    def bump():
+        version = time.time_ns() // 1000
+        cache.set_many({_version_key(resource): version for resource in resources}, timeout=None)
+
+    transaction.on_commit(bump)
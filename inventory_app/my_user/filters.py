@@ -0,0 +1,11 @@
+from inventory.filters import DATE_LOOKUPS, ID_LOOKUPS, Filter, FilterSet, parse_moment
+
+
+class UserActivitiesFilter(FilterSet):
+    filters = {
+        'user_id': Filter(int, ID_LOOKUPS + ('isnull',)),
+        'email': Filter(str),
+        'created_at': Filter(parse_moment, DATE_LOOKUPS),
+    }
+    # Месяц (YYYY-MM), в том числе архивный, обрабатывает UserActivitiesView
+    reserved_params = FilterSet.reserved_params + ('month',)
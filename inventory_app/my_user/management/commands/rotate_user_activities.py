@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Min
+from django.utils import timezone
+
+from my_user.archive import archive_month, month_activities
+from my_user.models import UserActivities
+from my_user.partitions import add_months, detached_months, ensure_partitions, month_bounds, month_of
+
+
+class Command(BaseCommand):
+    help = (
+        'Обслуживание журнала активности: создает партиции на месяцы вперед (PostgreSQL) '
+        'и переносит месяцы старше USER_ACTIVITIES_RETENTION_MONTHS в сжатые архивы. '
+        'Архивные месяцы по-прежнему доступны в /api/v1/user/users-activities?month=YYYY-MM'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-months', type=int, default=settings.USER_ACTIVITIES_RETENTION_MONTHS)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать месяцы для архивации')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['retention_months'] < 1:
+            raise CommandError('Retention must be at least one month (the current one)')
+        using = options['database']
+        current = month_of(timezone.now())
+        # Первый месяц, который остается в БД
+        keep_from = add_months(current, 1 - options['retention_months'])
+
+        if not options['dry_run']:
+            created = ensure_partitions(
+                connections[using], keep_from, add_months(current, settings.USER_ACTIVITIES_PARTITIONS_AHEAD)
+            )
+            for month in created:
+                self.stdout.write(f'Partition created for {month:%Y-%m}')
+
+        # Месяцы, архивация которых прервалась после отсоединения партиции, доводятся до конца
+        months = set(detached_months(connections[using]))
+        oldest = UserActivities.objects.using(using).filter(
+            created_at__lt=month_bounds(keep_from)[0]
+        ).aggregate(oldest=Min('created_at'))['oldest']
+        month = keep_from if oldest is None else month_of(oldest)
+        while month < keep_from:
+            if month_activities(month, using).exists():
+                months.add(month)
+            month = add_months(month, 1)
+        if not months:
+            self.stdout.write(self.style.SUCCESS('Nothing to archive'))
+            return
+
+        for month in sorted(months):
+            if options['dry_run']:
+                self.stdout.write(f'Would archive {month:%Y-%m}')
+            else:
+                archive = archive_month(month, using)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Archived {month:%Y-%m}: {archive.rows} rows, {archive.size} bytes ({archive.file_name})'
+                ))
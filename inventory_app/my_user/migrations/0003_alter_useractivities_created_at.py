@@ -0,0 +1,19 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:42
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_user', '0002_useractivities'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useractivities',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_user', '0003_alter_useractivities_created_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivities',
+            index=models.Index(fields=['created_at', 'id'], name='my_user_use_created_02217e_idx'),
+        ),
+    ]
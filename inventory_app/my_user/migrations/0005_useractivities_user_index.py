@@ -0,0 +1,17 @@
+# Generated by Django 4.0.5 on 2026-10-17 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_user', '0004_useractivities_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useractivities',
+            index=models.Index(fields=['user', 'created_at'], name='my_user_use_user_id_818de6_idx'),
+        ),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 4.0.5 on 2026-10-17 12:41
+
+import re
+from datetime import date, datetime, time
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Миграция не зависит от кода приложения: таблица берется из apps.get_model, SQL - здесь.
+# Имена партиций совпадают с my_user.partitions.partition_name, дальше партиции создает она же.
+MONTHS_AHEAD = 3
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(month):
+    moment = datetime.combine(month, time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def is_partitioned(cursor, table):
+    cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [table])
+    return cursor.fetchone() is not None
+
+
+def table_definition(cursor, table):
+    """ Индексы (кроме первичного ключа) и внешние ключи таблицы, чтобы пересоздать их на новой """
+
+    cursor.execute(
+        'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s',
+        [table, f'{table}_pkey']
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [table]
+    )
+    return indexes, cursor.fetchall()
+
+
+def rebuild_table(schema_editor, table, partitioned):
+    """
+    Пересоздает таблицу обычной или разбитой на месячные партиции (по created_at, плюс партиция
+    по умолчанию) с теми же колонками, последовательностью id, индексами и внешними ключами.
+    У разбитой таблицы первичный ключ (id, created_at): ключ партиции должен в него входить.
+    """
+
+    quote = schema_editor.quote_name
+    old = f'{table}_old'
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = table_definition(cursor, table)
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+        partition_by = ' PARTITION BY RANGE (created_at)' if partitioned else ''
+        cursor.execute(f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS){partition_by}')
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [old, 'id'])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+
+        if partitioned:
+            cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+            cursor.execute(f'SELECT MIN(created_at) FROM {quote(old)}')
+            oldest = cursor.fetchone()[0]
+            current = timezone.localtime().date().replace(day=1)
+            month = min(timezone.localtime(oldest).date().replace(day=1), current) if oldest else current
+            while month <= add_months(current, MONTHS_AHEAD):
+                cursor.execute(
+                    f'CREATE TABLE {quote(f"{table}_p{month:%Y%m}")} PARTITION OF {quote(table)} '
+                    f'FOR VALUES FROM (%s) TO (%s)',
+                    [month_start(month).isoformat(), month_start(add_months(month, 1)).isoformat()]
+                )
+                month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old)}')
+        cursor.execute(f'DROP TABLE {quote(old)} CASCADE')
+        key = '(id, created_at)' if partitioned else '(id)'
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_pkey")} PRIMARY KEY {key}')
+        for indexdef in indexes:
+            cursor.execute(re.sub(r' ON (ONLY )?\S+ ', f' ON {quote(table)} ', indexdef, count=1))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+
+
+def partition_table(apps, schema_editor):
+    """ На PostgreSQL переводит таблицу активности на месячные партиции """
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('my_user', 'UserActivities')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        partitioned = is_partitioned(cursor, table)
+    if not partitioned:
+        rebuild_table(schema_editor, table, partitioned=True)
+
+
+def unpartition_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('my_user', 'UserActivities')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        partitioned = is_partitioned(cursor, table)
+    if partitioned:
+        rebuild_table(schema_editor, table, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_user', '0005_useractivities_user_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('rows', models.PositiveIntegerField()),
+                ('size', models.PositiveBigIntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ('-month',),
+            },
+        ),
+        # Только PostgreSQL: таблица активности переводится на месячные партиции по created_at
+        migrations.RunPython(partition_table, unpartition_table),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils import timezone
+
+from .cache import bump_versions, invalidate_user
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
 
@@ -48,9 +51,26 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     objects = CustomUserManager()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Без обращения к отложенным полям, чтобы only() не вызывал лишних запросов
+        self.old_fullname = self.__dict__.get('fullname')
+        self.old_email = self.__dict__.get('email')
+
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_user(self.pk)
+        bump_versions('user')
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        super().delete(*args, **kwargs)
+        invalidate_user(user_id)
+        bump_versions('user')
+
     class Meta:
         ordering = ('created_at',)
 
@@ -64,10 +84,32 @@ class UserActivities(models.Model):
     email = models.EmailField()
     fullname = models.CharField(max_length=255)
     action = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Время действия, а не записи: активность пишется в БД пачками с задержкой
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=('created_at', 'id')),
+            models.Index(fields=('user', 'created_at')),
+        ]
 
     def __str__(self):
         return f'{self.fullname} {self.action} - {self.created_at.strftime("%H:%M %d-%m-%Y")}'
+
+
+class ActivityArchive(models.Model):
+    """ Месяц активности, перенесенный из БД в сжатый архив (см. my_user.archive) """
+
+    month = models.DateField(unique=True)  # Первое число месяца
+    file_name = models.CharField(max_length=255)  # Относительно USER_ACTIVITIES_ARCHIVE_DIR
+    rows = models.PositiveIntegerField()
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-month',)
+
+    def __str__(self):
+        return f'{self.month:%Y-%m} ({self.rows} rows)'
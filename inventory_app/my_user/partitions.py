@@ -0,0 +1,144 @@
+import re
+from datetime import date, datetime, time
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UserActivities
+
+
+TABLE = UserActivities._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def parse_month(value):
+    """ Месяц из строки YYYY-MM (первое число месяца) """
+
+    match = re.fullmatch(r'(\d{4})-(\d{2})', value or '')
+    if match is None:
+        raise ValueError(value)
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(moment):
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def month_bounds(month):
+    """ Полуинтервал [начало месяца, начало следующего) в текущей временной зоне """
+
+    def start_of(day):
+        moment = datetime.combine(day, time.min)
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+    return start_of(month), start_of(add_months(month, 1))
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(connection):
+    """ Таблица активности разбита на партиции (только PostgreSQL) """
+
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def existing_partitions(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)', [TABLE]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_partition(connection, month):
+    """
+    Создает партицию месяца, если ее нет. Строки этого месяца, успевшие попасть в партицию
+    по умолчанию, переносятся в новую. Возвращает True, если партиция создана.
+    """
+
+    name = partition_name(month)
+    if name in existing_partitions(connection):
+        return False
+
+    quote = connection.ops.quote_name
+    start, end = month_bounds(month)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} '
+            f'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+            f'INSERT INTO {quote(name)} SELECT * FROM moved', [start, end]
+        )
+        cursor.execute(
+            f'ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)',
+            # Границы партиции - строковые литералы (выражения в них разрешены только с PostgreSQL 12)
+            [start.isoformat(), end.isoformat()]
+        )
+    return True
+
+
+def ensure_partitions(connection, first_month, last_month):
+    """ Партиции для месяцев [first_month, last_month], на SQLite ничего не делает """
+
+    if not is_partitioned(connection):
+        return []
+    created = []
+    month = first_month
+    while month <= last_month:
+        if ensure_partition(connection, month):
+            created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+def detach_partition(connection, month):
+    """
+    Отсоединяет партицию месяца перед архивацией (только PostgreSQL) и возвращает имя ее таблицы,
+    None - партиции нет. В отсоединенную таблицу больше никто не пишет, строки месяца, записанные
+    позже, попадают в партицию по умолчанию. Таблица, оставшаяся отсоединенной после прерванной
+    архивации, возвращается как есть.
+    """
+
+    if not is_partitioned(connection):
+        return None
+    quote = connection.ops.quote_name
+    name = partition_name(month)
+    if name in existing_partitions(connection):
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}')
+        return name
+    return name if name in detached_partitions(connection) else None
+
+
+def detached_partitions(connection):
+    """ Таблицы месяцев, отсоединенные от таблицы активности, но еще не удаленные """
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE %s", [f'{TABLE}_p%'])
+        names = {row[0] for row in cursor.fetchall() if re.fullmatch(rf'{TABLE}_p\d{{6}}', row[0])}
+    return names - existing_partitions(connection)
+
+
+def detached_months(connection):
+    if not is_partitioned(connection):
+        return []
+    return sorted(date(int(name[-6:-2]), int(name[-2:]), 1) for name in detached_partitions(connection))
+
+
+def drop_table(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
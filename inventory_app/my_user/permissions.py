@@ -20,3 +20,11 @@ class IsAuthenticatedCustom(BasePermission):
 
         request.user = user
         return True
+
+
+class IsAdminCustom(IsAuthenticatedCustom):
+
+    def has_permission(self, request, view):
+        if not super().has_permission(request, view):
+            return False
+        return request.user.role == 'admin' or request.user.is_superuser
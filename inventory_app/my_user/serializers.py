@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from .models import CustomUser, UserActivities, ROLES
+from inventory.utils import DynamicFieldsMixin
 
 
 class CreateUserSerializer(serializers.Serializer):
@@ -26,7 +27,7 @@ class UpdatePasswordSerializer(serializers.Serializer):
     password = serializers.CharField()
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """ Сериализатор для получения информации о пользователе """
 
     class Meta:
@@ -34,7 +35,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
         exclude = ('password', )
 
 
-class UserActivitiesSerializer(serializers.ModelSerializer):
+class UserActivitiesSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """ Сериализатор активности пользователей """
 
     class Meta:
@@ -1,3 +1,111 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import OperationalError, transaction
+from django.test import TestCase, override_settings
+
+from .archive import archive_month, read_archive
+from .audit import BufferedActivitySink
+from .models import ActivityArchive, CustomUser, UserActivities
+from .partitions import month_bounds
+from .utils import add_user_activities
+
+
+class BufferedActivitySinkTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(email='admin@example.com', fullname='Admin User', role='admin')
+        self.sink = BufferedActivitySink(flush_interval=60)
+        patcher = mock.patch('my_user.utils.get_activity_sink', return_value=self.sink)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.sink.close)
+
+    def actions(self):
+        return list(UserActivities.objects.order_by('id').values_list('action', flat=True))
+
+    def test_rolled_back_activities_are_not_written(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                add_user_activities(self.user, 'added new invoice')
+                raise ValueError
+            add_user_activities(self.user, 'added new shop')
+        self.sink.flush()
+        self.assertEqual(self.actions(), ['added new shop'])
+
+    def test_batch_is_retried_when_database_is_unavailable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            add_user_activities(self.user, 'first')
+            add_user_activities(self.user, 'second')
+        with mock.patch.object(UserActivities.objects, 'bulk_create', side_effect=OperationalError), \
+                self.assertLogs('my_user.audit', 'ERROR'):
+            self.sink.flush()
+        self.assertEqual(self.actions(), [])
+        self.sink.flush()
+        self.assertEqual(self.actions(), ['first', 'second'])
+
+    def test_bad_record_does_not_drop_the_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            add_user_activities(self.user, 'first')
+            self.sink.emit([UserActivities(user_id=self.user.id, email=None, fullname='x', action='bad')])
+            add_user_activities(self.user, 'second')
+        with self.assertLogs('my_user.audit', 'ERROR'):
+            self.sink.flush()
+        self.assertEqual(self.actions(), ['first', 'second'])
+
+
+class ArchiveMonthTest(TestCase):
+    month = date(2020, 1, 1)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(USER_ACTIVITIES_ARCHIVE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.start = month_bounds(self.month)[0]
+        for index in range(3):
+            self.add_activity(f'action {index}')
+
+    def add_activity(self, action):
+        count = UserActivities.objects.count()
+        return UserActivities.objects.create(
+            user_id=1, email='admin@example.com', fullname='Admin User', action=action,
+            created_at=self.start + timedelta(hours=count + 1)
+        )
+
+    def archived_actions(self):
+        return sorted(obj.action for obj in read_archive(ActivityArchive.objects.get(month=self.month)))
+
+    def test_rows_written_during_archiving_stay_in_database(self):
+        replace = os.replace
+
+        def replace_after_late_write(*args):
+            self.add_activity('late')
+            replace(*args)
+
+        with mock.patch('my_user.archive.os.replace', replace_after_late_write):
+            archive_month(self.month)
+        self.assertEqual(self.archived_actions(), ['action 0', 'action 1', 'action 2'])
+        self.assertEqual(list(UserActivities.objects.values_list('action', flat=True)), ['late'])
+
+        archive_month(self.month)
+        self.assertEqual(self.archived_actions(), ['action 0', 'action 1', 'action 2', 'late'])
+        self.assertFalse(UserActivities.objects.exists())
+
+    def test_failed_rearchive_does_not_duplicate_rows(self):
+        first = archive_month(self.month)
+        self.add_activity('late')
+        with mock.patch('my_user.archive.os.path.getsize', side_effect=OSError), self.assertRaises(OSError):
+            archive_month(self.month)
+        self.assertEqual(ActivityArchive.objects.get(month=self.month).file_name, first.file_name)
+        self.assertEqual(self.archived_actions(), ['action 0', 'action 1', 'action 2'])
+        self.assertEqual(UserActivities.objects.count(), 1)
+
+        archive = archive_month(self.month)
+        self.assertEqual(archive.rows, 4)
+        self.assertEqual(self.archived_actions(), ['action 0', 'action 1', 'action 2', 'late'])
+        # Прежний файл удален, файл прерванной попытки совпал с новым
+        self.assertEqual(os.listdir(self.directory), [archive.file_name])
@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    CreateUserView, LoginView, UpdatePasswordView, CustomUserView, UserActivitiesView, UsersListView
+    CreateUserView, LoginView, UpdatePasswordView, CustomUserView, UserActivitiesView, UsersListView,
+    AuthCacheStatsView, UserActivitiesExportView
 )
 
 router = DefaultRouter(trailing_slash=False)
@@ -12,7 +13,9 @@ router.register('login', LoginView, 'login')
 router.register('update-password', UpdatePasswordView, 'update password')
 router.register('me', CustomUserView, 'me')
 router.register('users-activities', UserActivitiesView, 'users activities')
+router.register('users-activities-export', UserActivitiesExportView, 'users activities export')
 router.register('users-list', UsersListView, 'users list')
+router.register('auth-cache-stats', AuthCacheStatsView, 'auth cache stats')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,7 +1,13 @@
+import copy
+import time
+
 import jwt
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
 
+from .audit import get_activity_sink
+from .cache import token_cache, user_cache
 from .models import CustomUser, UserActivities
 
 
@@ -16,28 +22,60 @@ def get_access_token(payload, days):
     return token
 
 
-def decodeJWT(bearer):
+def token_user_id(bearer):
+    """ id пользователя из заголовка авторизации без обращения к БД, None для неверного токена """
+
     if not bearer:
         return None
     token = bearer[7:]
+
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         decoded = jwt.decode(
             token, key=settings.SECRET_KEY, algorithms='HS256'
         )
+        user_id = decoded['user_id']
     except Exception:
         return None
+    exp = decoded.get('exp')
+    # Запись в кэше не переживает срок действия токена
+    token_cache.set(token, user_id, ttl=exp - time.time() if exp else None)
+    return user_id
+
+
+def decodeJWT(bearer):
+    """ Пользователь по заголовку авторизации. Токены и пользователи кэшируются (см. my_user.cache) """
 
-    if decoded:
+    user_id = token_user_id(bearer)
+    if user_id is None:
+        return None
+
+    user = user_cache.get(user_id)
+    if user is None:
         try:
-            return CustomUser.objects.get(id=decoded['user_id'])
+            # Пользователь попадает в кэш, поэтому читается из основной БД, а не из реплики
+            user = CustomUser.objects.using(DEFAULT_DB_ALIAS).get(id=user_id)
         except Exception:
             return None
+        user_cache.set(user_id, user)
+    # Копия, чтобы изменения в одном запросе не попадали в кэш
+    return copy.copy(user)
 
 
 def add_user_activities(user, action):
-    UserActivities.objects.create(
-        user_id=user.id,
-        email=user.email,
-        fullname=user.fullname,
-        action=action,
-    )
+    add_user_activities_batch(user, [action])
+
+
+def add_user_activities_batch(user, actions):
+    """ Передача действий пользователя в приемник активности (см. my_user.audit) """
+
+    get_activity_sink().emit([
+        UserActivities(
+            user_id=user.id,
+            email=user.email,
+            fullname=user.fullname,
+            action=action,
+        ) for action in actions
+    ])
@@ -1,6 +1,7 @@
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from django.contrib.auth import authenticate
 from datetime import datetime
 
@@ -8,9 +9,17 @@ from .serializers import (
     CreateUserSerializer, LoginSerializer, UpdatePasswordSerializer, CustomUserSerializer,
     UserActivitiesSerializer
 )
-from .models import CustomUser, UserActivities
+from .models import ActivityArchive, CustomUser, UserActivities
 from .utils import get_access_token, add_user_activities
-from .permissions import IsAuthenticatedCustom
+from .permissions import IsAuthenticatedCustom, IsAdminCustom
+from .cache import auth_cache_stats
+from .filters import UserActivitiesFilter
+from .archive import ArchivedRows
+from .partitions import month_bounds, parse_month
+from inventory.exports import ExportView
+from inventory.fast import FastListMixin
+from inventory.filters import FilteredListMixin
+from inventory.utils import CustomPagination, KeysetPagination, SparseFieldsMixin
 
 
 class CreateUserView(ModelViewSet):
@@ -116,13 +125,70 @@ class CustomUserView(ModelViewSet):
         return Response(data)
 
 
-class UserActivitiesView(ModelViewSet):
-    """ Представление для отображения активности (действий) пользователей """
+def month_param(query_params):
+    """ Параметр month=YYYY-MM: первое число месяца или None """
+
+    value = query_params.get('month')
+    if value is None:
+        return None
+    try:
+        return parse_month(value)
+    except ValueError:
+        raise ValidationError({'month': [f'Invalid value "{value}", expected YYYY-MM']})
+
+
+def filter_month(queryset, month):
+    if month is None:
+        return queryset
+    # На PostgreSQL условие по created_at оставляет в плане только партицию месяца
+    start, end = month_bounds(month)
+    return queryset.filter(created_at__gte=start, created_at__lt=end)
+
+
+class UserActivitiesView(FilteredListMixin, SparseFieldsMixin, FastListMixin, ModelViewSet):
+    """
+    Представление для отображения активности (действий) пользователей.
+    С параметром month=YYYY-MM - активность за месяц, в том числе перенесенная в архив
+    (см. rotate_user_activities): архивный месяц читается из файла с теми же фильтрами.
+    """
 
     http_method_names = ['get']
     serializer_class = UserActivitiesSerializer
     queryset = UserActivities.objects.all()
     permission_classes = [IsAuthenticatedCustom]
+    pagination_class = CustomPagination
+    filterset_class = UserActivitiesFilter
+    read_replica = True
+
+    def get_queryset(self):
+        return filter_month(self.filter_list_queryset(self.queryset), month_param(self.request.query_params))
+
+    def list(self, request, *args, **kwargs):
+        month = month_param(request.query_params)
+        archive = ActivityArchive.objects.filter(month=month).first() if month is not None else None
+        if archive is None:
+            return super().list(request, *args, **kwargs)
+
+        if KeysetPagination.cursor_query_param in request.query_params:
+            raise ValidationError({'cursor': ['Cursor pagination is not available for archived months']})
+        rows = ArchivedRows(archive, self.filterset_class(request.query_params), live=self.get_queryset())
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(list(rows), many=True).data)
+
+
+class UserActivitiesExportView(ExportView):
+    """ Представление для выгрузки активности пользователей в CSV/NDJSON (только из БД, без архива) """
+
+    queryset = UserActivities.objects.all()
+    filterset_class = UserActivitiesFilter
+    export_name = 'users-activities'
+    export_fields = ('id', 'user_id', 'email', 'fullname', 'action', 'created_at')
+
+    @classmethod
+    def export_queryset(cls, query_params):
+        return filter_month(super().export_queryset(query_params), month_param(query_params))
 
 
 class UsersListView(ModelViewSet):
@@ -137,3 +203,14 @@ class UsersListView(ModelViewSet):
         users = self.queryset.filter(is_superuser=False)
         data = self.serializer_class(users, many=True).data
         return Response(data)
+
+
+class AuthCacheStatsView(ModelViewSet):
+    """ Представление для получения статистики кэша авторизации текущего процесса """
+
+    http_method_names = ['get']
+    queryset = CustomUser.objects.none()
+    permission_classes = [IsAdminCustom]
+
+    def list(self, request, *args, **kwargs):
+        return Response(auth_cache_stats())